@@ -0,0 +1,99 @@
+# app/admission.py
+import math
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Any
+
+from fastapi import HTTPException, Request
+
+from .config import settings
+from .job_queue import job_queue, QueueLimitReached
+
+
+def client_id_for(request: Request) -> str:
+    """Identity used for per-client limits and fair-share scheduling."""
+    if settings.ADMISSION_TRUST_FORWARDED_FOR:
+        forwarded_for = request.headers.get("x-forwarded-for")
+        if forwarded_for:
+            return forwarded_for.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _too_busy(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+async def _reject_presentation_job(per_client: bool):
+    # Suggest retrying after roughly the time a queued job currently waits
+    wait_stats = await job_queue.wait_stats()
+    retry_after = wait_stats["recent_avg_wait_seconds"] or settings.ADMISSION_DEFAULT_RETRY_AFTER_SECONDS
+    if per_client:
+        raise _too_busy("You already have the maximum number of presentations in progress. Please retry shortly.", retry_after)
+    raise _too_busy("The server is busy generating other presentations. Please retry shortly.", retry_after)
+
+
+async def admit_presentation_job(client_id: str):
+    """
+    Rejects a new presentation job with 429 + Retry-After when the queue (all
+    workers) or this client is at its limit of queued + running jobs. A cheap
+    early check before doing work for the request; the limits are enforced
+    atomically by enqueue_presentation_job().
+    """
+    counts = await job_queue.active_counts(client_id)
+    if counts["client_active"] >= settings.ADMISSION_MAX_ACTIVE_JOBS_PER_CLIENT:
+        await _reject_presentation_job(per_client=True)
+    if counts["active"] >= settings.ADMISSION_MAX_ACTIVE_JOBS:
+        await _reject_presentation_job(per_client=False)
+
+
+async def enqueue_presentation_job(
+    client_id: str, job_id: str, payload: Dict[str, Any], progress: Dict[str, Any], affinity: Optional[str] = None
+):
+    """Enqueues a "presentation" job if the admission limits allow it (checked and inserted in one transaction), else 429."""
+    try:
+        await job_queue.enqueue(
+            job_id, "presentation", payload, progress=progress, client_id=client_id, affinity=affinity,
+            max_total=settings.ADMISSION_MAX_ACTIVE_JOBS, max_per_client=settings.ADMISSION_MAX_ACTIVE_JOBS_PER_CLIENT
+        )
+    except QueueLimitReached as e:
+        await _reject_presentation_job(e.per_client)
+
+
+class InFlightLimiter:
+    """Per-process cap on concurrent requests, overall and per client."""
+    def __init__(self, max_in_flight: int, max_in_flight_per_client: int):
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_per_client = max_in_flight_per_client
+        self.in_flight = 0
+        self.rejected = 0
+        self._per_client: Dict[str, int] = {}
+
+    def check(self, client_id: str):
+        """Raises 429 if `client_id` would not be admitted right now."""
+        if self.in_flight >= self.max_in_flight or self._per_client.get(client_id, 0) >= self.max_in_flight_per_client:
+            self.rejected += 1
+            raise _too_busy("Too many heading requests in progress. Please retry shortly.", settings.ADMISSION_DEFAULT_RETRY_AFTER_SECONDS)
+
+    @asynccontextmanager
+    async def admit(self, client_id: str):
+        self.check(client_id)
+        self.in_flight += 1
+        self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._per_client[client_id] -= 1
+            if not self._per_client[client_id]:
+                del self._per_client[client_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": self.in_flight, "clients": len(self._per_client), "rejected": self.rejected}
+
+
+heading_limiter = InFlightLimiter(
+    settings.ADMISSION_MAX_HEADING_REQUESTS, settings.ADMISSION_MAX_HEADING_REQUESTS_PER_CLIENT
+)
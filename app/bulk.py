@@ -0,0 +1,238 @@
+# app/bulk.py
+"""
+Bulk deck generation: many decks from a list of specs, run through the shared
+job queue so every app process (and any CLI process) works on them.
+
+Each deck is two queued jobs: a "bulk_deck" job generates the headings and then
+enqueues a regular "presentation" job with them, so a retried deck never
+regenerates headings that its slide checkpoints depend on.
+
+Headless usage:
+    python -m app.bulk decks.jsonl [--results results.jsonl] [--workers 8]
+Re-running the same file resumes the same batch.
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import re
+import shutil
+import sys
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from pydantic import ValidationError
+
+from .config import settings
+from . import schemas, services, job_queue, llm_integrations, pptx_utils
+
+BULK_DECK_KIND = "bulk_deck"
+_BATCH_ID_PATTERN = re.compile(r"^[\w-]{1,64}$")
+
+
+def is_valid_batch_id(batch_id: str) -> bool:
+    return bool(_BATCH_ID_PATTERN.match(batch_id))
+
+
+def _safe_filename_part(text: str) -> str:
+    return re.sub(r"[^\w-]+", "_", text).strip("_")[:60] or "presentation"
+
+
+def load_deck_specs(path: Path) -> List[schemas.BulkDeckSpec]:
+    """
+    Reads deck specs from a .jsonl file (one BulkDeckSpec object per line) or a
+    .csv file with a header row of BulkDeckSpec fields; in CSV, `headings` are
+    separated by "|". Empty CSV cells use the field's default.
+    """
+    specs = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.suffix.lower() == ".csv":
+            rows = [{key: value for key, value in row.items() if value not in (None, "")} for row in csv.DictReader(f)]
+            for row in rows:
+                if "headings" in row:
+                    row["headings"] = [heading.strip() for heading in row["headings"].split("|") if heading.strip()]
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    for line_number, row in enumerate(rows, start=1):
+        try:
+            specs.append(schemas.BulkDeckSpec(**row))
+        except ValidationError as e:
+            raise ValueError(f"Invalid deck spec #{line_number} in {path}: {e}") from e
+    return specs
+
+
+def default_batch_id(specs: List[schemas.BulkDeckSpec]) -> str:
+    """Same specs -> same batch, so resubmitting resumes instead of duplicating."""
+    canonical = json.dumps([spec.model_dump() for spec in specs], sort_keys=True)
+    return f"bulk_{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]}"
+
+
+async def submit_batch(specs: List[schemas.BulkDeckSpec], batch_id: Optional[str] = None) -> Dict[str, Any]:
+    """Enqueues one bulk_deck job per spec; decks already in the queue are left alone."""
+    batch_id = batch_id or default_batch_id(specs)
+    submitted = 0
+    for index, spec in enumerate(specs):
+        if await job_queue.job_queue.enqueue(
+            f"{batch_id}_{index:05d}",
+            BULK_DECK_KIND,
+            {"batch_id": batch_id, "index": index, "spec": spec.model_dump()},
+            progress={"message": "Queued for heading generation..."},
+            client_id=f"bulk:{batch_id}", # One fair-share client per batch
+            batch_id=batch_id,
+            priority=settings.BULK_JOB_PRIORITY,
+            if_absent=True
+        ):
+            submitted += 1
+    return {"batch_id": batch_id, "decks": len(specs), "submitted": submitted}
+
+
+async def run_bulk_deck_job(job_id: str, payload: Dict[str, Any], job_store: Dict):
+    """job_queue handler for "bulk_deck" jobs: headings, then the presentation job."""
+    spec = schemas.BulkDeckSpec(**payload["spec"])
+    job_store[job_id] = {"status": "processing", "message": "Generating headings..."}
+    if spec.headings:
+        headings = spec.headings
+    else:
+        headings = [h.heading for h in await services.generate_slide_headings(spec.main_topic, spec.num_slides, spec.use_cache)]
+
+    details = schemas.FinalPresentationRequest(
+        session_id=job_id,
+        final_headings=headings,
+        template_choice=spec.server_template_name or "",
+        server_template_name=spec.server_template_name,
+        theme_color=spec.theme_color,
+        max_tokens_per_slide=spec.max_tokens_per_slide,
+        style_tone=spec.style_tone,
+        content_format=spec.content_format,
+        use_cache=spec.use_cache,
+        deck_batch_mode=spec.deck_batch_mode,
+        main_topic=spec.main_topic
+    )
+    presentation_job_id = f"{job_id}_pptx"
+    output_path = settings.GENERATED_PPTS_DIR / f"{_safe_filename_part(spec.main_topic)}_{presentation_job_id}.pptx"
+    # if_absent: a retry after a crash between enqueue and completion must not duplicate the deck
+    await job_queue.job_queue.enqueue(
+        presentation_job_id,
+        "presentation",
+        {"details": details.model_dump(), "output_path": str(output_path)},
+        progress={"message": "Queued for generation..."},
+        client_id=f"bulk:{payload['batch_id']}",
+        batch_id=payload["batch_id"],
+        priority=settings.BULK_JOB_PRIORITY,
+        if_absent=True
+    )
+    job_store[job_id] = {
+        "status": "completed",
+        "message": "Headings generated, deck queued.",
+        "presentation_job_id": presentation_job_id,
+        "headings": headings,
+    }
+
+
+async def batch_status(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Per-deck results and overall counts, or None for an unknown batch."""
+    jobs = await job_queue.job_queue.batch_jobs(batch_id)
+    if not jobs:
+        return None
+    by_id = {job["job_id"]: job for job in jobs}
+    decks = []
+    for deck_job in (job for job in jobs if job["kind"] == BULK_DECK_KIND):
+        deck = {
+            "index": deck_job["payload"]["index"],
+            "main_topic": deck_job["payload"]["spec"]["main_topic"],
+            "job_id": deck_job["job_id"],
+            "stage": "headings",
+            "status": deck_job["status"],
+        }
+        if deck_job["status"] == job_queue.FAILED:
+            deck["error"] = deck_job["error"]
+        elif deck_job["status"] == job_queue.COMPLETED:
+            presentation_job = by_id.get(deck_job["result"]["presentation_job_id"])
+            deck.update({"stage": "presentation", "presentation_job_id": deck_job["result"]["presentation_job_id"]})
+            # Counted as queued until the presentation job row is visible
+            deck["status"] = presentation_job["status"] if presentation_job else job_queue.QUEUED
+            if presentation_job and presentation_job["status"] == job_queue.COMPLETED:
+                deck["filename"] = presentation_job["result"].get("filename")
+                deck["download_url"] = presentation_job["result"].get("download_url")
+            elif presentation_job and presentation_job["status"] == job_queue.FAILED:
+                deck["error"] = presentation_job["error"]
+        decks.append(deck)
+    counts: Dict[str, int] = {}
+    for deck in decks:
+        counts[deck["status"]] = counts.get(deck["status"], 0) + 1
+    finished = counts.get(job_queue.COMPLETED, 0) + counts.get(job_queue.FAILED, 0)
+    return {"batch_id": batch_id, "total": len(decks), "counts": counts, "done": finished == len(decks), "decks": decks}
+
+
+# --- Headless CLI ---
+async def _run_cli(args: argparse.Namespace) -> int:
+    try:
+        specs = load_deck_specs(Path(args.specs))
+    except (OSError, ValueError) as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    if len(specs) > settings.BULK_MAX_DECKS_PER_BATCH:
+        print(f"{len(specs)} decks exceeds BULK_MAX_DECKS_PER_BATCH ({settings.BULK_MAX_DECKS_PER_BATCH}).", file=sys.stderr)
+        return 2
+    if args.batch_id and not is_valid_batch_id(args.batch_id):
+        print("--batch-id may only contain letters, digits, '_' and '-' (max 64).", file=sys.stderr)
+        return 2
+    submission = await submit_batch(specs, args.batch_id)
+    batch_id = submission["batch_id"]
+    print(f"Batch {batch_id}: {submission['decks']} decks, {submission['submitted']} newly queued.")
+    if args.no_wait:
+        return 0
+
+    # Work on the queue alongside any running app processes until the batch is done
+    await llm_integrations.startup_llm_clients()
+    workers = job_queue.JobWorkerPool(
+        job_queue.job_queue,
+        handlers={"presentation": services.run_presentation_job, BULK_DECK_KIND: run_bulk_deck_job},
+        concurrency=args.workers
+    )
+    workers.start()
+    try:
+        while True:
+            status = await batch_status(batch_id)
+            print(f"Batch {batch_id}: " + ", ".join(f"{count} {state}" for state, count in sorted(status["counts"].items())))
+            if status["done"]:
+                break
+            await asyncio.sleep(args.poll_interval)
+    finally:
+        await workers.stop()
+        await llm_integrations.shutdown_llm_clients()
+        pptx_utils.shutdown_pptx_executor()
+
+    output_dir = Path(args.output_dir) if args.output_dir else None
+    if output_dir:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    for deck in status["decks"]:
+        if output_dir and deck.get("filename"):
+            source = settings.GENERATED_PPTS_DIR / deck["filename"]
+            if source.exists():
+                shutil.copy2(source, output_dir / deck["filename"])
+                deck["output_path"] = str(output_dir / deck["filename"])
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            for deck in status["decks"]:
+                f.write(json.dumps(deck) + "\n")
+    failed = status["counts"].get(job_queue.FAILED, 0)
+    print(f"Batch {batch_id} finished: {status['total'] - failed} completed, {failed} failed.")
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate many presentations from a JSONL/CSV file of deck specs.")
+    parser.add_argument("specs", help="Path to a .jsonl or .csv file of deck specs")
+    parser.add_argument("--batch-id", help="Defaults to a hash of the specs, so re-running resumes")
+    parser.add_argument("--workers", type=int, default=settings.BULK_CLI_WORKER_CONCURRENCY, help="Jobs run at once by this process")
+    parser.add_argument("--results", help="Write per-deck results to this JSONL file")
+    parser.add_argument("--output-dir", help="Copy finished decks here")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument("--no-wait", action="store_true", help="Only queue the batch; app workers process it")
+    return asyncio.run(_run_cli(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
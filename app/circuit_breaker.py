@@ -0,0 +1,90 @@
+# app/circuit_breaker.py
+import time
+from typing import Dict, Any, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because the provider's breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker. Opens after `failure_threshold` consecutive
+    failures, refuses calls for `recovery_timeout` seconds, then lets up to
+    `half_open_max_calls` trial calls through; one success closes it again,
+    one failure re-opens it.
+    """
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.half_open_in_flight = 0
+        self.times_opened = 0
+
+    def is_open(self) -> bool:
+        """True while calls would be refused (does not change state)."""
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at < self.recovery_timeout
+        if self.state == HALF_OPEN:
+            return self.half_open_in_flight >= self.half_open_max_calls
+        return False
+
+    def allow_request(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            self.state = HALF_OPEN
+            self.half_open_in_flight = 0
+            print(f"Circuit breaker for {self.name} is half-open, sending a trial request.")
+        if self.state == HALF_OPEN:
+            if self.half_open_in_flight >= self.half_open_max_calls:
+                return False
+            self.half_open_in_flight += 1
+        return True
+
+    def _release_trial(self):
+        if self.state == HALF_OPEN and self.half_open_in_flight > 0:
+            self.half_open_in_flight -= 1
+
+    def record_success(self):
+        self._release_trial()
+        if self.state != CLOSED:
+            print(f"Circuit breaker for {self.name} closed.")
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self._release_trial()
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+                print(f"Circuit breaker for {self.name} opened after {self.consecutive_failures} consecutive failures.")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self):
+        """The call ended without telling whether the provider is healthy (abandoned, or a bad request)."""
+        self._release_trial()
+
+    def snapshot(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == OPEN:
+            retry_in = max(0.0, round(self.recovery_timeout - (time.monotonic() - self.opened_at), 2))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "half_open_in_flight": self.half_open_in_flight,
+            "retry_in_seconds": retry_in,
+        }
@@ -1,6 +1,7 @@
 # app/config.py
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from typing import Dict, Optional
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -20,14 +21,148 @@ class Settings(BaseSettings):
     DEFAULT_TOKENS_PER_SLIDE: int = 250
     MAX_TOKENS_PER_SLIDE: int = 500 # Max tokens for content on a single slide
     MAX_TOTAL_TOKENS_GEMINI: int = 8000 # Max total tokens for a request to Gemini
+    DECK_TOKEN_BUDGET: Optional[int] = None # Output tokens shared by all slides of one deck; default: slides x max_tokens_per_slide
+    MIN_TOKENS_PER_SLIDE: int = 50
+    MAX_HEADING_TOKENS: int = 40 # Longer headings are trimmed in prompts
+    TOKEN_COUNT_CACHE_SIZE: int = 4096 # Memoized token counts
+    TOKENIZER_WARMUP_TIMEOUT_SECONDS: float = 20.0 # tiktoken encoding download at startup; heuristic counts after that
 
     GENERATED_PPT_TTL_SECONDS: int = 60
+
+    # LLM HTTP connection pooling (one shared client per provider)
+    LLM_MOCK_RESPONSES: bool = True # Keep returning mock data instead of calling the real APIs
+    LLM_HTTP2: bool = True # Only used if the optional 'h2' package is installed
+    LLM_HTTP_MAX_CONNECTIONS: int = 100
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 30.0 # seconds
+    LLM_HTTP_CONNECT_TIMEOUT: float = 5.0
+    LLM_HTTP_READ_TIMEOUT: float = 30.0
+    LLM_HTTP_WRITE_TIMEOUT: float = 10.0
+    LLM_HTTP_POOL_TIMEOUT: float = 10.0 # Max wait for a free connection from the pool
+
+    LLM_STREAMING_ENABLED: bool = True # Use SSE token streaming where the provider supports it
+
+    # Per-provider rate limiting (AIMD on 429s); LLM_RATE_LIMITS overrides per provider,
+    # e.g. {"gpt": {"requests_per_minute": 500, "tokens_per_minute": 200000, "max_concurrency": 16}}
+    LLM_DEFAULT_REQUESTS_PER_MINUTE: int = 60
+    LLM_DEFAULT_TOKENS_PER_MINUTE: int = 60000
+    LLM_DEFAULT_MAX_CONCURRENCY: int = 8
+    LLM_RATE_LIMITS: Dict[str, Dict[str, float]] = {}
+    LLM_RATE_LIMIT_MIN_FRACTION: float = 0.1 # Never shrink below 10% of the configured limits
+    LLM_RATE_LIMIT_RECOVERY_STEP: float = 0.05 # Additive increase per successful request
+    LLM_RATE_LIMIT_MAX_RETRIES: int = 5 # 429 retries, separate from retry_attempts
+
+    # Circuit breakers (one per provider) for failover in generate_with_llm
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5 # Consecutive failures before opening
+    LLM_BREAKER_RECOVERY_SECONDS: float = 30.0 # Open time before a half-open trial call
+    LLM_BREAKER_HALF_OPEN_MAX_CALLS: int = 1
+
+    # Latency/error-aware provider selection and hedged requests
+    LLM_METRICS_WINDOW_SIZE: int = 200 # Recent latencies kept per provider and task type
+    LLM_METRICS_EWMA_ALPHA: float = 0.2
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_MIN_SAMPLES: int = 20 # Don't hedge until p95 is based on this many calls
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 0.5
+
+    # Speculative content generation for proposed headings while the user edits them
+    SPECULATIVE_GENERATION_ENABLED: bool = False
+    SPECULATIVE_MAX_SESSIONS: int = 20 # Sessions speculated on at once per process; further ones are skipped
+    SPECULATIVE_MAX_CONCURRENT_SLIDES: int = 4 # Speculative LLM calls in flight per process
+    SPECULATIVE_TTL_SECONDS: float = 600.0 # Unclaimed speculation is cancelled after this long
+    SPECULATIVE_GRACE_SECONDS: float = 2.0 # Wait for in-progress unchanged slides on /create-presentation
+
+    # Per-slide manifests of generated decks, for incremental regeneration
+    DECK_MANIFEST_TTL_SECONDS: int = 7 * 24 * 3600
+
+    DECK_BATCH_MODE: bool = False # Default deck-batch (one JSON call per deck) generation for all jobs
+
+    # Parallel slide content generation
+    SLIDE_CONCURRENCY_PER_JOB: int = 4 # Max slides of one deck fetched at the same time
+    SLIDE_CONCURRENCY_GLOBAL: int = 32 # Max slide LLM calls in flight across all jobs
+
+    # Durable job queue (SQLite) and per-process worker pool
+    JOB_WORKER_CONCURRENCY: int = 2 # Jobs run at once by each app process
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_VISIBILITY_TIMEOUT_SECONDS: float = 120.0 # Lease length; expired leases are picked up by other workers
+    JOB_HEARTBEAT_INTERVAL_SECONDS: float = 10.0 # Lease renewal + progress flush interval
+    JOB_POLL_INTERVAL_SECONDS: float = 0.5
+    JOB_RETRY_BACKOFF_SECONDS: float = 2.0
+    JOB_AFFINITY_WAIT_SECONDS: float = 30.0 # A job pinned to its enqueuing process (in-memory decks) is open to any worker after this
+
+    # Bulk deck generation (/bulk/decks and python -m app.bulk)
+    BULK_MAX_DECKS_PER_BATCH: int = 1000
+    BULK_JOB_PRIORITY: int = -1 # Below interactive jobs (0) when workers pick the next job
+    BULK_CLI_WORKER_CONCURRENCY: int = 8 # Jobs run at once by the headless CLI
+
+    # Admission control (429 + Retry-After when full)
+    ADMISSION_MAX_ACTIVE_JOBS: int = 50 # Queued + running presentation jobs across all workers
+    ADMISSION_MAX_ACTIVE_JOBS_PER_CLIENT: int = 3
+    ADMISSION_MAX_HEADING_REQUESTS: int = 20 # Concurrent /generate-headings calls per process
+    ADMISSION_MAX_HEADING_REQUESTS_PER_CLIENT: int = 2
+    ADMISSION_DEFAULT_RETRY_AFTER_SECONDS: int = 10
+    ADMISSION_TRUST_FORWARDED_FOR: bool = False # Only enable behind a proxy that sets X-Forwarded-For
+
+    # Deck writer: "python-pptx", "streaming" (low memory, text-only slides) or
+    # "auto" (streaming from PPTX_STREAMING_MIN_SLIDES slides up)
+    PPTX_WRITER: str = "auto"
+    PPTX_STREAMING_MIN_SLIDES: int = 30
+
+    # Parsed-template cache (template file bytes by content hash, per process)
+    TEMPLATE_CACHE_MAX_ENTRIES: int = 16
+    TEMPLATE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # Deck output: "disk" (GENERATED_PPTS_DIR) or "memory" (spooled buffer kept in
+    # a per-process store until downloaded). In-memory jobs are pinned to the app
+    # process that accepted /create-presentation, so /download must reach that
+    # process: a single app process, or sticky routing per client. A job another
+    # process takes over (JOB_AFFINITY_WAIT_SECONDS passed, lease expired, or the
+    # bulk CLI) writes its deck to disk, as does the process PPTX_EXECUTOR.
+    DECK_OUTPUT_MODE: str = "disk"
+    DECK_OUTPUT_SPOOL_MAX_BYTES: int = 16 * 1024 * 1024 # Larger decks spill to a local temp file
+    DECK_OUTPUT_STORE_MAX_BYTES: int = 512 * 1024 * 1024
+    DECK_OUTPUT_MAX_AGE_SECONDS: int = 3600 # Decks are dropped this long after their job completed (disk and memory)
+
+    # Uploaded templates: content-addressed, one copy per distinct file
+    UPLOAD_MAX_BYTES: int = 50 * 1024 * 1024
+    UPLOAD_MAX_ZIP_ENTRIES: int = 5000
+    UPLOAD_MAX_UNCOMPRESSED_BYTES: int = 500 * 1024 * 1024 # Zip bomb guard
+    UPLOAD_STORE_MAX_AGE_SECONDS: int = 24 * 3600 # Reclaims templates whose references leaked
+
+    # Whole-deck cache: identical presentation requests reuse the first one's deck
+    DECK_CACHE_ENABLED: bool = True
+    DECK_CACHE_TTL_SECONDS: int = 24 * 3600
+    DECK_CACHE_MAX_FILES: int = 500
+
+    # Server template catalog (polled; the directory may be on slow network storage)
+    TEMPLATE_CATALOG_REFRESH_SECONDS: float = 5.0 # Stat the directory at most this often
+    TEMPLATE_CATALOG_FULL_SCAN_SECONDS: float = 300.0 # List it even if its mtime didn't change
+
+    # Theme-color variants of templates (theme.xml color scheme rewritten), shared on disk
+    THEME_VARIANTS_MAX_FILES: int = 200
+    THEME_VARIANTS_MIN_IDLE_SECONDS: int = 3600 # Variants used more recently are never evicted (jobs may still open them)
+
+    # Blocking python-pptx build/save work runs in this pool, off the event loop
+    PPTX_EXECUTOR: str = "thread" # "thread" or "process" (process: no per-slide progress)
+    PPTX_EXECUTOR_WORKERS: int = 2
+
+    # LLM response cache (memory LRU in front of a SQLite store)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    LLM_CACHE_MEMORY_MAX_ENTRIES: int = 1024
+    LLM_CACHE_DISK_MAX_ENTRIES: int = 50000
     
     # Directories
     TEMPLATES_DIR: Path = BASE_DIR / "app" / "templates"
     STATIC_DIR: Path = BASE_DIR / "app" / "static"
     SERVER_TEMPLATES_DIR: Path = BASE_DIR / "app" / "server_templates"
     GENERATED_PPTS_DIR: Path = BASE_DIR / "app" / "generated_ppts"
+    LLM_CACHE_DIR: Path = BASE_DIR / "app" / "cache"
+    THEME_VARIANTS_DIR: Path = BASE_DIR / "app" / "cache" / "theme_variants"
+    DECK_CACHE_DIR: Path = BASE_DIR / "app" / "cache" / "decks" # Same file system as GENERATED_PPTS_DIR, for hard links
+    JOB_QUEUE_DB_PATH: Path = BASE_DIR / "app" / "data" / "jobs.sqlite3"
+    DECK_MANIFEST_DB_PATH: Path = BASE_DIR / "app" / "data" / "manifests.sqlite3"
+    UPLOAD_STORE_DIR: Path = BASE_DIR / "app" / "data" / "uploads"
+    UPLOAD_STORE_DB_PATH: Path = BASE_DIR / "app" / "data" / "uploads.sqlite3"
 
 
     class Config:
@@ -38,4 +173,6 @@ settings = Settings()
 
 # Ensure necessary directories exist
 settings.SERVER_TEMPLATES_DIR.mkdir(parents=True, exist_ok=True)
-settings.GENERATED_PPTS_DIR.mkdir(parents=True, exist_ok=True)
\ No newline at end of file
+settings.GENERATED_PPTS_DIR.mkdir(parents=True, exist_ok=True)
+settings.LLM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+settings.JOB_QUEUE_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,141 @@
+# app/deck_cache.py
+"""
+Whole-deck result cache. Identical presentation requests (same headings,
+topic, template content, theme color, tone, format, token limit and
+placeholder mapping) reuse the deck built for the first one.
+
+Cached decks live under DECK_CACHE_DIR as <key>.pptx with a <key>.json
+sidecar naming the job that built them. A hit hard-links the cached deck to
+the new job's output filename, so each job owns a name of its own:
+cleanup_file removing one job's file when it expires leaves the others
+(and the cache entry) intact, and the file system's link count is the
+reference count. Where hard links aren't supported the deck is copied.
+Shared by every process using the same directory.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from .config import settings
+from .template_cache import template_cache
+from . import schemas
+
+CACHE_KEY_VERSION = 2 # v1 also cached decks built from mock contents
+DECK_CACHE_STATS = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+
+def deck_cache_key(details: schemas.FinalPresentationRequest, main_topic: str, template_path: Optional[Path]) -> str:
+    """
+    Canonical hash of everything that shapes the deck. Blocking (hashes the
+    template, cached by mtime). Session ids, cache flags and pregenerated
+    contents don't change the requested deck and are left out.
+    """
+    request = {
+        "version": CACHE_KEY_VERSION,
+        "final_headings": details.final_headings,
+        "main_topic": main_topic,
+        "template": template_cache.content_hash(template_path) if template_path else None,
+        "theme_color": details.theme_color.lstrip("#").upper() if details.theme_color else None,
+        "style_tone": details.style_tone,
+        "content_format": details.content_format,
+        "max_tokens_per_slide": details.max_tokens_per_slide,
+        "placeholder_map": {str(i): mapping for i, mapping in (details.placeholder_map or {}).items()},
+    }
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _deck_path(key: str) -> Path:
+    return settings.DECK_CACHE_DIR / f"{key}.pptx"
+
+
+def _meta_path(key: str) -> Path:
+    return settings.DECK_CACHE_DIR / f"{key}.json"
+
+
+def _link_or_copy(source: Path, target: Path):
+    tmp_path = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        os.link(source, tmp_path)
+    except OSError: # No hard links here (or across devices)
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target) # Atomic: readers never see a partial deck
+
+
+def _lookup(key: str, output_path: Path) -> Optional[Dict[str, Any]]:
+    deck_path = _deck_path(key)
+    try:
+        if time.time() - deck_path.stat().st_mtime > settings.DECK_CACHE_TTL_SECONDS:
+            return None
+        with open(_meta_path(key), encoding="utf-8") as f:
+            meta = json.load(f)
+        _link_or_copy(deck_path, output_path)
+    except (OSError, ValueError): # Missing, expired or evicted concurrently
+        return None
+    return meta
+
+
+def _write_meta(key: str, meta: Dict[str, Any]):
+    tmp_path = _meta_path(key).with_name(f"{key}.json.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, _meta_path(key))
+
+
+def _evict_old_decks():
+    now = time.time()
+    decks = sorted(settings.DECK_CACHE_DIR.glob("*.pptx"), key=lambda path: path.stat().st_mtime)
+    expired = [path for path in decks if now - path.stat().st_mtime > settings.DECK_CACHE_TTL_SECONDS]
+    surplus = decks[len(expired):][:max(0, len(decks) - len(expired) - settings.DECK_CACHE_MAX_FILES)]
+    for path in expired + surplus:
+        try:
+            path.unlink() # Jobs' own links to the deck are unaffected
+            path.with_suffix(".json").unlink(missing_ok=True)
+            DECK_CACHE_STATS["evicted"] += 1
+        except OSError:
+            pass
+
+
+def _store(key: str, source, meta: Dict[str, Any]):
+    """`source` is the built deck: a path, or a seekable binary file (e.g. the in-memory output buffer)."""
+    settings.DECK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    deck_path = _deck_path(key)
+    if isinstance(source, Path):
+        _link_or_copy(source, deck_path)
+    else:
+        tmp_path = deck_path.with_name(f"{deck_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        source.seek(0)
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(source, f)
+        os.replace(tmp_path, deck_path)
+    _write_meta(key, meta)
+    _evict_old_decks()
+
+
+# --- Async API ---
+async def lookup(key: str, output_path: Path) -> Optional[Dict[str, Any]]:
+    """
+    On a hit, places the cached deck at `output_path` and returns its metadata
+    ({"job_id", "slides_total"}); None on a miss.
+    """
+    meta = await asyncio.to_thread(_lookup, key, output_path)
+    DECK_CACHE_STATS["hits" if meta else "misses"] += 1
+    return meta
+
+
+async def store(key: str, source, job_id: str, slides_total: int):
+    try:
+        await asyncio.to_thread(_store, key, source, {"job_id": job_id, "slides_total": slides_total})
+        DECK_CACHE_STATS["stored"] += 1
+    except OSError as e: # The job's own deck is unaffected
+        print(f"Failed to cache deck of job {job_id}: {e}")
+
+
+def deck_cache_stats() -> Dict[str, Any]:
+    return {**DECK_CACHE_STATS, "enabled": settings.DECK_CACHE_ENABLED}
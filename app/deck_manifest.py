@@ -0,0 +1,139 @@
+# app/deck_manifest.py
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+from .config import settings
+from . import prompt_optimizer, token_counter
+
+
+def slide_prompt_hash(heading: str, main_topic: str, style_tone: str, content_format: str, max_tokens_per_slide: int) -> str:
+    """
+    Hash of the content prompt a slide is generated from. Uses the user's
+    per-slide limit rather than the deck-budget share, so editing one heading
+    doesn't invalidate every other slide.
+    """
+    prompt_heading = token_counter.truncate_to_tokens(heading, settings.MAX_HEADING_TOKENS)
+    prompt = prompt_optimizer.optimize_slide_content_prompt(
+        prompt_heading, main_topic, style_tone, content_format, max_tokens_per_slide
+    )
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class DeckManifestStore:
+    """
+    Per-deck manifest of generated slides (heading, prompt hash, provider,
+    content) on SQLite, so later requests can reuse slides whose inputs did not
+    change. While a job runs, each finished slide is checkpointed so a retry
+    (e.g. after a restart) resumes instead of starting over; the checkpoints
+    are dropped once the manifest is saved. Anything older than `ttl_seconds`
+    is pruned on write.
+    """
+    def __init__(self, db_path: Path, ttl_seconds: float):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local() # One connection per thread
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS deck_manifests ("
+                "job_id TEXT PRIMARY KEY, deck TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS manifest_slides ("
+                "job_id TEXT NOT NULL, slide_index INTEGER NOT NULL, heading TEXT NOT NULL, prompt_hash TEXT NOT NULL, "
+                "provider TEXT, content TEXT NOT NULL, PRIMARY KEY (job_id, slide_index))"
+            )
+            # Slides of jobs still running, written as each finishes so a retried job can resume
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS slide_checkpoints ("
+                "job_id TEXT NOT NULL, slide_index INTEGER NOT NULL, prompt_hash TEXT NOT NULL, provider TEXT, "
+                "content TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (job_id, slide_index))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_deck_manifests_created ON deck_manifests (created_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_slide_checkpoints_created ON slide_checkpoints (created_at)")
+            self._local.db = db
+        return db
+
+    # --- Blocking operations (call through the async wrappers) ---
+    def _save(self, job_id: str, deck: Dict[str, Any], slides: List[Dict[str, Any]]):
+        db = self._connection()
+        now = time.time()
+        with db:
+            expired = [row[0] for row in db.execute("SELECT job_id FROM deck_manifests WHERE created_at < ?", (now - self.ttl_seconds,))]
+            db.executemany("DELETE FROM manifest_slides WHERE job_id = ?", [(expired_id,) for expired_id in expired])
+            db.execute("DELETE FROM deck_manifests WHERE created_at < ?", (now - self.ttl_seconds,))
+            db.execute("DELETE FROM slide_checkpoints WHERE job_id = ? OR created_at < ?", (job_id, now - self.ttl_seconds))
+
+            db.execute("INSERT OR REPLACE INTO deck_manifests (job_id, deck, created_at) VALUES (?, ?, ?)", (job_id, json.dumps(deck), now))
+            db.execute("DELETE FROM manifest_slides WHERE job_id = ?", (job_id,))
+            db.executemany(
+                "INSERT INTO manifest_slides (job_id, slide_index, heading, prompt_hash, provider, content) VALUES (?, ?, ?, ?, ?, ?)",
+                [(job_id, i, slide["heading"], slide["prompt_hash"], slide.get("provider"), slide["content"]) for i, slide in enumerate(slides)]
+            )
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = self._connection()
+        row = db.execute("SELECT deck, created_at FROM deck_manifests WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None or time.time() - row["created_at"] > self.ttl_seconds:
+            return None
+        slides = db.execute(
+            "SELECT heading, prompt_hash, provider, content FROM manifest_slides WHERE job_id = ? ORDER BY slide_index", (job_id,)
+        ).fetchall()
+        return {"job_id": job_id, "deck": json.loads(row["deck"]), "slides": [dict(slide) for slide in slides]}
+
+    def _checkpoint_slide(self, job_id: str, index: int, prompt_hash: str, provider: Optional[str], content: str):
+        with self._connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO slide_checkpoints (job_id, slide_index, prompt_hash, provider, content, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, index, prompt_hash, provider, content, time.time())
+            )
+
+    def _load_checkpoints(self, job_id: str) -> Dict[int, Dict[str, Any]]:
+        rows = self._connection().execute(
+            "SELECT slide_index, prompt_hash, provider, content FROM slide_checkpoints WHERE job_id = ?", (job_id,)
+        ).fetchall()
+        return {row["slide_index"]: dict(row) for row in rows}
+
+    # --- Async API ---
+    async def save(self, job_id: str, deck: Dict[str, Any], slides: List[Dict[str, Any]]):
+        try:
+            await asyncio.to_thread(self._save, job_id, deck, slides)
+        except sqlite3.Error as e: # The deck itself is fine; it just can't be regenerated incrementally
+            print(f"Failed to save deck manifest for job {job_id}: {e}")
+
+    async def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._load, job_id)
+
+    async def checkpoint_slide(self, job_id: str, index: int, prompt_hash: str, provider: Optional[str], content: str):
+        try:
+            await asyncio.to_thread(self._checkpoint_slide, job_id, index, prompt_hash, provider, content)
+        except sqlite3.Error as e: # Only costs a regeneration if the job is retried
+            print(f"Failed to checkpoint slide {index} of job {job_id}: {e}")
+
+    async def load_checkpoints(self, job_id: str) -> Dict[int, Dict[str, Any]]:
+        return await asyncio.to_thread(self._load_checkpoints, job_id)
+
+
+def reusable_slides(manifest: Dict[str, Any], prompt_hashes: List[str]) -> Dict[int, Dict[str, Any]]:
+    """
+    Maps new slide indices to manifest slides generated from the same prompt
+    (matched by hash, so reordered slides are reused too).
+    """
+    by_hash = {slide["prompt_hash"]: slide for slide in manifest["slides"]}
+    return {i: by_hash[prompt_hash] for i, prompt_hash in enumerate(prompt_hashes) if prompt_hash in by_hash}
+
+
+deck_manifest_store = DeckManifestStore(settings.DECK_MANIFEST_DB_PATH, settings.DECK_MANIFEST_TTL_SECONDS)
@@ -0,0 +1,209 @@
+# app/deck_output.py
+"""
+In-memory deck output: decks are serialized into a spooled buffer (RAM up to
+DECK_OUTPUT_SPOOL_MAX_BYTES, a local temp file above that) and kept in a
+size-bounded store until downloaded, instead of a round trip through
+GENERATED_PPTS_DIR. Downloads from the store and from disk both support
+ETag/If-None-Match and single HTTP byte ranges so clients can resume.
+
+The store is per process: in-memory jobs are pinned to the app process that
+accepted them (job queue affinity), and /download must reach that process,
+so use DECK_OUTPUT_MODE="memory" with a single app process or sticky routing.
+A job run by any other process writes its deck to disk.
+"""
+import asyncio
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any, AsyncIterator, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from .config import settings
+
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+_CHUNK_SIZE = 256 * 1024
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def spooled_output_buffer() -> "tempfile.SpooledTemporaryFile":
+    """Write target for a deck: memory until DECK_OUTPUT_SPOOL_MAX_BYTES, then a temp file."""
+    return tempfile.SpooledTemporaryFile(max_size=settings.DECK_OUTPUT_SPOOL_MAX_BYTES, mode="w+b")
+
+
+class DeckBody:
+    """Deck bytes in a spooled buffer, readable concurrently by several downloads."""
+    def __init__(self, buffer, size: int, etag: str):
+        self.buffer = buffer
+        self.size = size
+        self.etag = etag
+        self.created_at = time.time()
+        self.expires_at: Optional[float] = None # Set on first download
+        self._lock = threading.Lock()
+
+    def read_at(self, offset: int, length: int) -> bytes:
+        with self._lock:
+            if self.buffer.closed: # Evicted mid-download
+                return b""
+            self.buffer.seek(offset)
+            return self.buffer.read(length)
+
+    def close(self):
+        with self._lock:
+            self.buffer.close()
+
+
+class DeckResultStore:
+    """
+    LRU of finished decks by filename, bounded by total bytes. A deck expires
+    `download_ttl` seconds after its first download (like the disk cleanup)
+    or `max_age` seconds after it was stored.
+    """
+    def __init__(self, max_total_bytes: int, download_ttl: float, max_age: float):
+        self.max_total_bytes = max_total_bytes
+        self.download_ttl = download_ttl
+        self.max_age = max_age
+        self._decks: "OrderedDict[str, DeckBody]" = OrderedDict()
+        self._bytes = 0
+        self.counters = {"stored": 0, "downloads": 0, "evictions": 0, "expired": 0, "rejected": 0}
+
+    def put(self, filename: str, buffer) -> bool:
+        """Takes ownership of `buffer`, unless it can never fit (False; caller keeps it)."""
+        size = buffer.seek(0, os.SEEK_END)
+        if size > self.max_total_bytes:
+            self.counters["rejected"] += 1
+            return False
+        self._discard(filename)
+        self._expire()
+        while self._decks and self._bytes + size > self.max_total_bytes:
+            _, evicted = self._decks.popitem(last=False)
+            self._bytes -= evicted.size
+            evicted.close()
+            self.counters["evictions"] += 1
+        self._decks[filename] = DeckBody(buffer, size, f'"{time.time_ns():x}-{size:x}"')
+        self._bytes += size
+        self.counters["stored"] += 1
+        return True
+
+    def get(self, filename: str) -> Optional[DeckBody]:
+        self._expire()
+        deck = self._decks.get(filename)
+        if deck is not None:
+            self._decks.move_to_end(filename)
+        return deck
+
+    def mark_downloaded(self, filename: str):
+        deck = self._decks.get(filename)
+        if deck is not None:
+            self.counters["downloads"] += 1
+            if deck.expires_at is None:
+                deck.expires_at = time.time() + self.download_ttl
+
+    def _discard(self, filename: str):
+        deck = self._decks.pop(filename, None)
+        if deck is not None:
+            self._bytes -= deck.size
+            deck.close()
+
+    def _expire(self):
+        now = time.time()
+        for filename, deck in list(self._decks.items()):
+            if (deck.expires_at is not None and now > deck.expires_at) or now - deck.created_at > self.max_age:
+                self._discard(filename)
+                self.counters["expired"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "decks": len(self._decks), "bytes": self._bytes, "max_total_bytes": self.max_total_bytes}
+
+
+deck_results = DeckResultStore(
+    settings.DECK_OUTPUT_STORE_MAX_BYTES, settings.GENERATED_PPT_TTL_SECONDS, settings.DECK_OUTPUT_MAX_AGE_SECONDS
+)
+
+
+# --- Download responses ---
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(start, end inclusive) for a single "bytes=" range, None if unsatisfiable. Raises ValueError if malformed."""
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        raise ValueError(range_header)
+    first, last = match.groups()
+    if first == "": # Suffix range: last N bytes
+        length = int(last)
+        return (max(0, size - length), size - 1) if length and size else None
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    return (start, end) if start <= end and start < size else None
+
+
+async def _iter_deck(deck: DeckBody, start: int, end: int) -> AsyncIterator[bytes]:
+    offset = start
+    while offset <= end:
+        chunk = await asyncio.to_thread(deck.read_at, offset, min(_CHUNK_SIZE, end - offset + 1))
+        if not chunk:
+            break
+        offset += len(chunk)
+        yield chunk
+
+
+async def _iter_file(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    handle = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(handle.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(handle.read, min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
+
+
+def file_etag(path: Path) -> Tuple[str, int]:
+    stat = path.stat()
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', stat.st_size
+
+
+def deck_response(request: Request, filename: str, deck: Optional[DeckBody] = None, path: Optional[Path] = None) -> Response:
+    """
+    Streams a deck from the result store (`deck`) or disk (`path`), honouring
+    If-None-Match (304), Range (206/416) and If-Range.
+    """
+    if deck is not None:
+        etag, size = deck.etag, deck.size
+    else:
+        etag, size = file_etag(path)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag): # Stale If-Range: send the whole deck
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            byte_range = (0, size - 1) # Unsupported (e.g. multipart) ranges: ignore the header
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        if (start, end) != (0, size - 1):
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1 if size else 0)
+
+    body = _iter_deck(deck, start, end) if deck is not None else _iter_file(path, start, end)
+    return StreamingResponse(body, status_code=status_code, headers=headers, media_type=PPTX_MEDIA_TYPE)
@@ -0,0 +1,410 @@
+# app/job_queue.py
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Dict, Any, Callable, Awaitable, List
+
+from .config import settings
+
+QUEUED = "queued"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+
+_BOOT_TOKEN = uuid.uuid4().hex[:6]
+
+
+def process_id() -> str:
+    """This process among everyone sharing the queue; the pid tells forked workers apart."""
+    return f"{socket.gethostname()}:{os.getpid()}:{_BOOT_TOKEN}"
+
+
+class QueueLimitReached(Exception):
+    """enqueue() refused a job: the queue (or, with `per_client`, the client) is at its limit."""
+    def __init__(self, per_client: bool):
+        super().__init__("client limit reached" if per_client else "queue limit reached")
+        self.per_client = per_client
+
+
+class PermanentJobError(Exception):
+    """
+    Raised by a handler for a failure a retry can't fix (bad input, unusable
+    template): the job fails right away instead of using up its attempts.
+    """
+
+
+class JobQueue:
+    """
+    Durable job queue on SQLite, shared by every uvicorn worker (and host, if the
+    file lives on shared storage with proper locking). Workers claim jobs with a
+    lease; a job whose lease expires (worker died) becomes visible again and is
+    retried until `max_attempts` is reached. A job enqueued with an `affinity`
+    (a process_id()) is claimed only by that process's workers until it has
+    waited `affinity_wait` seconds; after that, or once its lease expired, by
+    anyone.
+    """
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._local = threading.local() # One connection per thread
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None) # Explicit transactions below
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, "
+                "lease_owner TEXT, lease_expires_at REAL, available_at REAL NOT NULL, "
+                "progress TEXT, result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._ensure_columns(db, {"client_id": "TEXT", "claimed_at": "REAL", "batch_id": "TEXT", "priority": "INTEGER NOT NULL DEFAULT 0", "affinity": "TEXT"})
+            db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, available_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_client ON jobs (client_id, status)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id)")
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def _ensure_columns(db: sqlite3.Connection, columns: Dict[str, str]):
+        """Adds columns introduced after a database file was first created."""
+        db.execute("BEGIN IMMEDIATE") # Connections opening concurrently must not both add a column
+        try:
+            existing = {row[1] for row in db.execute("PRAGMA table_info(jobs)").fetchall()}
+            for name, column_type in columns.items():
+                if name not in existing:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    # --- Blocking operations (call through the async wrappers) ---
+    def _enqueue(
+        self, job_id: str, kind: str, payload: Dict[str, Any], max_attempts: int, progress: Optional[Dict[str, Any]],
+        client_id: Optional[str], batch_id: Optional[str], priority: int, if_absent: bool,
+        max_total: Optional[int], max_per_client: Optional[int], affinity: Optional[str]
+    ) -> bool:
+        """
+        Returns False if `if_absent` and a job with this id already exists. With
+        `max_total`/`max_per_client`, the active-job count and the insert happen
+        in one write transaction, so concurrent submissions can't overshoot the
+        limits; raises QueueLimitReached instead of inserting.
+        """
+        db = self._connection()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE") # Write lock: the limit check and the insert are atomic across workers
+        try:
+            if max_total is not None or max_per_client is not None:
+                counts = self._active_counts(client_id)
+                if max_per_client is not None and counts["client_active"] >= max_per_client:
+                    raise QueueLimitReached(per_client=True)
+                if max_total is not None and counts["active"] >= max_total:
+                    raise QueueLimitReached(per_client=False)
+            cursor = db.execute(
+                f"INSERT {'OR IGNORE ' if if_absent else ''}INTO jobs (job_id, kind, payload, status, max_attempts, available_at, "
+                "progress, created_at, updated_at, client_id, batch_id, priority, affinity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, max_attempts, now, json.dumps(progress or {}), now, now, client_id, batch_id, priority, affinity)
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def _claim(self, worker_id: str, visibility_timeout: float, affinity: Optional[str], affinity_wait: float) -> Optional[Dict[str, Any]]:
+        db = self._connection()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE") # Write lock: only one worker can claim at a time
+        try:
+            # Jobs whose lease expired ran out of attempts -> failed
+            db.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(error, 'Lease expired too many times.'), lease_owner = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires_at < ? AND attempts >= max_attempts",
+                (FAILED, now, PROCESSING, now)
+            )
+            # Highest priority first (interactive before bulk), then fair share: prefer the
+            # client with the fewest running jobs, then the oldest job
+            row = db.execute(
+                "SELECT * FROM jobs AS candidate WHERE (status = ? AND available_at <= ? AND (affinity IS NULL OR affinity IS ? OR available_at <= ?)) "
+                "OR (status = ? AND lease_expires_at < ?) "
+                "ORDER BY priority DESC, (SELECT COUNT(*) FROM jobs AS running WHERE running.status = ? AND running.lease_expires_at >= ? "
+                "AND running.client_id IS candidate.client_id) ASC, available_at ASC LIMIT 1",
+                (QUEUED, now, affinity, now - affinity_wait, PROCESSING, now, PROCESSING, now)
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_expires_at = ?, "
+                "claimed_at = COALESCE(claimed_at, ?), updated_at = ? WHERE job_id = ?",
+                (PROCESSING, worker_id, now + visibility_timeout, now, now, row["job_id"])
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        job = self._row_to_dict(row)
+        job["attempts"] += 1
+        job["status"] = PROCESSING
+        return job
+
+    def _heartbeat(self, job_id: str, worker_id: str, visibility_timeout: float, progress: Optional[Dict[str, Any]]) -> bool:
+        """Extends the lease (and saves progress). False if the lease was lost."""
+        now = time.time()
+        if progress is None:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE job_id = ? AND lease_owner = ? AND status = ?",
+                (now + visibility_timeout, now, job_id, worker_id, PROCESSING)
+            )
+        else:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET lease_expires_at = ?, progress = ?, updated_at = ? WHERE job_id = ? AND lease_owner = ? AND status = ?",
+                (now + visibility_timeout, json.dumps(progress), now, job_id, worker_id, PROCESSING)
+            )
+        return cursor.rowcount == 1
+
+    def _complete(self, job_id: str, worker_id: str, result: Dict[str, Any]):
+        now = time.time()
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, progress = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE job_id = ? AND lease_owner = ?",
+            (COMPLETED, json.dumps(result), json.dumps(result), now, job_id, worker_id)
+        )
+
+    def _fail(self, job_id: str, worker_id: str, error: str, progress: Optional[Dict[str, Any]], retry_delay: float, retry: bool) -> bool:
+        """Requeues the job if `retry` and it has attempts left. Returns True if it will be retried."""
+        db = self._connection()
+        now = time.time()
+        row = db.execute("SELECT attempts, max_attempts FROM jobs WHERE job_id = ? AND lease_owner = ?", (job_id, worker_id)).fetchone()
+        if row is None:
+            return False # Lease lost; whoever holds it now decides
+        will_retry = retry and row["attempts"] < row["max_attempts"]
+        db.execute(
+            "UPDATE jobs SET status = ?, error = ?, progress = ?, available_at = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE job_id = ? AND lease_owner = ?",
+            (QUEUED if will_retry else FAILED, error, json.dumps(progress or {}), now + retry_delay, now, job_id, worker_id)
+        )
+        return will_retry
+
+    def _release(self, job_id: str, worker_id: str, progress: Optional[Dict[str, Any]]):
+        """Hands an interrupted job back to the queue without using up an attempt."""
+        now = time.time()
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), progress = ?, available_at = ?, "
+            "lease_owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE job_id = ? AND lease_owner = ? AND status = ?",
+            (QUEUED, json.dumps(progress or {}), now, now, job_id, worker_id, PROCESSING)
+        )
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def _counts(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def _active_counts(self, client_id: Optional[str]) -> Dict[str, int]:
+        """Queued + running jobs; bulk batch jobs are counted separately."""
+        row = self._connection().execute(
+            "SELECT SUM(CASE WHEN batch_id IS NULL THEN 1 ELSE 0 END) AS active, "
+            "SUM(CASE WHEN batch_id IS NULL AND status = ? THEN 1 ELSE 0 END) AS queued, "
+            "SUM(CASE WHEN batch_id IS NULL AND client_id IS ? THEN 1 ELSE 0 END) AS client_active, "
+            "SUM(CASE WHEN batch_id IS NOT NULL THEN 1 ELSE 0 END) AS batch_active "
+            "FROM jobs WHERE status IN (?, ?)",
+            (QUEUED, client_id, QUEUED, PROCESSING)
+        ).fetchone()
+        return {
+            "active": row["active"] or 0, "queued": row["queued"] or 0,
+            "client_active": row["client_active"] or 0, "batch_active": row["batch_active"] or 0
+        }
+
+    def _batch_jobs(self, batch_id: str) -> List[Dict[str, Any]]:
+        rows = self._connection().execute("SELECT * FROM jobs WHERE batch_id = ? ORDER BY job_id", (batch_id,)).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def _wait_stats(self, window_seconds: float) -> Dict[str, Any]:
+        now = time.time()
+        recent = self._connection().execute(
+            "SELECT AVG(claimed_at - created_at) AS avg_wait, MAX(claimed_at - created_at) AS max_wait, COUNT(*) AS n "
+            "FROM jobs WHERE claimed_at IS NOT NULL AND claimed_at >= ?",
+            (now - window_seconds,)
+        ).fetchone()
+        oldest = self._connection().execute(
+            "SELECT MIN(created_at) AS oldest FROM jobs WHERE status = ?", (QUEUED,)
+        ).fetchone()
+        return {
+            "recent_avg_wait_seconds": round(recent["avg_wait"], 3) if recent["avg_wait"] is not None else None,
+            "recent_max_wait_seconds": round(recent["max_wait"], 3) if recent["max_wait"] is not None else None,
+            "recent_started_jobs": recent["n"],
+            "oldest_queued_age_seconds": round(now - oldest["oldest"], 3) if oldest["oldest"] is not None else None,
+        }
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for key in ("payload", "progress", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    # --- Async API ---
+    async def enqueue(
+        self, job_id: str, kind: str, payload: Dict[str, Any], max_attempts: Optional[int] = None,
+        progress: Optional[Dict[str, Any]] = None, client_id: Optional[str] = None,
+        batch_id: Optional[str] = None, priority: int = 0, if_absent: bool = False,
+        max_total: Optional[int] = None, max_per_client: Optional[int] = None, affinity: Optional[str] = None
+    ) -> bool:
+        return await asyncio.to_thread(
+            self._enqueue, job_id, kind, payload, max_attempts or settings.JOB_MAX_ATTEMPTS, progress,
+            client_id, batch_id, priority, if_absent, max_total, max_per_client, affinity
+        )
+
+    async def claim(self, worker_id: str, affinity: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(
+            self._claim, worker_id, settings.JOB_VISIBILITY_TIMEOUT_SECONDS, affinity, settings.JOB_AFFINITY_WAIT_SECONDS
+        )
+
+    async def heartbeat(self, job_id: str, worker_id: str, progress: Optional[Dict[str, Any]] = None) -> bool:
+        return await asyncio.to_thread(self._heartbeat, job_id, worker_id, settings.JOB_VISIBILITY_TIMEOUT_SECONDS, progress)
+
+    async def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]):
+        await asyncio.to_thread(self._complete, job_id, worker_id, result)
+
+    async def fail(
+        self, job_id: str, worker_id: str, error: str, progress: Optional[Dict[str, Any]] = None,
+        retry_delay: float = 0.0, retry: bool = True
+    ) -> bool:
+        return await asyncio.to_thread(self._fail, job_id, worker_id, error, progress, retry_delay, retry)
+
+    async def release(self, job_id: str, worker_id: str, progress: Optional[Dict[str, Any]] = None):
+        await asyncio.to_thread(self._release, job_id, worker_id, progress)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def counts(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._counts)
+
+    async def active_counts(self, client_id: Optional[str] = None) -> Dict[str, int]:
+        return await asyncio.to_thread(self._active_counts, client_id)
+
+    async def batch_jobs(self, batch_id: str) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._batch_jobs, batch_id)
+
+    async def wait_stats(self, window_seconds: float = 600.0) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._wait_stats, window_seconds)
+
+
+# kind -> async handler(job_id, payload, job_store). The handler reports progress by
+# mutating job_store[job_id] (same contract as the old in-memory JOB_STORE) and must
+# leave job_store[job_id]["status"] as "completed" or "failed". A failed state with
+# "retryable": False (or a PermanentJobError raised by the handler) is not retried.
+JobHandler = Callable[[str, Dict[str, Any], Dict[str, Dict[str, Any]]], Awaitable[None]]
+
+
+class JobWorkerPool:
+    """
+    Runs `concurrency` claim/execute loops in this process. Every uvicorn worker
+    starts its own pool; they coordinate only through the queue's leases.
+    """
+    def __init__(self, queue: JobQueue, handlers: Dict[str, JobHandler], concurrency: int):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.worker_id_prefix = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._run(f"{self.worker_id_prefix}:{i}")) for i in range(self.concurrency)]
+
+    async def stop(self):
+        self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, worker_id: str):
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.claim(worker_id, affinity=process_id())
+            except sqlite3.Error as e:
+                print(f"Job queue claim failed for {worker_id}: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(worker_id, job)
+
+    async def _execute(self, worker_id: str, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await self.queue.fail(job_id, worker_id, f"No handler for job kind '{job['kind']}'.", retry=False)
+            return
+
+        job_store = {job_id: dict(job["progress"] or {}, status=PROCESSING)}
+        handler_task = asyncio.create_task(handler(job_id, job["payload"], job_store))
+        heartbeat = asyncio.create_task(self._heartbeat_loop(worker_id, job_id, job_store, handler_task))
+        try:
+            await handler_task
+        except asyncio.CancelledError:
+            if heartbeat.done() and not heartbeat.cancelled() and heartbeat.result():
+                # Lease lost: another worker owns the job now; don't touch its row
+                return
+            # Shutting down (e.g. rolling deploy): hand the job back now instead of
+            # waiting for the lease to expire; it resumes from its checkpoints.
+            await asyncio.shield(self.queue.release(job_id, worker_id, job_store.get(job_id)))
+            raise
+        except Exception as e:
+            job_store[job_id] = {
+                "status": FAILED, "message": "An error occurred during job execution.", "error_detail": str(e),
+                "retryable": not isinstance(e, PermanentJobError)
+            }
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+        final_state = job_store.get(job_id, {})
+        if final_state.get("status") == COMPLETED:
+            await self.queue.complete(job_id, worker_id, final_state)
+        else:
+            retry_delay = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** (job["attempts"] - 1))
+            will_retry = await self.queue.fail(
+                job_id, worker_id, final_state.get("error_detail") or final_state.get("message") or "Unknown error",
+                progress=final_state, retry_delay=retry_delay, retry=final_state.get("retryable", True)
+            )
+            if will_retry:
+                print(f"Job {job_id} failed on attempt {job['attempts']}, retrying in {retry_delay:.1f}s.")
+
+    async def _heartbeat_loop(
+        self, worker_id: str, job_id: str, job_store: Dict[str, Dict[str, Any]], handler_task: "asyncio.Task"
+    ) -> bool:
+        """Extends the lease until cancelled. Returns True after losing it, having cancelled the handler."""
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL_SECONDS)
+            try:
+                if not await self.queue.heartbeat(job_id, worker_id, job_store.get(job_id)):
+                    # The job may already be running elsewhere: stop, so it isn't built twice into the same file
+                    print(f"Worker {worker_id} lost the lease on job {job_id}; cancelling it here.")
+                    handler_task.cancel()
+                    return True
+            except sqlite3.Error as e:
+                print(f"Heartbeat failed for job {job_id}: {e}")
+
+
+job_queue = JobQueue(settings.JOB_QUEUE_DB_PATH)
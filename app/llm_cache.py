@@ -0,0 +1,160 @@
+# app/llm_cache.py
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple
+
+from .config import settings
+
+
+# Bumped when cached values written under older keys must not be served (v2: v1 stored mock responses)
+CACHE_KEY_VERSION = 2
+
+
+def make_cache_key(provider: str, model_name: str, prompt: str, max_tokens: int, temperature: float) -> str:
+    """Content-addressed key: sha256 of the canonical request parameters."""
+    canonical = json.dumps(
+        [CACHE_KEY_VERSION, provider, model_name, prompt, int(max_tokens), round(float(temperature), 4)],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache for LLM responses: a bounded in-memory LRU in front of a
+    persistent SQLite store. Both tiers honour the same TTL.
+    """
+    def __init__(self, db_path: Path, memory_max_entries: int, disk_max_entries: int, ttl_seconds: int):
+        self.db_path = db_path
+        self.memory_max_entries = memory_max_entries
+        self.disk_max_entries = disk_max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict() # key -> (created_at, value)
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    # --- Disk tier (blocking, always run through asyncio.to_thread) ---
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+        return self._db
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, str]]:
+        with self._db_lock:
+            db = self._connection()
+            row = db.execute("SELECT created_at, value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[0] > self.ttl_seconds:
+                db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                db.commit()
+                return None
+            db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            return row[0], row[1]
+
+    def _disk_set(self, key: str, created_at: float, value: str):
+        with self._db_lock:
+            db = self._connection()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, created_at, created_at)
+            )
+            # Enforce the size limit by dropping the least recently used rows
+            overflow = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.disk_max_entries
+            if overflow > 0:
+                db.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.counters["evictions"] += overflow
+            db.commit()
+
+    def _disk_clear(self):
+        with self._db_lock:
+            db = self._connection()
+            db.execute("DELETE FROM llm_cache")
+            db.commit()
+
+    # --- Memory tier ---
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        created_at, value = entry
+        if time.time() - created_at > self.ttl_seconds:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, created_at: float, value: str):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+
+    # --- Public API ---
+    async def get(self, key: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+            return value
+        try:
+            entry = await asyncio.to_thread(self._disk_get, key)
+        except sqlite3.Error as e:
+            print(f"LLM cache disk read failed: {e}")
+            entry = None
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["disk_hits"] += 1
+        self._memory_set(key, entry[0], entry[1]) # Promote to the memory tier
+        return entry[1]
+
+    async def set(self, key: str, value: str):
+        created_at = time.time()
+        self._memory_set(key, created_at, value)
+        self.counters["writes"] += 1
+        try:
+            await asyncio.to_thread(self._disk_set, key, created_at, value)
+        except sqlite3.Error as e:
+            print(f"LLM cache disk write failed: {e}")
+
+    async def clear(self):
+        self._memory.clear()
+        await asyncio.to_thread(self._disk_clear)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_max_entries": self.memory_max_entries,
+            "disk_max_entries": self.disk_max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+llm_response_cache = LLMResponseCache(
+    db_path=settings.LLM_CACHE_DIR / "llm_responses.sqlite3",
+    memory_max_entries=settings.LLM_CACHE_MEMORY_MAX_ENTRIES,
+    disk_max_entries=settings.LLM_CACHE_DISK_MAX_ENTRIES,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+)
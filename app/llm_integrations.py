@@ -1,8 +1,20 @@
 # app/llm_integrations.py
 import asyncio
-from typing import Optional, Dict, Any
+import importlib.util
+import json
+import time
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, AsyncIterator, Callable, Tuple
 import httpx # For async HTTP requests if calling real APIs
 from .config import settings
+from .llm_cache import llm_response_cache, make_cache_key
+from .rate_limiter import ProviderRateLimiter, parse_retry_after
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from . import token_counter, llm_metrics
+
+class UnknownProviderError(ValueError):
+    """The requested LLM name is not in LLM_INSTANCES (a caller bug: no failover)."""
+
 
 # --- Base LLM API Class (Conceptual) ---
 class BaseLLMAPI:
@@ -11,22 +23,65 @@ class BaseLLMAPI:
         self.base_url = base_url
         self.model_name = model_name
         self.active_requests = 0
+        self._client: Optional[httpx.AsyncClient] = None # Shared keep-alive pool, see get_client()
+        self.rate_limiter: Optional[ProviderRateLimiter] = None # Set by _create_rate_limiter()
+        self.circuit_breaker: Optional[CircuitBreaker] = None # Set when LLM_INSTANCES is built
+
+    supports_streaming = False # True for providers implementing SSE in stream_text()
 
     async def generate_text(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> str:
         raise NotImplementedError("Subclasses must implement this method.")
 
+    async def stream_text(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> AsyncIterator[str]:
+        """Yields the response in chunks. Providers without SSE support yield it whole."""
+        yield await self.generate_text(prompt, max_tokens, temperature)
+
     def get_active_requests(self) -> int:
         return self.active_requests
 
+    def _request_url(self) -> str:
+        return f"{self.base_url}/completions"
+
+    def _request_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def get_client(self) -> httpx.AsyncClient:
+        """
+        Returns the provider's long-lived AsyncClient, creating it on first use.
+        Normally created at app startup (see startup_llm_clients) so every slide
+        reuses the same pooled TCP/TLS connections instead of a new handshake per call.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=_http2_enabled(),
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(
+                    connect=settings.LLM_HTTP_CONNECT_TIMEOUT,
+                    read=settings.LLM_HTTP_READ_TIMEOUT,
+                    write=settings.LLM_HTTP_WRITE_TIMEOUT,
+                    pool=settings.LLM_HTTP_POOL_TIMEOUT,
+                ),
+                headers=self._request_headers(),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
     async def _make_request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         self.active_requests += 1
         try:
-            # Simulate API call for now
-            # async with httpx.AsyncClient() as client:
-            #     headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-            #     response = await client.post(f"{self.base_url}/completions", json=payload, headers=headers, timeout=30.0)
-            #     response.raise_for_status()
-            #     return response.json()
+            if not settings.LLM_MOCK_RESPONSES:
+                response = await self.get_client().post(self._request_url(), json=payload)
+                response.raise_for_status()
+                return response.json()
+
             print(f"MOCK LLM Request ({self.model_name}): Payload: {str(payload)[:200]}...")
             await asyncio.sleep(0.5) # Simulate network latency
             
@@ -47,11 +102,45 @@ class BaseLLMAPI:
             self.active_requests -= 1
 
 
+    async def _stream_request(self, url: str, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """POSTs `payload` and yields every JSON event of the server-sent event stream."""
+        self.active_requests += 1
+        try:
+            async with self.get_client().stream("POST", url, json=payload) as response:
+                if response.is_error:
+                    await response.aread() # So the error handlers can read response.text
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    if data:
+                        yield json.loads(data)
+        except httpx.HTTPStatusError as e:
+            print(f"API Error for {self.model_name}: {e.response.status_code} - {e.response.text}")
+            raise
+        finally:
+            self.active_requests -= 1
+
+
+def _http2_enabled() -> bool:
+    # httpx only speaks HTTP/2 when the optional 'h2' package is installed (httpx[http2])
+    return settings.LLM_HTTP2 and importlib.util.find_spec("h2") is not None
+
+
 # --- Specific LLM Implementations (Mocked) ---
 class GeminiAPI(BaseLLMAPI):
     def __init__(self):
         super().__init__(settings.GEMINI_API_KEY, "https://generativelanguage.googleapis.com/v1beta/models", "gemini-pro:generateContent") # Example endpoint
 
+    def _request_url(self) -> str:
+        return f"{self.base_url}/{self.model_name}"
+
+    def _request_headers(self) -> Dict[str, str]:
+        return {"x-goog-api-key": self.api_key or "", "Content-Type": "application/json"}
+
     async def generate_text(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> str:
         if not self.api_key: return "Gemini API key not configured. Returning mock data."
         
@@ -67,10 +156,26 @@ class GeminiAPI(BaseLLMAPI):
         # For simplicity, this mock assumes max_tokens is for output.
         
         response_data = await self._make_request(payload)
-        # Actual parsing of Gemini response:
-        # return response_data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "Error or empty response")
+        if "candidates" in response_data: # Real Gemini response
+            return response_data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "Error or empty response")
         return response_data.get("choices", [{}])[0].get("text", "Mock Gemini Error")
 
+    supports_streaming = True
+
+    async def stream_text(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> AsyncIterator[str]:
+        payload = {
+            "contents": [{"parts":[{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": temperature,
+                "maxOutputTokens": max_tokens
+            }
+        }
+        stream_url = f"{self.base_url}/{self.model_name.replace(':generateContent', ':streamGenerateContent')}?alt=sse"
+        async for event in self._stream_request(stream_url, payload):
+            text = event.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text")
+            if text:
+                yield text
+
 
 class GPT_API(BaseLLMAPI): # e.g., OpenAI
     def __init__(self):
@@ -87,6 +192,21 @@ class GPT_API(BaseLLMAPI): # e.g., OpenAI
         response_data = await self._make_request(payload)
         return response_data.get("choices", [{}])[0].get("text", "Mock GPT Error").strip()
 
+    supports_streaming = True
+
+    async def stream_text(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> AsyncIterator[str]:
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        }
+        async for event in self._stream_request(self._request_url(), payload):
+            text = event.get("choices", [{}])[0].get("text")
+            if text:
+                yield text
+
 class DeepSeekAPI(BaseLLMAPI):
     def __init__(self):
         super().__init__(settings.DEEPSEEK_API_KEY, "https://api.deepseek.com/v1", "deepseek-coder") # Example model
@@ -102,10 +222,28 @@ class DeepSeekAPI(BaseLLMAPI):
         response_data = await self._make_request(payload)
         return response_data.get("choices", [{}])[0].get("text", "Mock DeepSeek Error").strip()
 
+    supports_streaming = True
+
+    async def stream_text(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> AsyncIterator[str]:
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        }
+        async for event in self._stream_request(self._request_url(), payload):
+            text = event.get("choices", [{}])[0].get("text")
+            if text:
+                yield text
+
 class MistralAPI(BaseLLMAPI):
     def __init__(self):
         super().__init__(settings.MISTRAL_API_KEY, "https://api.mistral.ai/v1", "mistral-small-latest") # Example model
 
+    def _request_url(self) -> str:
+        return f"{self.base_url}/chat/completions"
+
     async def generate_text(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> str:
         if not self.api_key: return "Mistral API key not configured. Returning mock data."
         # Mistral API might use a chat completions structure similar to OpenAI
@@ -115,11 +253,26 @@ class MistralAPI(BaseLLMAPI):
             "max_tokens": max_tokens,
             "temperature": temperature,
         }
-        response_data = await self._make_request(payload) # Assuming _make_request is adapted or this API returns similar structure
-        # Actual parsing for chat completion:
-        # return response_data.get("choices", [{}])[0].get("message", {}).get("content", "Mock Mistral Error").strip()
+        response_data = await self._make_request(payload)
+        if "message" in response_data.get("choices", [{}])[0]: # Real chat completion response
+            return response_data.get("choices", [{}])[0].get("message", {}).get("content", "Mock Mistral Error").strip()
         return response_data.get("choices", [{}])[0].get("text", "Mock Mistral Error - adapt for chat structure").strip()
 
+    supports_streaming = True
+
+    async def stream_text(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> AsyncIterator[str]:
+        payload = {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        }
+        async for event in self._stream_request(self._request_url(), payload):
+            text = event.get("choices", [{}])[0].get("delta", {}).get("content")
+            if text:
+                yield text
+
 
 # --- Factory to get LLM instances ---
 AVAILABLE_LLMS = {
@@ -129,8 +282,45 @@ AVAILABLE_LLMS = {
     "mistral": MistralAPI,
 }
 
+def _create_rate_limiter(llm_name: str) -> ProviderRateLimiter:
+    limits = settings.LLM_RATE_LIMITS.get(llm_name, {})
+    return ProviderRateLimiter(
+        requests_per_minute=limits.get("requests_per_minute", settings.LLM_DEFAULT_REQUESTS_PER_MINUTE),
+        tokens_per_minute=limits.get("tokens_per_minute", settings.LLM_DEFAULT_TOKENS_PER_MINUTE),
+        max_concurrency=int(limits.get("max_concurrency", settings.LLM_DEFAULT_MAX_CONCURRENCY)),
+        min_fraction=settings.LLM_RATE_LIMIT_MIN_FRACTION,
+        recovery_step=settings.LLM_RATE_LIMIT_RECOVERY_STEP,
+    )
+
 # Initialize instances (could be done on demand)
 LLM_INSTANCES = {name: klass() for name, klass in AVAILABLE_LLMS.items()}
+for _llm_name, _instance in LLM_INSTANCES.items():
+    _instance.rate_limiter = _create_rate_limiter(_llm_name)
+    _instance.circuit_breaker = CircuitBreaker(
+        _llm_name,
+        failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout=settings.LLM_BREAKER_RECOVERY_SECONDS,
+        half_open_max_calls=settings.LLM_BREAKER_HALF_OPEN_MAX_CALLS,
+    )
+
+def rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: instance.rate_limiter.stats() for name, instance in LLM_INSTANCES.items() if instance.api_key}
+
+def circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: instance.circuit_breaker.snapshot() for name, instance in LLM_INSTANCES.items() if instance.api_key}
+
+def any_llm_configured() -> bool:
+    return any(instance.api_key for instance in LLM_INSTANCES.values())
+
+async def startup_llm_clients():
+    """Opens the pooled HTTP client of every configured provider (FastAPI startup)."""
+    for instance in LLM_INSTANCES.values():
+        if instance.api_key:
+            instance.get_client()
+
+async def shutdown_llm_clients():
+    """Closes all pooled HTTP clients (FastAPI shutdown)."""
+    await asyncio.gather(*(instance.aclose() for instance in LLM_INSTANCES.values()), return_exceptions=True)
 
 async def generate_with_llm(
     llm_name: str,
@@ -138,24 +328,221 @@ async def generate_with_llm(
     max_tokens: int,
     temperature: float = 0.7,
     retry_attempts: int = 2,
-    backoff_factor: float = 0.5 # seconds
+    backoff_factor: float = 0.5, # seconds
+    use_cache: bool = True, # False bypasses the response cache for this call
+    task_type: str = "default", # Used for metrics and to pick failover providers
+    allow_failover: bool = True
+) -> str:
+    """
+    Generates text with `llm_name`. If that provider's circuit breaker is open or
+    the call still fails after retries with a provider-side error (see
+    _should_fail_over), the request fails over to the other providers allowed
+    for `task_type` in llm_selector.LLM_PROBABILITIES. Errors in the request
+    itself (4xx) are raised as they are.
+    """
+    try:
+        result = await _generate_on_provider(
+            llm_name, prompt, max_tokens, temperature, retry_attempts, backoff_factor, use_cache, task_type
+        )
+        _notify_provider(llm_name)
+        return result
+    except Exception as e:
+        if not (allow_failover and _should_fail_over(e)):
+            raise
+        last_error = e
+        for fallback_llm in _failover_candidates(llm_name, task_type):
+            print(f"Failing over '{task_type}' request from {llm_name} to {fallback_llm}: {last_error}")
+            try:
+                result = await _generate_on_provider(
+                    fallback_llm, prompt, max_tokens, temperature, retry_attempts, backoff_factor, use_cache, task_type
+                )
+                _notify_provider(fallback_llm)
+                return result
+            except Exception as fallback_error:
+                last_error = fallback_error
+        raise last_error
+
+
+def _should_fail_over(error: Exception) -> bool:
+    """
+    Whether another provider might succeed: transport errors and timeouts, 5xx,
+    408, exhausted 429s, open breakers and malformed responses (e.g. bad SSE
+    JSON). Not for other 4xx (prompt too long, bad key, malformed request) or
+    an unknown provider name: those are the caller's to fix.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code >= 500 or status_code in (408, 429)
+    return not isinstance(error, UnknownProviderError)
+
+
+def _failover_candidates(failed_llm: str, task_type: str) -> List[str]:
+    """Configured providers allowed for the task, closed breakers first, by task probability."""
+    from .llm_selector import LLM_PROBABILITIES # Imported here: llm_selector imports this module
+    task_probabilities = LLM_PROBABILITIES.get(task_type, LLM_PROBABILITIES["default"])
+    candidates = [
+        name for name in task_probabilities
+        if name != failed_llm and name in LLM_INSTANCES and LLM_INSTANCES[name].api_key
+    ]
+    return sorted(candidates, key=lambda name: (LLM_INSTANCES[name].circuit_breaker.is_open(), -task_probabilities[name]))
+
+
+async def _generate_on_provider(
+    llm_name: str,
+    prompt: str,
+    max_tokens: int,
+    temperature: float,
+    retry_attempts: int,
+    backoff_factor: float,
+    use_cache: bool,
+    task_type: str
 ) -> str:
     instance = LLM_INSTANCES.get(llm_name)
     if not instance:
-        raise ValueError(f"LLM '{llm_name}' not found or configured.")
+        raise UnknownProviderError(f"LLM '{llm_name}' not found or configured.")
 
     if not instance.api_key:
         print(f"Warning: API key for {llm_name} is not configured. Using mock response.")
         # Fallback to a generic mock if key is missing, even if class has mock logic
         return f"Mock response: API key for {llm_name} missing. Prompt: '{prompt[:30]}...'"
 
+    cache_key = make_cache_key(llm_name, instance.model_name, prompt, max_tokens, temperature)
+    # Mock responses are never cached: they would be served as real content once mocks are off
+    cache_enabled = use_cache and settings.LLM_CACHE_ENABLED and not settings.LLM_MOCK_RESPONSES
+    if cache_enabled:
+        cached = await llm_response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    # Single-flight: identical prompts already in flight share one upstream call. Keyed on
+    # cache_enabled too, so a caching caller never joins a call whose result won't be stored
+    # (and a use_cache=False caller never joins one that will)
+    flight_key = (cache_key, cache_enabled)
+    shared_call = _IN_FLIGHT_REQUESTS.get(flight_key)
+    if shared_call is None:
+        shared_call = asyncio.create_task(_generate_and_store(
+            instance, llm_name, prompt, max_tokens, temperature, retry_attempts, backoff_factor,
+            cache_key if cache_enabled else None, task_type
+        ))
+        _IN_FLIGHT_REQUESTS[flight_key] = shared_call
+        shared_call.add_done_callback(lambda task, key=flight_key: _finish_in_flight(key, task))
+        SINGLE_FLIGHT_STATS["upstream_calls"] += 1
+    else:
+        SINGLE_FLIGHT_STATS["coalesced"] += 1
+    # shield() so that cancelling this waiter never cancels the call other waiters depend on
+    return await asyncio.shield(shared_call)
+
+
+# (cache_key, cache_enabled) -> Task of the upstream call currently serving that key
+_IN_FLIGHT_REQUESTS: Dict[Tuple[str, bool], "asyncio.Task[str]"] = {}
+SINGLE_FLIGHT_STATS = {"upstream_calls": 0, "coalesced": 0}
+
+def single_flight_stats() -> Dict[str, int]:
+    return {**SINGLE_FLIGHT_STATS, "in_flight": len(_IN_FLIGHT_REQUESTS)}
+
+def _finish_in_flight(flight_key: Tuple[str, bool], task: "asyncio.Task[str]"):
+    if _IN_FLIGHT_REQUESTS.get(flight_key) is task:
+        del _IN_FLIGHT_REQUESTS[flight_key]
+    if not task.cancelled():
+        task.exception() # Mark as retrieved even if every waiter was cancelled
+
+async def _generate_and_store(
+    instance: "BaseLLMAPI",
+    llm_name: str,
+    prompt: str,
+    max_tokens: int,
+    temperature: float,
+    retry_attempts: int,
+    backoff_factor: float,
+    cache_key: Optional[str],
+    task_type: str = "default"
+) -> str:
+    result = await _generate_with_retries(instance, llm_name, prompt, max_tokens, temperature, retry_attempts, backoff_factor, task_type)
+    if cache_key:
+        await llm_response_cache.set(cache_key, result)
+    return result
+
+
+# Receives streamed chunks of the upstream call made from the current task's context
+# (set per slide by services; the single-flight task inherits its creator's context).
+STREAM_LISTENER: ContextVar[Optional[Callable[[str], None]]] = ContextVar("STREAM_LISTENER", default=None)
+
+# Told which provider answered a generate_with_llm call made from the current context
+PROVIDER_LISTENER: ContextVar[Optional[Callable[[str], None]]] = ContextVar("PROVIDER_LISTENER", default=None)
+
+def _notify_provider(llm_name: str):
+    listener = PROVIDER_LISTENER.get()
+    if listener:
+        listener(llm_name)
+
+async def _call_provider(instance: BaseLLMAPI, prompt: str, max_tokens: int, temperature: float) -> str:
+    if settings.LLM_MOCK_RESPONSES or not (settings.LLM_STREAMING_ENABLED and instance.supports_streaming):
+        return await instance.generate_text(prompt, max_tokens, temperature)
+    listener = STREAM_LISTENER.get()
+    chunks: List[str] = []
+    async for chunk in instance.stream_text(prompt, max_tokens, temperature):
+        chunks.append(chunk)
+        if listener:
+            listener(chunk)
+    return "".join(chunks).strip()
+
+
+async def _generate_with_retries(
+    instance: BaseLLMAPI,
+    llm_name: str,
+    prompt: str,
+    max_tokens: int,
+    temperature: float,
+    retry_attempts: int,
+    backoff_factor: float,
+    task_type: str = "default"
+) -> str:
+    estimated_tokens = token_counter.count_tokens(prompt, llm_name) + max_tokens
     current_attempt = 0
+    rate_limited_attempts = 0
     while current_attempt <= retry_attempts:
         try:
-            return await instance.generate_text(prompt, max_tokens, temperature)
+            # Queues here until the provider's request/token budget and a concurrency slot are free
+            async with instance.rate_limiter.slot(estimated_tokens):
+                if not instance.circuit_breaker.allow_request():
+                    raise CircuitOpenError(f"Circuit breaker for {llm_name} is open.")
+                started_at = time.monotonic()
+                try:
+                    result = await _call_provider(instance, prompt, max_tokens, temperature)
+                except httpx.HTTPStatusError as e:
+                    llm_metrics.record_call(llm_name, task_type, time.monotonic() - started_at, ok=False)
+                    if e.response.status_code >= 500:
+                        instance.circuit_breaker.record_failure()
+                    elif e.response.status_code == 429:
+                        instance.circuit_breaker.record_success() # The provider itself is up
+                    else:
+                        instance.circuit_breaker.record_cancelled() # Our request was bad: says nothing about the provider
+                    raise
+                except Exception:
+                    llm_metrics.record_call(llm_name, task_type, time.monotonic() - started_at, ok=False)
+                    instance.circuit_breaker.record_failure()
+                    raise
+                except BaseException:
+                    instance.circuit_breaker.record_cancelled()
+                    raise
+                llm_metrics.record_call(llm_name, task_type, time.monotonic() - started_at, ok=True)
+                instance.circuit_breaker.record_success()
+            instance.rate_limiter.on_success()
+            return result
         except httpx.HTTPStatusError as e:
             # Specific error handling, e.g., rate limits (429)
-            if e.response.status_code == 429 or e.response.status_code >= 500: # Retry on rate limit or server errors
+            if e.response.status_code == 429:
+                # Shrink the limits and pause for Retry-After (exponential backoff without one);
+                # the next slot() call waits it out
+                rate_limited_attempts += 1
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                if retry_after is None:
+                    retry_after = backoff_factor * (2 ** (rate_limited_attempts - 1))
+                instance.rate_limiter.on_rate_limited(retry_after)
+                print(f"LLM API rate limited for {llm_name} ({rate_limited_attempts}/{settings.LLM_RATE_LIMIT_MAX_RETRIES}). Queueing retry...")
+                if rate_limited_attempts > settings.LLM_RATE_LIMIT_MAX_RETRIES:
+                    raise
+            elif e.response.status_code >= 500: # Retry on server errors
                 print(f"LLM API error for {llm_name} (Attempt {current_attempt+1}/{retry_attempts+1}): {e.response.status_code}. Retrying...")
                 current_attempt += 1
                 if current_attempt > retry_attempts:
@@ -163,6 +550,8 @@ async def generate_with_llm(
                 await asyncio.sleep(backoff_factor * (2 ** (current_attempt -1))) # Exponential backoff
             else: # Non-retryable client-side HTTP errors
                 raise
+        except CircuitOpenError:
+            raise # Don't keep retrying a provider that is known to be down
         except Exception as e: # Other errors like network issues
             print(f"Error during LLM call for {llm_name} (Attempt {current_attempt+1}/{retry_attempts+1}): {str(e)}. Retrying...")
             current_attempt += 1
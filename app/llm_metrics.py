@@ -0,0 +1,70 @@
+# app/llm_metrics.py
+import math
+from collections import deque
+from typing import Dict, Tuple, Optional, Any
+
+from .config import settings
+
+
+class ProviderMetrics:
+    """
+    Rolling latency and error statistics for one (provider, task_type) pair:
+    EWMA latency, percentiles over a bounded window and an EWMA error rate.
+    """
+    def __init__(self, window_size: int, alpha: float):
+        self.alpha = alpha
+        self.latencies = deque(maxlen=window_size) # Successful call latencies (seconds)
+        self.ewma_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.successes = 0
+        self.errors = 0
+
+    def record(self, latency: float, ok: bool):
+        if ok:
+            self.successes += 1
+            self.latencies.append(latency)
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency = self.alpha * latency + (1 - self.alpha) * self.ewma_latency
+        else:
+            self.errors += 1
+        self.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.error_rate
+
+    @property
+    def samples(self) -> int:
+        return len(self.latencies)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+        return ordered[rank]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ewma_latency": self.ewma_latency,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "error_rate": round(self.error_rate, 4),
+            "successes": self.successes,
+            "errors": self.errors,
+        }
+
+
+# (llm_name, task_type) -> ProviderMetrics
+PROVIDER_METRICS: Dict[Tuple[str, str], ProviderMetrics] = {}
+
+def get_metrics(llm_name: str, task_type: str) -> ProviderMetrics:
+    key = (llm_name, task_type)
+    if key not in PROVIDER_METRICS:
+        PROVIDER_METRICS[key] = ProviderMetrics(settings.LLM_METRICS_WINDOW_SIZE, settings.LLM_METRICS_EWMA_ALPHA)
+    return PROVIDER_METRICS[key]
+
+def record_call(llm_name: str, task_type: str, latency: float, ok: bool):
+    get_metrics(llm_name, task_type).record(latency, ok)
+
+def metrics_snapshot() -> Dict[str, Dict[str, Any]]:
+    return {f"{llm_name}:{task_type}": metrics.snapshot() for (llm_name, task_type), metrics in PROVIDER_METRICS.items()}
@@ -1,7 +1,10 @@
 # app/llm_selector.py
+import asyncio
 import random
-from typing import Dict, List, Optional, Callable, Awaitable
+from typing import Dict, List, Optional, Callable, Awaitable, Tuple, Iterable
 
+from . import llm_integrations, llm_metrics
+from .config import settings
 from .llm_integrations import LLM_INSTANCES, BaseLLMAPI # Assuming LLM_INSTANCES is a dict of initialized APIs
 
 # --- Configuration for LLM Selection ---
@@ -31,29 +34,55 @@ LLM_PROBABILITIES = {
 # For simplicity, assume LLM_INSTANCES is available from llm_integrations
 # from .llm_integrations import LLM_INSTANCES
 
-def select_llm_for_task(task_type: str = "default") -> BaseLLMAPI:
+def _health_weight(llm_name: str, task_type: str, reference_latency: Optional[float]) -> float:
     """
-    Selects an LLM based on pre-defined probabilities and current availability (conceptual).
+    Multiplier from recent behaviour: faster-than-peers and error-free providers keep
+    their full weight, slow or failing ones are scaled down. No samples -> neutral 1.0.
     """
+    metrics = llm_metrics.get_metrics(llm_name, task_type)
+    latency_factor = 1.0
+    if reference_latency and metrics.ewma_latency:
+        latency_factor = reference_latency / metrics.ewma_latency
+        p95 = metrics.percentile(95)
+        if p95 and metrics.samples >= settings.LLM_HEDGE_MIN_SAMPLES:
+            latency_factor *= min(1.0, 2 * metrics.ewma_latency / p95) # Penalise long tails
+    error_factor = max(0.05, 1 - metrics.error_rate) ** 2
+    return latency_factor * error_factor
+
+
+def _candidate_weights(task_type: str, exclude: Iterable[str] = ()) -> Tuple[List[str], List[float]]:
     task_probabilities = LLM_PROBABILITIES.get(task_type, LLM_PROBABILITIES["default"])
-    
-    available_llms = []
+    candidates = [
+        llm_name for llm_name, instance in LLM_INSTANCES.items()
+        if instance.api_key and llm_name in task_probabilities and llm_name not in exclude # Check if API key exists and LLM is in prob dict
+        and not instance.circuit_breaker.is_open() # Route around providers whose breaker is open
+    ]
+    observed_latencies = [
+        llm_metrics.get_metrics(llm_name, task_type).ewma_latency for llm_name in candidates
+    ]
+    observed_latencies = [latency for latency in observed_latencies if latency]
+    reference_latency = min(observed_latencies) if observed_latencies else None
+
     llm_weights = []
+    for llm_name in candidates:
+        # Conditional probability: Prioritize LLMs with fewer active requests
+        active_reqs = LLM_INSTANCES[llm_name].get_active_requests()
+        
+        # Adjust weight: higher probability for less busy LLMs
+        # The adjustment factor needs tuning. Example:
+        weight_adjustment = 1 / (1 + active_reqs * 0.5) # Penalize more for more requests
+        
+        adjusted_prob = task_probabilities[llm_name] * weight_adjustment * _health_weight(llm_name, task_type, reference_latency)
+        llm_weights.append(adjusted_prob)
+    return candidates, llm_weights
 
-    for llm_name, instance in LLM_INSTANCES.items():
-        if instance.api_key and llm_name in task_probabilities: # Check if API key exists and LLM is in prob dict
-            # Conditional probability: Prioritize LLMs with fewer active requests
-            # This is a simple heuristic; real-world might need more sophisticated load balancing.
-            active_reqs = instance.get_active_requests()
-            
-            # Adjust weight: higher probability for less busy LLMs
-            # The adjustment factor needs tuning. Example:
-            weight_adjustment = 1 / (1 + active_reqs * 0.5) # Penalize more for more requests
-            
-            adjusted_prob = task_probabilities[llm_name] * weight_adjustment
-            
-            available_llms.append(llm_name)
-            llm_weights.append(adjusted_prob)
+
+def select_llm_for_task(task_type: str = "default") -> BaseLLMAPI:
+    """
+    Selects an LLM based on pre-defined probabilities weighted by current load,
+    recent latency (EWMA and p95) and error rate for this task type.
+    """
+    available_llms, llm_weights = _candidate_weights(task_type)
 
     if not available_llms:
         # Fallback if no LLMs are available (e.g., all keys missing or no suitable LLMs for task)
@@ -96,7 +125,8 @@ async def get_llm_response(
     task_type: str = "default", # e.g., "heading_generation", "content_generation"
     temperature: float = 0.7,
     style_tone: Optional[str] = None, # Passed to prompt optimizer, not directly to LLM selector
-    content_format: Optional[str] = None # Passed to prompt optimizer
+    content_format: Optional[str] = None, # Passed to prompt optimizer
+    use_cache: bool = True # False bypasses the LLM response cache
 ) -> str:
     """
     High-level function to get a response from a selected LLM.
@@ -112,18 +142,71 @@ async def get_llm_response(
     # 3. Generate text using the selected LLM's method
     #    The `generate_with_llm` function in `llm_integrations` now expects llm_name.
     #    We need to get the name of the selected LLM.
-    llm_name_key = None
-    for name, instance in LLM_INSTANCES.items():
-        if instance == selected_llm_instance:
-            llm_name_key = name
-            break
-    
+    llm_name_key = _llm_name_of(selected_llm_instance)
     if not llm_name_key:
         raise Exception("Could not determine the name of the selected LLM instance.")
 
-    return await llm_integrations.generate_with_llm(
-        llm_name=llm_name_key,
-        prompt=prompt,
-        max_tokens=max_tokens,
-        temperature=temperature
-    )
\ No newline at end of file
+    def _call(llm_name: str) -> Awaitable[str]:
+        return llm_integrations.generate_with_llm(
+            llm_name=llm_name,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            use_cache=use_cache,
+            task_type=task_type
+        )
+
+    if not settings.LLM_HEDGING_ENABLED:
+        return await _call(llm_name_key)
+    return await _hedged_call(llm_name_key, task_type, _call)
+
+
+def _llm_name_of(instance: BaseLLMAPI) -> Optional[str]:
+    for name, candidate in LLM_INSTANCES.items():
+        if candidate == instance:
+            return name
+    return None
+
+
+async def _hedged_call(primary_llm: str, task_type: str, call: Callable[[str], Awaitable[str]]) -> str:
+    """
+    Starts the call on `primary_llm`; if it is still running after that provider's
+    recent p95 latency, sends a duplicate to the next-best provider and returns
+    whichever succeeds first.
+    """
+    metrics = llm_metrics.get_metrics(primary_llm, task_type)
+    p95 = metrics.percentile(95)
+    primary = asyncio.create_task(call(primary_llm))
+    legs = {primary}
+    try:
+        if p95 is None or metrics.samples < settings.LLM_HEDGE_MIN_SAMPLES:
+            return await primary # Not enough history to know what "slow" means yet
+
+        done, _ = await asyncio.wait({primary}, timeout=max(p95, settings.LLM_HEDGE_MIN_DELAY_SECONDS))
+        if done:
+            return primary.result()
+
+        backup_llms, backup_weights = _candidate_weights(task_type, exclude={primary_llm})
+        if not backup_llms:
+            return await primary
+        backup_llm = max(zip(backup_weights, backup_llms))[1]
+        print(f"Hedging '{task_type}' request: {primary_llm} exceeded p95 {p95:.2f}s, also trying {backup_llm}")
+        legs.add(asyncio.create_task(call(backup_llm)))
+        pending = set(legs)
+        last_error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled(): # A cancelled leg counts as failed; keep waiting for the other
+                    last_error = asyncio.CancelledError()
+                elif task.exception() is None:
+                    return task.result()
+                else:
+                    last_error = task.exception()
+        raise last_error
+    finally:
+        # Also when the caller is cancelled mid-wait, so no leg keeps holding rate-limiter tokens.
+        # The loser's upstream call is shielded by single-flight and still fills the cache
+        for task in legs:
+            if not task.done():
+                task.cancel()
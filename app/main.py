@@ -3,15 +3,14 @@ import secrets
 import asyncio
 import os
 from pathlib import Path
-from fastapi import FastAPI, Request, Form, File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
+from fastapi import FastAPI, Request, Form, File, UploadFile, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import List, Optional
-import shutil
+from typing import List, Optional, Dict, Tuple
 import uuid
 
-from . import schemas, config, services, pptx_utils
+from . import schemas, config, services, pptx_utils, llm_integrations, llm_cache, llm_metrics, job_queue, admission, speculation, deck_manifest, bulk, template_cache, template_index, theme_variants, deck_output, deck_cache, upload_store, template_catalog, token_counter
 
 settings = config.settings
 
@@ -20,9 +19,14 @@ app = FastAPI()
 app.mount("/static", StaticFiles(directory=settings.STATIC_DIR), name="static")
 templates = Jinja2Templates(directory=settings.TEMPLATES_DIR)
 
-# In-memory store for job progress (replace with DB for production)
-JOB_STORE = {} 
+# Job progress lives in the durable job queue (see job_queue.py), readable from any worker
+JOB_WORKERS = job_queue.JobWorkerPool(
+    job_queue.job_queue,
+    handlers={"presentation": services.run_presentation_job, bulk.BULK_DECK_KIND: bulk.run_bulk_deck_job},
+    concurrency=settings.JOB_WORKER_CONCURRENCY
+)
 SESSION_DATA = {} # To store intermediate data like headings, template choice
+INDEX_PAGE_CACHE: Dict[str, Tuple[int, bytes]] = {} # Base URL -> (template catalog version, rendered index page)
 
 @app.on_event("startup")
 async def startup_event():
@@ -45,27 +49,56 @@ async def startup_event():
         except Exception as e:
             print(f"Could not create dummy template: {e}")
 
+    # Catalog and analyze server templates once (reuses index files from earlier runs)
+    await template_catalog.template_catalog.refresh(force=True)
 
-async def cleanup_file(file_path: Path, delay: int):
-    await asyncio.sleep(delay)
+    # Load tokenizers off the event loop (tiktoken may download its encoding) instead of on the first request
     try:
-        if file_path.exists():
-            os.remove(file_path)
-            print(f"Cleaned up {file_path}")
-    except Exception as e:
-        print(f"Error cleaning up file {file_path}: {e}")
+        await asyncio.wait_for(asyncio.to_thread(token_counter.warm_tokenizers), settings.TOKENIZER_WARMUP_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        token_counter.use_heuristic_for_unloaded()
+
+    # Open one pooled, keep-alive HTTP client per LLM provider
+    await llm_integrations.startup_llm_clients()
+    JOB_WORKERS.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await JOB_WORKERS.stop() # Running jobs are released back to the queue and resume from their checkpoints
+    speculation.shutdown_speculation()
+    await llm_integrations.shutdown_llm_clients()
+    pptx_utils.shutdown_pptx_executor()
+
 
 @app.get("/", response_class=HTMLResponse)
 async def get_index(request: Request):
-    server_templates = pptx_utils.list_server_templates()
-    return templates.TemplateResponse("index.html", {
+    await template_catalog.template_catalog.refresh()
+    # The page only changes with the catalog (and the base URL its links are built from)
+    cache_key = str(request.base_url)
+    cached = INDEX_PAGE_CACHE.get(cache_key)
+    if cached and cached[0] == template_catalog.template_catalog.version:
+        return HTMLResponse(cached[1])
+
+    response = templates.TemplateResponse("index.html", {
         "request": request,
-        "server_templates": server_templates,
+        "server_templates": template_catalog.template_catalog.names(),
         "default_slides": settings.DEFAULT_SLIDES,
         "max_slides": settings.MAX_SLIDES,
         "default_tokens": settings.DEFAULT_TOKENS_PER_SLIDE,
         "max_tokens": settings.MAX_TOKENS_PER_SLIDE
     })
+    if len(INDEX_PAGE_CACHE) >= 16 and cache_key not in INDEX_PAGE_CACHE:
+        INDEX_PAGE_CACHE.clear() # Only a handful of hostnames serve the app
+    INDEX_PAGE_CACHE[cache_key] = (template_catalog.template_catalog.version, response.body)
+    return response
+
+
+@app.get("/server-templates")
+async def get_server_templates():
+    """Server templates with their size, content hash and layout analysis."""
+    await template_catalog.template_catalog.refresh()
+    return {"version": template_catalog.template_catalog.version, "templates": template_catalog.template_catalog.entries()}
 
 @app.post("/generate-headings", response_class=HTMLResponse)
 async def generate_headings_form(
@@ -79,6 +112,9 @@ async def generate_headings_form(
     content_format: str = Form("bullet_points"),
     pptx_template_file: Optional[UploadFile] = File(None)
 ):
+    client_id = admission.client_id_for(request)
+    admission.heading_limiter.check(client_id) # Fail fast before accepting an upload
+
     session_id = str(uuid.uuid4())
     uploaded_template_path = None
 
@@ -88,19 +124,25 @@ async def generate_headings_form(
         if not pptx_template_file.filename.endswith(".pptx"):
             raise HTTPException(status_code=400, detail="Invalid file type. Only .pptx files are allowed.")
         
-        temp_upload_dir = settings.GENERATED_PPTS_DIR / "uploads" / session_id
-        temp_upload_dir.mkdir(parents=True, exist_ok=True)
-        uploaded_template_path = temp_upload_dir / pptx_template_file.filename
-        
         try:
-            with open(uploaded_template_path, "wb") as buffer:
-                shutil.copyfileobj(pptx_template_file.file, buffer)
+            # Hashed, size-checked and structurally validated while streamed; identical templates are stored once
+            uploaded_template_path = await upload_store.upload_store.save(pptx_template_file)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to save uploaded template: {str(e)}")
         finally:
-            pptx_template_file.file.close()
-    elif not (settings.SERVER_TEMPLATES_DIR / template_choice).exists():
-        raise HTTPException(status_code=400, detail=f"Selected server template '{template_choice}' not found.")
+            await pptx_template_file.close()
+        try:
+            # Analyze now, so the job finds a ready index next to the upload (already there for a known template)
+            await pptx_utils.run_in_pptx_executor(template_index.get_template_index, uploaded_template_path)
+        except Exception as e:
+            await upload_store.upload_store.release(uploaded_template_path)
+            raise HTTPException(status_code=400, detail=f"Uploaded file is not a usable PowerPoint template: {str(e)}")
+    else:
+        await template_catalog.template_catalog.refresh()
+        if not template_catalog.template_catalog.contains(template_choice):
+            raise HTTPException(status_code=400, detail=f"Selected server template '{template_choice}' not found.")
 
     # Store session data
     SESSION_DATA[session_id] = {
@@ -116,9 +158,19 @@ async def generate_headings_form(
     }
 
     try:
-        headings = await services.generate_slide_headings(main_topic, num_slides)
+        async with admission.heading_limiter.admit(client_id):
+            headings = await services.generate_slide_headings(main_topic, num_slides)
         SESSION_DATA[session_id]["initial_headings"] = headings # Store initially generated headings
+        # Opt-in: start on slide contents while the user reviews the headings
+        speculation.start_speculation(
+            session_id, main_topic, [h.heading for h in headings], style_tone, content_format, max_tokens_per_slide
+        )
     except Exception as e:
+        SESSION_DATA.pop(session_id, None)
+        if uploaded_template_path:
+            await upload_store.upload_store.release(uploaded_template_path)
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=f"Failed to generate headings: {str(e)}")
 
     return templates.TemplateResponse("configure_slides.html", {
@@ -138,14 +190,18 @@ async def generate_headings_form(
 @app.post("/create-presentation", response_class=HTMLResponse)
 async def create_presentation_form(
     request: Request,
-    background_tasks: BackgroundTasks,
     session_id: str = Form(...),
     final_headings: List[str] = Form(...) # Comes as a list of strings
 ):
     if session_id not in SESSION_DATA:
         raise HTTPException(status_code=404, detail="Session not found or expired.")
 
+    client_id = admission.client_id_for(request)
+    await admission.admit_presentation_job(client_id)
+
     session_info = SESSION_DATA[session_id]
+    # Contents speculatively generated for headings the user kept unchanged
+    pregenerated_contents = await speculation.collect_speculation(session_id, final_headings)
     
     presentation_details = schemas.FinalPresentationRequest(
         session_id=session_id,
@@ -156,26 +212,28 @@ async def create_presentation_form(
         theme_color=session_info.get("theme_color"),
         max_tokens_per_slide=session_info["max_tokens_per_slide"],
         style_tone=session_info["style_tone"],
-        content_format=session_info["content_format"]
+        content_format=session_info["content_format"],
+        main_topic=session_info["main_topic"],
+        pregenerated_contents=pregenerated_contents or None
     )
 
     job_id = f"ppt_job_{secrets.token_hex(8)}"
-    JOB_STORE[job_id] = {"status": "processing", "message": "Generating presentation..."}
-
-    output_filename = f"{session_info['main_topic'].replace(' ', '_')}_{job_id}.pptx"
+    output_filename = f"{bulk._safe_filename_part(session_info['main_topic'])}_{job_id}.pptx"
     output_path = settings.GENERATED_PPTS_DIR / output_filename
 
-    # Run generation in background
-    background_tasks.add_task(
-        services.generate_presentation_slides_async,
+    # Run generation on whichever worker claims the job first (this process's, for in-memory output)
+    in_memory_process = job_queue.process_id() if settings.DECK_OUTPUT_MODE == "memory" else None
+    await admission.enqueue_presentation_job(
+        client_id,
         job_id,
-        presentation_details,
-        output_path,
-        JOB_STORE
+        {"details": presentation_details.model_dump(), "output_path": str(output_path), "in_memory_process": in_memory_process},
+        progress={"message": "Queued for generation..."},
+        affinity=in_memory_process
     )
     
     # Clean up session data after initiating job
-    # del SESSION_DATA[session_id] # Or use a TTL cache
+    speculation.consume_speculation(session_id)
+    SESSION_DATA.pop(session_id, None)
 
     return templates.TemplateResponse("download.html", {
         "request": request,
@@ -184,37 +242,174 @@ async def create_presentation_form(
         "status_url": app.url_path_for("get_job_status", job_id=job_id)
     })
 
+@app.post("/presentations/{job_id}/regenerate")
+async def regenerate_presentation(job_id: str, details: schemas.FinalPresentationRequest, request: Request):
+    """
+    Builds a new deck from `details`, calling the LLM only for slides whose
+    prompt differs from the ones in job `job_id`'s manifest.
+    """
+    manifest = await deck_manifest.deck_manifest_store.load(job_id)
+    if not manifest:
+        raise HTTPException(status_code=404, detail="No manifest for this presentation (unknown or expired job).")
+
+    client_id = admission.client_id_for(request)
+    await admission.admit_presentation_job(client_id)
+
+    # Only server-side state may choose what gets reused: contents come from the manifest alone
+    details.pregenerated_contents = None
+    details.base_job_id = job_id
+    if details.template_choice == "upload":
+        # The new job holds its own reference on the uploaded template (store paths only)
+        if not (details.uploaded_template_path and await upload_store.upload_store.acquire(Path(details.uploaded_template_path))):
+            raise HTTPException(status_code=400, detail="Uploaded template is no longer available; upload it again.")
+    else:
+        await template_catalog.template_catalog.refresh()
+        if not template_catalog.template_catalog.contains(details.template_choice):
+            raise HTTPException(status_code=400, detail=f"Selected server template '{details.template_choice}' not found.")
+        details.uploaded_template_path = None
+    main_topic = details.main_topic or manifest["deck"].get("main_topic") or "presentation"
+    new_job_id = f"ppt_job_{secrets.token_hex(8)}"
+    output_path = settings.GENERATED_PPTS_DIR / f"{bulk._safe_filename_part(main_topic)}_{new_job_id}.pptx"
+    in_memory_process = job_queue.process_id() if settings.DECK_OUTPUT_MODE == "memory" else None
+    try:
+        await admission.enqueue_presentation_job(
+            client_id,
+            new_job_id,
+            {"details": details.model_dump(), "output_path": str(output_path), "in_memory_process": in_memory_process},
+            progress={"message": "Queued for regeneration..."},
+            affinity=in_memory_process
+        )
+    except HTTPException:
+        if details.template_choice == "upload":
+            await upload_store.upload_store.release(Path(details.uploaded_template_path))
+        raise
+    return {"job_id": new_job_id, "status_url": app.url_path_for("get_job_status", job_id=new_job_id)}
+
+
+@app.post("/bulk/decks")
+async def submit_bulk_decks(bulk_request: schemas.BulkGenerationRequest):
+    """
+    Queues many decks at once. They run at lower priority than interactive jobs
+    on every worker; poll the returned status_url for per-deck results.
+    """
+    if not bulk_request.decks:
+        raise HTTPException(status_code=400, detail="No decks given.")
+    if len(bulk_request.decks) > settings.BULK_MAX_DECKS_PER_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_DECKS_PER_BATCH} decks per batch.")
+    if bulk_request.batch_id and not bulk.is_valid_batch_id(bulk_request.batch_id):
+        raise HTTPException(status_code=400, detail="batch_id may only contain letters, digits, '_' and '-' (max 64).")
+    await template_catalog.template_catalog.refresh()
+    for spec in bulk_request.decks:
+        if spec.server_template_name and not template_catalog.template_catalog.contains(spec.server_template_name):
+            raise HTTPException(status_code=400, detail=f"Server template '{spec.server_template_name}' not found.")
+
+    submission = await bulk.submit_batch(bulk_request.decks, bulk_request.batch_id)
+    return {**submission, "status_url": app.url_path_for("get_bulk_status", batch_id=submission["batch_id"])}
+
+
+@app.get("/bulk/{batch_id}")
+async def get_bulk_status(batch_id: str):
+    status = await bulk.batch_status(batch_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+    return status
+
+
 @app.get("/status/{job_id}")
 async def get_job_status(job_id: str):
-    job = JOB_STORE.get(job_id)
-    if not job:
+    queued_job = await job_queue.job_queue.get(job_id)
+    if not queued_job:
         raise HTTPException(status_code=404, detail="Job not found.")
+    job = {**(queued_job["progress"] or {}), "status": queued_job["status"]}
+    if job["status"] == job_queue.FAILED and not job.get("error_detail"):
+        job["error_detail"] = queued_job.get("error")
     
     status_data = {"job_id": job_id, "status": job["status"], "message": job.get("message")}
+    for progress_key in ("slides_total", "slides_generated", "slides_rendered", "time_to_first_slide", "slides"):
+        if progress_key in job:
+            status_data[progress_key] = job[progress_key]
     if job["status"] == "completed":
         filename = job.get("filename")
         if filename:
              status_data["download_url"] = app.url_path_for("download_file", filename=filename)
     elif job["status"] == "failed":
-        status_data["error"] = job.get("error_detail", "Unknown error")
+        status_data["error_detail"] = job.get("error_detail", "Unknown error")
         
     return schemas.JobStatus(**status_data)
 
 
+@app.get("/stats/llm-cache")
+async def get_llm_cache_stats():
+    return {
+        **llm_cache.llm_response_cache.stats(),
+        "single_flight": llm_integrations.single_flight_stats(),
+    }
+
+
+@app.get("/stats/llm-rate-limits")
+async def get_llm_rate_limit_stats():
+    return llm_integrations.rate_limiter_stats()
+
+
+@app.get("/stats/llm-latency")
+async def get_llm_latency_stats():
+    return llm_metrics.metrics_snapshot()
+
+
+@app.get("/stats/llm-circuit-breakers")
+async def get_llm_circuit_breaker_stats():
+    return llm_integrations.circuit_breaker_stats()
+
+
+@app.get("/stats/jobs")
+async def get_job_queue_stats():
+    active_counts = await job_queue.job_queue.active_counts()
+    return {
+        "counts": await job_queue.job_queue.counts(),
+        "queue_depth": active_counts["queued"],
+        "bulk_jobs_active": active_counts["batch_active"],
+        **(await job_queue.job_queue.wait_stats()),
+        "heading_requests": admission.heading_limiter.stats(),
+    }
+
+
+@app.get("/stats/template-cache")
+async def get_template_cache_stats():
+    return {
+        **template_cache.template_cache.stats(),
+        "theme_variants": theme_variants.variant_stats(),
+        "catalog": template_catalog.template_catalog.stats(),
+    }
+
+
+@app.get("/stats/uploads")
+async def get_upload_store_stats():
+    return await upload_store.upload_store.stats()
+
+
+@app.get("/stats/speculation")
+async def get_speculation_stats():
+    return speculation.speculation_stats()
+
+
+@app.get("/stats/deck-output")
+async def get_deck_output_stats():
+    return {"mode": settings.DECK_OUTPUT_MODE, **deck_output.deck_results.stats(), "deck_cache": deck_cache.deck_cache_stats()}
+
+
 @app.get("/download/{filename}")
-async def download_file(filename: str, background_tasks: BackgroundTasks):
+async def download_file(filename: str, request: Request):
+    """Streams a deck from the in-memory result store or from disk; supports ETag and Range (resumable downloads)."""
+    deck = deck_output.deck_results.get(filename)
+    if deck is not None:
+        deck_output.deck_results.mark_downloaded(filename)
+        return deck_output.deck_response(request, filename, deck=deck)
+
     file_path = settings.GENERATED_PPTS_DIR / filename
-    if not file_path.exists():
+    if not file_path.is_file():
         raise HTTPException(status_code=404, detail="File not found or expired.")
-    
-    # Schedule cleanup after download is initiated
-    background_tasks.add_task(cleanup_file, file_path, settings.GENERATED_PPT_TTL_SECONDS)
-    
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type='application/vnd.openxmlformats-officedocument.presentationml.presentation'
-    )
+    # Deleted DECK_OUTPUT_MAX_AGE_SECONDS after the job completed (scheduled by the job)
+    return deck_output.deck_response(request, filename, path=file_path)
 
 # Placeholder for __init__.py
 # app/__init__.py
@@ -0,0 +1,288 @@
+# app/pptx_stream_writer.py
+"""
+Low-memory writer for text-only decks. Instead of building the whole
+python-pptx object tree and writing the zip at save(), every slide is
+rendered to XML and written into the output zip as soon as it is added.
+Masters, layouts, theme and media parts are copied from the template
+unchanged; only presentation.xml, its relationships and [Content_Types].xml
+are rewritten, at close(). Memory stays flat in the number of slides.
+"""
+import re
+import shutil
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Optional, Dict, List, Tuple, Callable, Union, BinaryIO
+from xml.sax.saxutils import escape, quoteattr
+
+NS = {
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+RT_SLIDE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide"
+RT_SLIDE_LAYOUT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/slideLayout"
+RT_OFFICE_DOCUMENT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+CT_SLIDE = "application/vnd.openxmlformats-officedocument.presentationml.slide+xml"
+
+# Characters XML 1.0 does not allow, even escaped
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# Same fallback text box as add_slide_with_content (EMU of 1in/1.5in/8.5in/5.5in)
+_FALLBACK_TEXTBOX_XFRM = (914400, 1371600, 7772400, 5029200)
+
+
+def default_template_path() -> Path:
+    """python-pptx's built-in template, used by Presentation() with no file."""
+    import pptx
+    return Path(pptx.__file__).parent / "templates" / "default.pptx"
+
+
+def _text(value: str) -> str:
+    return escape(_INVALID_XML_CHARS.sub("", value))
+
+
+def _resolve_target(source_part: str, target: str) -> str:
+    """Zip member name of a relationship target, relative to `source_part`."""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def _rels_name(part_name: str) -> str:
+    return posixpath.join(posixpath.dirname(part_name), "_rels", posixpath.basename(part_name) + ".rels")
+
+
+def _relationships(zin: zipfile.ZipFile, part_name: str) -> List[ET.Element]:
+    try:
+        return ET.fromstring(zin.read(_rels_name(part_name))).findall("rel:Relationship", NS)
+    except KeyError:
+        return []
+
+
+class StreamingDeckWriter:
+    """
+    Usage:
+        with StreamingDeckWriter(template_path, output_path, layout_index) as writer:
+            writer.add_slide(title, content)
+    Not thread-safe; call from one thread at a time. Slides already in the
+    template are kept, like Presentation(template) does. `output_path` may
+    also be a seekable binary file (e.g. a spooled buffer), left open.
+    """
+    def __init__(self, template_path: Optional[Path], output_path: Union[Path, BinaryIO], layout_index: int):
+        self.template_path = template_path or default_template_path()
+        self.output_path = output_path
+        self._zin = zipfile.ZipFile(self.template_path)
+        self._zout = zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_DEFLATED)
+        self._closed = False
+        self._new_slides: List[Tuple[str, int, str]] = [] # (part name, sldId, rId)
+        try:
+            self._read_package()
+            self._layout_part, self._layout_placeholders = self._resolve_layout(layout_index)
+            self._copy_template_parts()
+        except BaseException:
+            self.abort()
+            raise
+
+    # --- Template package ---
+    def _read_package(self):
+        root_rels = ET.fromstring(self._zin.read("_rels/.rels")).findall("rel:Relationship", NS)
+        self._presentation_part = next(
+            _resolve_target("", rel.get("Target")) for rel in root_rels if rel.get("Type") == RT_OFFICE_DOCUMENT
+        )
+        self._presentation_xml = self._zin.read(self._presentation_part).decode("utf-8")
+        self._presentation_rels_name = _rels_name(self._presentation_part)
+        self._presentation_rels_xml = self._zin.read(self._presentation_rels_name).decode("utf-8")
+        self._content_types_xml = self._zin.read("[Content_Types].xml").decode("utf-8")
+
+        presentation_rels = _relationships(self._zin, self._presentation_part)
+        self._presentation_targets = {rel.get("Id"): rel.get("Target") for rel in presentation_rels}
+        self._slides_dir = posixpath.join(posixpath.dirname(self._presentation_part), "slides")
+        slide_name = re.compile(re.escape(self._slides_dir) + r"/slide(\d+)\.xml$")
+        existing_numbers = [int(m.group(1)) for m in map(slide_name.match, self._zin.namelist()) if m]
+        self._next_slide_number = max(existing_numbers, default=0) + 1
+        presentation = ET.fromstring(self._presentation_xml)
+        existing_ids = [int(el.get("id")) for el in presentation.iterfind("p:sldIdLst/p:sldId", NS)]
+        self._next_slide_id = max(existing_ids, default=255) + 1
+        self._next_rel_number = 1
+
+    def _resolve_layout(self, layout_index: int) -> Tuple[str, Dict[int, Dict[str, str]]]:
+        """Part name and placeholders ({idx: ph attributes}) of the first master's layout #layout_index."""
+        presentation = ET.fromstring(self._presentation_xml)
+        master_rid = presentation.find("p:sldMasterIdLst/p:sldMasterId", NS).get(f"{{{NS['r']}}}id")
+        master_part = _resolve_target(self._presentation_part, self._presentation_targets[master_rid])
+        master = ET.fromstring(self._zin.read(master_part))
+        master_targets = {rel.get("Id"): rel.get("Target") for rel in _relationships(self._zin, master_part)}
+        layout_rids = [el.get(f"{{{NS['r']}}}id") for el in master.iterfind("p:sldLayoutIdLst/p:sldLayoutId", NS)]
+        if not layout_rids:
+            raise ValueError(f"Template {self.template_path} has no slide layouts.")
+        if not 0 <= layout_index < len(layout_rids):
+            layout_index = 0
+        layout_part = _resolve_target(master_part, master_targets[layout_rids[layout_index]])
+
+        placeholders = {}
+        for ph in ET.fromstring(self._zin.read(layout_part)).iterfind(".//p:nvPr/p:ph", NS):
+            placeholders[int(ph.get("idx", "0"))] = {key: value for key, value in ph.attrib.items() if key in ("type", "idx", "orient", "sz")}
+        return layout_part, placeholders
+
+    def _copy_template_parts(self):
+        rewritten = {self._presentation_part, self._presentation_rels_name, "[Content_Types].xml"}
+        for info in self._zin.infolist():
+            if info.filename in rewritten:
+                continue
+            # Keep each part's compression (media is usually stored, not deflated again)
+            target_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+            target_info.compress_type = info.compress_type
+            with self._zin.open(info) as source, self._zout.open(target_info, "w") as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+
+    # --- Slides ---
+    def _placeholder_xml(self, shape_id: int, name: str, ph: Dict[str, str], paragraphs: List[str]) -> str:
+        ph_attrs = "".join(f" {key}={quoteattr(value)}" for key, value in ph.items())
+        body = "".join(
+            f'<a:p><a:r><a:rPr lang="en-US" dirty="0"/><a:t>{_text(line)}</a:t></a:r></a:p>' if line else "<a:p/>"
+            for line in paragraphs
+        ) or "<a:p/>"
+        return (
+            f'<p:sp><p:nvSpPr><p:cNvPr id="{shape_id}" name={quoteattr(name)}/><p:cNvSpPr><a:spLocks noGrp="1"/></p:cNvSpPr>'
+            f"<p:nvPr><p:ph{ph_attrs}/></p:nvPr></p:nvSpPr><p:spPr/>"
+            f"<p:txBody><a:bodyPr/><a:lstStyle/>{body}</p:txBody></p:sp>"
+        )
+
+    def _textbox_xml(self, shape_id: int, text: str) -> str:
+        x, y, cx, cy = _FALLBACK_TEXTBOX_XFRM
+        body = "".join(f'<a:p><a:r><a:rPr lang="en-US" dirty="0"/><a:t>{_text(line)}</a:t></a:r></a:p>' for line in text.split("\n"))
+        return (
+            f'<p:sp><p:nvSpPr><p:cNvPr id="{shape_id}" name="TextBox {shape_id - 1}"/><p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>'
+            f'<p:spPr><a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm><a:prstGeom prst="rect"><a:avLst/></a:prstGeom>'
+            f'<a:noFill/></p:spPr><p:txBody><a:bodyPr wrap="square"><a:spAutoFit/></a:bodyPr><a:lstStyle/>{body}</p:txBody></p:sp>'
+        )
+
+    def _title_placeholder(self, title_idx: Optional[int]) -> Optional[Dict[str, str]]:
+        if title_idx is not None and title_idx in self._layout_placeholders:
+            return self._layout_placeholders[title_idx]
+        return next((ph for ph in self._layout_placeholders.values() if ph.get("type") in ("title", "ctrTitle")), None)
+
+    def _body_placeholder(self, body_idx: Optional[int]) -> Optional[Dict[str, str]]:
+        if body_idx is not None and body_idx in self._layout_placeholders:
+            return self._layout_placeholders[body_idx]
+        return next((ph for ph in self._layout_placeholders.values() if ph.get("type", "obj") in ("body", "obj")), None)
+
+    def add_slide(self, title_text: str, content_text: str, placeholder_map: Optional[Dict[str, int]] = None):
+        """Renders one title + text slide and writes it to the output immediately."""
+        placeholder_map = placeholder_map or {}
+        title_ph = self._title_placeholder(placeholder_map.get("title"))
+        body_ph = self._body_placeholder(placeholder_map.get("content"))
+
+        shapes = []
+        if title_ph is not None:
+            shapes.append(self._placeholder_xml(len(shapes) + 2, "Title 1", title_ph, [title_text]))
+        else:
+            print(f"Warning: No title placeholder found or assignable on slide for '{title_text}'.")
+        if body_ph is not None:
+            shapes.append(self._placeholder_xml(len(shapes) + 2, "Content Placeholder 2", body_ph, content_text.split("\n")))
+        else:
+            shapes.append(self._textbox_xml(len(shapes) + 2, content_text))
+
+        slide_xml = (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<p:sld xmlns:a="{NS["a"]}" xmlns:r="{NS["r"]}" xmlns:p="{NS["p"]}"><p:cSld><p:spTree>'
+            '<p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr><p:grpSpPr/>'
+            f'{"".join(shapes)}</p:spTree></p:cSld><p:clrMapOvr><a:masterClrMapping/></p:clrMapOvr></p:sld>'
+        )
+        slide_part = posixpath.join(self._slides_dir, f"slide{self._next_slide_number}.xml")
+        layout_target = posixpath.relpath(self._layout_part, posixpath.dirname(slide_part))
+        slide_rels_xml = (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{NS["rel"]}"><Relationship Id="rId1" Type="{RT_SLIDE_LAYOUT}" Target="{layout_target}"/></Relationships>'
+        )
+        self._zout.writestr(slide_part, slide_xml)
+        self._zout.writestr(_rels_name(slide_part), slide_rels_xml)
+
+        self._new_slides.append((slide_part, self._next_slide_id, self._new_rel_id()))
+        self._next_slide_number += 1
+        self._next_slide_id += 1
+
+    def _new_rel_id(self) -> str:
+        while f"rId{self._next_rel_number}" in self._presentation_targets:
+            self._next_rel_number += 1
+        rel_id = f"rId{self._next_rel_number}"
+        self._presentation_targets[rel_id] = None
+        return rel_id
+
+    # --- Package parts that list the slides (written last) ---
+    def _write_index_parts(self):
+        presentation_dir = posixpath.dirname(self._presentation_part)
+        sld_ids = "".join(f'<p:sldId id="{sld_id}" r:id="{rel_id}"/>' for _, sld_id, rel_id in self._new_slides)
+        presentation_xml = self._presentation_xml
+        if "<p:sldIdLst>" in presentation_xml:
+            presentation_xml = presentation_xml.replace("</p:sldIdLst>", f"{sld_ids}</p:sldIdLst>", 1)
+        elif "<p:sldIdLst/>" in presentation_xml:
+            presentation_xml = presentation_xml.replace("<p:sldIdLst/>", f"<p:sldIdLst>{sld_ids}</p:sldIdLst>", 1)
+        elif sld_ids:
+            # Schema order: sldMasterIdLst, notesMasterIdLst?, handoutMasterIdLst?, sldIdLst?
+            anchor = max(
+                (presentation_xml.find(tag) + len(tag) for tag in ("</p:sldMasterIdLst>", "</p:notesMasterIdLst>", "</p:handoutMasterIdLst>")
+                 if tag in presentation_xml),
+                default=-1
+            )
+            if anchor < 0:
+                raise ValueError("Template presentation.xml has no p:sldMasterIdLst.")
+            presentation_xml = f"{presentation_xml[:anchor]}<p:sldIdLst>{sld_ids}</p:sldIdLst>{presentation_xml[anchor:]}"
+
+        rels = "".join(
+            f'<Relationship Id="{rel_id}" Type="{RT_SLIDE}" Target="{posixpath.relpath(part, presentation_dir)}"/>'
+            for part, _, rel_id in self._new_slides
+        )
+        presentation_rels_xml = self._presentation_rels_xml.replace("</Relationships>", f"{rels}</Relationships>", 1)
+        overrides = "".join(f'<Override PartName="/{part}" ContentType="{CT_SLIDE}"/>' for part, _, _ in self._new_slides)
+        content_types_xml = self._content_types_xml.replace("</Types>", f"{overrides}</Types>", 1)
+
+        self._zout.writestr(self._presentation_part, presentation_xml)
+        self._zout.writestr(self._presentation_rels_name, presentation_rels_xml)
+        self._zout.writestr("[Content_Types].xml", content_types_xml)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._write_index_parts()
+        finally:
+            self._zout.close()
+            self._zin.close()
+
+    def abort(self):
+        """Closes without finishing the deck and deletes the partial output file."""
+        self._closed = True
+        self._zout.close()
+        self._zin.close()
+        if isinstance(self.output_path, Path):
+            self.output_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def build_and_save_presentation_streaming(
+    template_path: Optional[Path],
+    layout_index: int,
+    slides: List[Tuple[str, str]],
+    output_path: Path,
+    placeholder_maps: Optional[Dict[int, Dict[str, int]]] = None,
+    progress_callback: Optional[Callable[[int, int, str], None]] = None
+):
+    """Streaming counterpart of pptx_utils.build_and_save_presentation. Blocking; picklable arguments."""
+    with StreamingDeckWriter(template_path, output_path, layout_index) as writer:
+        for i, (title_text, content_text) in enumerate(slides):
+            writer.add_slide(title_text, content_text, placeholder_maps.get(i) if placeholder_maps else None)
+            if progress_callback:
+                progress_callback(i + 1, len(slides), title_text)
@@ -2,12 +2,18 @@
 from pptx import Presentation
 from pptx.util import Inches, Pt
 from pptx.dml.color import RGBColor
-from pptx.enum.shapes import MSO_SHAPE
 from pptx.enum.dml import MSO_THEME_COLOR
 from pathlib import Path
-from typing import List, Optional, Tuple, Dict
+from typing import List, Optional, Tuple, Dict, Callable
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import os
+import shutil
 
 from .config import settings
+from .template_cache import template_cache
+from . import template_index, theme_variants
+from .pptx_stream_writer import build_and_save_presentation_streaming
 
 VIBGYOR_COLORS = {
     "violet": (148, 0, 211), "indigo": (75, 0, 130), "blue": (0, 0, 255),
@@ -29,39 +35,6 @@ def parse_theme_color(color_str: Optional[str]) -> Optional[RGBColor]:
         print(f"Warning: Invalid theme color '{color_str}'.")
         return None
 
-def apply_theme_color_to_master(prs: Presentation, color: Optional[RGBColor]):
-    if not color:
-        return
-    try:
-        # This is a simplistic approach; real theme application is more complex.
-        # Attempting to change the background of the first master's first layout.
-        master = prs.slide_masters[0]
-        
-        # Try to change accent1 color (often used for titles or main elements)
-        # This requires a deeper understanding of OOXML and python-pptx theme manipulation.
-        # For a simple background color change of a common shape:
-        if master.slide_layouts:
-            first_layout = master.slide_layouts[0]
-            if first_layout.shapes and hasattr(first_layout.shapes[0], 'fill'):
-                 # Check if it's a background shape or a common large shape
-                if first_layout.shapes[0].name.lower().startswith("background") or \
-                   (first_layout.shapes[0].width > prs.slide_width * 0.8 and first_layout.shapes[0].height > prs.slide_height * 0.8) :
-                    try:
-                        fill = first_layout.shapes[0].fill
-                        fill.solid()
-                        fill.fore_color.rgb = color
-                        print(f"Applied theme color to master's first layout shape.")
-                    except Exception as e:
-                        print(f"Could not apply color to specific shape: {e}")
-
-        # A more robust way would be to modify theme.xml, which python-pptx has limited direct support for.
-        # For now, we'll print a message if a more complex theme change is needed.
-        print("Note: Advanced theme color changes might require manual template modification or deeper XML manipulation.")
-
-    except Exception as e:
-        print(f"Error applying theme color to master: {e}")
-
-
 def add_slide_with_content(
     prs: Presentation,
     title_text: str,
@@ -80,16 +53,16 @@ def add_slide_with_content(
     title_placeholder = None
     content_placeholder = None
 
-    if placeholder_map:
+    if placeholder_map: # Values are placeholder idx values (see template_index)
         title_ph_idx = placeholder_map.get("title")
         content_ph_idx = placeholder_map.get("content")
         try:
-            if title_ph_idx is not None and len(slide.placeholders) > title_ph_idx:
+            if title_ph_idx is not None:
                 title_placeholder = slide.placeholders[title_ph_idx]
-            if content_ph_idx is not None and len(slide.placeholders) > content_ph_idx:
+            if content_ph_idx is not None:
                 content_placeholder = slide.placeholders[content_ph_idx]
-        except IndexError:
-            print("Warning: Provided placeholder index in map is out of bounds.")
+        except KeyError:
+            print("Warning: Provided placeholder index in map is not on this layout.")
     
     # Fallback to default title and first body placeholder if map fails or not provided
     if not title_placeholder:
@@ -142,10 +115,121 @@ def add_slide_with_content(
     return slide
 
 
-def list_server_templates() -> List[str]:
-    if settings.SERVER_TEMPLATES_DIR.exists():
-        return sorted([f.name for f in settings.SERVER_TEMPLATES_DIR.glob("*.pptx")])
-    return []
+def themed_template_path(template_path: Optional[Path], theme_color: Optional[str]) -> Optional[Path]:
+    """
+    The template to build from: the cached theme variant for `theme_color`
+    (see theme_variants), else the template itself. Blocking.
+    """
+    if template_path and not template_path.exists():
+        template_path = None
+    theme_rgb_color = parse_theme_color(theme_color)
+    if not theme_rgb_color:
+        return template_path
+    return theme_variants.get_theme_variant(template_path, str(theme_rgb_color))
+
+
+def load_presentation(template_path: Optional[Path], theme_color: Optional[str]) -> Presentation:
+    """Opens the template (or a blank deck) in the theme color. Blocking."""
+    template_path = themed_template_path(template_path, theme_color)
+    if template_path:
+        return template_cache.open_presentation(template_path) # No disk read or re-hash for known templates
+    return Presentation() # Create new if no valid template
+
+
+def build_and_save_presentation(
+    template_path: Optional[Path],
+    theme_color: Optional[str],
+    slides: List[Tuple[str, str]],
+    output_path: Path,
+    placeholder_map: Optional[Dict[int, Dict[str, int]]] = None,
+    progress_callback: Optional[Callable[[int, int, str], None]] = None
+):
+    """
+    Loads the template, applies the theme color, adds one slide per (title, content)
+    pair and saves to `output_path`. Blocking and CPU/disk heavy: run it through
+    run_in_pptx_executor(). Arguments stay picklable so a process pool can run it.
+    Large decks go through the streaming writer instead (see use_streaming_writer).
+    """
+    # Precomputed by template analysis, so slides don't probe layouts one by one
+    content_slide_layout_idx, default_placeholder_map = template_index.slide_mapping(template_path)
+    if use_streaming_writer(len(slides)):
+        build_and_save_presentation_streaming(
+            themed_template_path(template_path, theme_color),
+            content_slide_layout_idx,
+            slides,
+            output_path,
+            {i: (placeholder_map.get(i) if placeholder_map else None) or default_placeholder_map for i in range(len(slides))},
+            progress_callback
+        )
+        return
+
+    prs = load_presentation(template_path, theme_color)
+
+    for i, (title_text, content_text) in enumerate(slides):
+        add_slide_with_content(
+            prs,
+            title_text=title_text,
+            content_text=content_text,
+            slide_layout_idx=content_slide_layout_idx,
+            placeholder_map=(placeholder_map.get(i) if placeholder_map else None) or default_placeholder_map
+        )
+        if progress_callback:
+            progress_callback(i + 1, len(slides), title_text)
+
+    prs.save(output_path)
+
+
+def use_streaming_writer(num_slides: int) -> bool:
+    """
+    Whether to write the deck with pptx_stream_writer (memory flat in slide
+    count) rather than python-pptx (whole deck in memory until save).
+    """
+    if settings.PPTX_WRITER == "streaming":
+        return True
+    if settings.PPTX_WRITER == "auto":
+        return num_slides >= settings.PPTX_STREAMING_MIN_SLIDES
+    return False
+
+
+# --- Executor for blocking python-pptx work ---
+_PPTX_EXECUTOR: Optional[Executor] = None
+
+def get_pptx_executor() -> Executor:
+    global _PPTX_EXECUTOR
+    if _PPTX_EXECUTOR is None:
+        if settings.PPTX_EXECUTOR == "process":
+            _PPTX_EXECUTOR = ProcessPoolExecutor(max_workers=settings.PPTX_EXECUTOR_WORKERS)
+        else:
+            _PPTX_EXECUTOR = ThreadPoolExecutor(max_workers=settings.PPTX_EXECUTOR_WORKERS, thread_name_prefix="pptx")
+    return _PPTX_EXECUTOR
+
+def pptx_executor_is_process_pool() -> bool:
+    return isinstance(get_pptx_executor(), ProcessPoolExecutor)
+
+async def run_in_pptx_executor(func: Callable, *args):
+    """Runs blocking python-pptx work off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(get_pptx_executor(), func, *args)
+
+def shutdown_pptx_executor():
+    global _PPTX_EXECUTOR
+    if _PPTX_EXECUTOR is not None:
+        _PPTX_EXECUTOR.shutdown(wait=True)
+        _PPTX_EXECUTOR = None
+
+
+async def cleanup_file(file_path: Path, delay: int):
+    """Deletes a file (or directory tree) after `delay` seconds."""
+    await asyncio.sleep(delay)
+    try:
+        if file_path.is_dir():
+            shutil.rmtree(file_path)
+            print(f"Cleaned up {file_path}")
+        elif file_path.exists():
+            os.remove(file_path)
+            print(f"Cleaned up {file_path}")
+    except Exception as e:
+        print(f"Error cleaning up file {file_path}: {e}")
+
 
 def get_template_path(template_choice: str, uploaded_template_path: Optional[str]) -> Optional[Path]:
     if template_choice == "upload":
@@ -154,27 +238,4 @@ def get_template_path(template_choice: str, uploaded_template_path: Optional[str
         return None # Should have been caught earlier if file doesn't exist
     else: # Server template
         path = settings.SERVER_TEMPLATES_DIR / template_choice
-        return path if path.exists() else None
-        
-def count_text_placeholders(prs: Presentation, layout_idx: int = 1) -> Dict[str, int]:
-    """Counts title and body/content placeholders for a given layout."""
-    counts = {"title": 0, "content_body": 0, "other": 0, "total_placeholders":0}
-    if layout_idx >= len(prs.slide_layouts):
-        return counts
-        
-    layout = prs.slide_layouts[layout_idx]
-    counts["total_placeholders"] = len(layout.placeholders)
-    
-    for ph in layout.placeholders:
-        if ph.is_placeholder: # Redundant check, but good practice
-            if ph.name.lower().startswith("title") or ph.placeholder_format.type == MSO_SHAPE.TITLE:
-                counts["title"] +=1
-            # Placeholder type for content can vary; common ones are BODY, CONTENT, OBJECT
-            elif ph.name.lower().startswith("content") or \
-                 ph.name.lower().startswith("text") or \
-                 ph.name.lower().startswith("body") or \
-                 ph.placeholder_format.type in [MSO_SHAPE.BODY, MSO_SHAPE.CONTENT, MSO_SHAPE.OBJECT, MSO_SHAPE.TEXT_BOX]:
-                counts["content_body"] +=1
-            else:
-                counts["other"] +=1
-    return counts
\ No newline at end of file
+        return path if path.is_file() else None
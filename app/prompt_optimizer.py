@@ -17,22 +17,8 @@ def optimize_slide_content_prompt(
     content_format: str = "bullet_points", # "bullet_points", "summary", "paragraph"
     max_tokens: int = 250
 ) -> str:
-    
-    format_instruction = ""
-    if content_format == "bullet_points":
-        format_instruction = "Present the key information as concise bullet points (3-5 points typically). Each bullet point should be on a new line, starting with a hyphen or asterisk."
-    elif content_format == "summary":
-        format_instruction = f"Provide a brief summary of the key information, approximately {max_tokens // 20}-{max_tokens // 15} sentences long." # Rough estimate
-    elif content_format == "paragraph":
-        format_instruction = f"Write a detailed paragraph. Aim for around {max_tokens} tokens."
-
-    style_instruction = ""
-    if style_tone == "formal":
-        style_instruction = "Use a formal and professional tone."
-    elif style_tone == "casual":
-        style_instruction = "Use a casual and conversational tone."
-    elif style_tone == "academic":
-        style_instruction = "Use an academic tone, citing information if it were from a source (though you don't need to invent sources here)."
+    format_instruction = _format_instruction(content_format, max_tokens)
+    style_instruction = _style_instruction(style_tone)
     
     prompt = (
         f"For a PowerPoint slide titled '{heading}' within a presentation about '{main_topic}':\n"
@@ -45,10 +31,54 @@ def optimize_slide_content_prompt(
     )
     return prompt
 
+def _format_instruction(content_format: str, max_tokens: int) -> str:
+    if content_format == "bullet_points":
+        return "Present the key information as concise bullet points (3-5 points typically). Each bullet point should be on a new line, starting with a hyphen or asterisk."
+    elif content_format == "summary":
+        return f"Provide a brief summary of the key information, approximately {max_tokens // 20}-{max_tokens // 15} sentences long." # Rough estimate
+    elif content_format == "paragraph":
+        return f"Write a detailed paragraph. Aim for around {max_tokens} tokens."
+    return ""
+
+
+def _style_instruction(style_tone: str) -> str:
+    if style_tone == "formal":
+        return "Use a formal and professional tone."
+    elif style_tone == "casual":
+        return "Use a casual and conversational tone."
+    elif style_tone == "academic":
+        return "Use an academic tone, citing information if it were from a source (though you don't need to invent sources here)."
+    return ""
+
+
+def optimize_deck_content_prompt(
+    headings: List[str],
+    main_topic: str,
+    style_tone: str = "neutral",
+    content_format: str = "bullet_points",
+    max_tokens: int = 250
+) -> str:
+    """
+    Single prompt asking for the content of several slides at once as JSON, so the
+    topic, tone and format instructions are sent once per deck instead of once per slide.
+    """
+    numbered_headings = "\n".join(f"{i+1}. {heading}" for i, heading in enumerate(headings))
+    return (
+        f"You are writing the body content for {len(headings)} PowerPoint slides in a presentation about '{main_topic}'.\n"
+        f"Slide titles:\n{numbered_headings}\n"
+        f"For every slide: {_format_instruction(content_format, max_tokens)}\n"
+        f"{_style_instruction(style_tone)}\n"
+        f"Keep each slide's content within approximately {max_tokens} tokens, informative and directly relevant to its title. "
+        f"Do not repeat the title in the content.\n"
+        f'Respond with JSON only, no other text, in exactly this shape: {{"slides": [{{"index": 1, "content": "..."}}, ...]}} '
+        f"with one entry per slide title, using the slide numbers above as index."
+    )
+
+
 def count_tokens_simple(text: str) -> int:
     """
     A very basic placeholder for token counting.
-    Real token counting requires the specific tokenizer for the LLM being used.
-    This is a rough estimate (words + punctuation).
+    Real token counting requires the specific tokenizer for the LLM being used,
+    see token_counter.count_tokens. This is a rough estimate (words + punctuation).
     """
     return len(text.split()) + text.count(',') + text.count('.') # very naive
\ No newline at end of file
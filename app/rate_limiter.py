@@ -0,0 +1,164 @@
+# app/rate_limiter.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate_per_minute`."""
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate_per_minute = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_minute / 60.0)
+        self.updated_at = now
+
+    def set_rate(self, rate_per_minute: float):
+        """New refill rate; the capacity (one minute's worth) scales with it."""
+        self._refill()
+        self.rate_per_minute = float(rate_per_minute)
+        self.capacity = float(rate_per_minute)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def drain(self):
+        """Empties the bucket, so the next request waits for a refill."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity) # A single oversized request must not wait forever
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / max(self.rate_per_minute, 1e-6)
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class ProviderRateLimiter:
+    """
+    Requests/min and tokens/min token buckets plus a concurrency limit for one
+    LLM provider. Limits shrink multiplicatively on 429s and grow back
+    additively on successes (AIMD). Callers wait in FIFO order instead of failing.
+    """
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_concurrency: int,
+        min_fraction: float = 0.1,
+        recovery_step: float = 0.05
+    ):
+        self.base_requests_per_minute = requests_per_minute
+        self.base_tokens_per_minute = tokens_per_minute
+        self.base_max_concurrency = max_concurrency
+        self.min_fraction = min_fraction
+        self.recovery_step = recovery_step
+
+        self.multiplier = 1.0
+        self.paused_until = 0.0 # time.monotonic() deadline from Retry-After
+        self.in_flight = 0
+        self.queued = 0
+        self.rate_limited_count = 0
+
+        self._request_bucket = TokenBucket(requests_per_minute)
+        self._token_bucket = TokenBucket(tokens_per_minute)
+        self._permit_lock = asyncio.Lock() # Serialises bucket waits so callers queue in order
+        self._slots = asyncio.Condition()
+
+    @property
+    def max_concurrency(self) -> int:
+        return max(1, int(self.base_max_concurrency * self.multiplier))
+
+    async def _acquire_permit(self, estimated_tokens: int):
+        async with self._permit_lock:
+            while True:
+                wait = max(
+                    self.paused_until - time.monotonic(),
+                    self._request_bucket.delay_for(1),
+                    self._token_bucket.delay_for(estimated_tokens),
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self._request_bucket.consume(1)
+            self._token_bucket.consume(estimated_tokens)
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int = 0):
+        """Waits for rate budget and a concurrency slot, then holds the slot."""
+        self.queued += 1
+        try:
+            await self._acquire_permit(estimated_tokens)
+            async with self._slots:
+                await self._slots.wait_for(lambda: self.in_flight < self.max_concurrency)
+                self.in_flight += 1
+        finally:
+            self.queued -= 1
+        try:
+            yield
+        finally:
+            async with self._slots:
+                self.in_flight -= 1
+                self._slots.notify_all()
+
+    def _apply_multiplier(self):
+        self._request_bucket.set_rate(self.base_requests_per_minute * self.multiplier)
+        self._token_bucket.set_rate(self.base_tokens_per_minute * self.multiplier)
+
+    def on_success(self):
+        if self.multiplier < 1.0:
+            self.multiplier = min(1.0, self.multiplier + self.recovery_step)
+            self._apply_multiplier()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        """
+        Halves the limits and drains both buckets, so queued callers wait for a
+        refill at the new rate instead of spending a burst the provider just
+        refused. `retry_after` additionally pauses every caller.
+        """
+        self.rate_limited_count += 1
+        self.multiplier = max(self.min_fraction, self.multiplier / 2)
+        self._apply_multiplier()
+        self._request_bucket.drain()
+        self._token_bucket.drain()
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests_per_minute": self._request_bucket.rate_per_minute,
+            "tokens_per_minute": self._token_bucket.rate_per_minute,
+            "max_concurrency": self.max_concurrency,
+            "multiplier": round(self.multiplier, 3),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rate_limited_count": self.rate_limited_count,
+            "paused_for_seconds": max(0.0, round(self.paused_until - time.monotonic(), 2)),
+        }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header (delta-seconds or HTTP-date) into seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
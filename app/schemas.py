@@ -1,6 +1,6 @@
 # app/schemas.py
-from pydantic import BaseModel, Field, FilePath, HttpUrl
-from typing import List, Optional, Dict
+from pydantic import BaseModel, Field, FilePath
+from typing import List, Optional, Dict, Any
 from fastapi import UploadFile
 
 class SlideContentRequest(BaseModel):
@@ -41,9 +41,38 @@ class FinalPresentationRequest(BaseModel):
     style_tone: str
     content_format: str
     placeholder_map: Optional[Dict[int, Dict[str, int]]] = None # {slide_idx: {"title": placeholder_idx, "content": placeholder_idx}}
+    use_cache: bool = True # False forces fresh LLM responses for this deck
+    deck_batch_mode: bool = False # Request all slides' content in one structured LLM call
+    main_topic: Optional[str] = None # Topic the headings were generated for
+    pregenerated_contents: Optional[Dict[int, str]] = None # {slide_idx: content} from speculative generation
+    base_job_id: Optional[str] = None # Reuse unchanged slides from this earlier job's manifest
 
 class JobStatus(BaseModel):
     job_id: str
     status: str
     message: Optional[str] = None
-    download_url: Optional[HttpUrl] = None
\ No newline at end of file
+    download_url: Optional[str] = None # Relative to the app, e.g. /download/<file>
+    error_detail: Optional[str] = None # Failed jobs only
+    slides_total: Optional[int] = None
+    slides_generated: Optional[int] = None
+    slides_rendered: Optional[int] = None
+    time_to_first_slide: Optional[float] = None # Seconds from job start to the first rendered slide
+    slides: Optional[List[Dict[str, Any]]] = None # Per-slide state: pending/streaming/generated/rendered
+
+
+class BulkDeckSpec(BaseModel):
+    main_topic: str
+    num_slides: int = Field(default=5, ge=1, le=10)
+    headings: Optional[List[str]] = None # Skip heading generation and use these
+    server_template_name: Optional[str] = None # Blank presentation if not set
+    theme_color: Optional[str] = None
+    max_tokens_per_slide: int = Field(default=250, ge=50, le=500)
+    style_tone: str = "neutral"
+    content_format: str = "bullet_points"
+    use_cache: bool = True
+    deck_batch_mode: bool = False
+
+class BulkGenerationRequest(BaseModel):
+    decks: List[BulkDeckSpec]
+    batch_id: Optional[str] = None # Resubmitting with the same batch_id only adds missing decks
+
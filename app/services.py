@@ -1,31 +1,38 @@
 # app/services.py
 import asyncio
+import functools
+import json
+import re
+import shutil
 from pathlib import Path
-from typing import List, Dict, Any
-from pptx import Presentation
+from typing import List, Dict, Any, Optional, Callable, Union, BinaryIO
+import time
 import os
 
-from . import schemas, pptx_utils, prompt_optimizer, llm_selector, llm_integrations, config
+from . import schemas, pptx_utils, prompt_optimizer, llm_selector, llm_integrations, config, token_counter, deck_manifest, template_index, pptx_stream_writer, deck_output, deck_cache, upload_store, job_queue
 
 settings = config.settings
 
+# Caps slide LLM calls across every job running in this process
+_GLOBAL_SLIDE_SEMAPHORE = asyncio.Semaphore(settings.SLIDE_CONCURRENCY_GLOBAL)
+
 # --- Helper for Asynchronous Placeholder ---
-async def generate_slide_headings(main_topic: str, num_slides: int) -> List[schemas.SlideHeading]:
+async def generate_slide_headings(main_topic: str, num_slides: int, use_cache: bool = True) -> List[schemas.SlideHeading]:
     """
     Generates slide headings using an LLM.
     """
     prompt = prompt_optimizer.optimize_heading_generation_prompt(main_topic, num_slides)
     
-    # Conceptual: Select and call LLM
-    # For now, using a mock response
-    # llm_api = llm_selector.select_llm_for_task("heading_generation")
-    # raw_headings_text = await llm_api.generate_text(prompt, max_tokens=num_slides * 20) # Rough estimate
-    
     print(f"DEBUG: Heading generation prompt: {prompt}") # For debugging
 
-    # MOCK RESPONSE for headings
-    await asyncio.sleep(0.1) # Simulate network delay
-    raw_headings_text = "\n".join([f"{i+1}. Heading for '{main_topic}' - Part {i+1}" for i in range(num_slides)])
+    if llm_integrations.any_llm_configured():
+        raw_headings_text = await llm_selector.get_llm_response(
+            prompt, max_tokens=num_slides * 20, task_type="heading_generation", use_cache=use_cache # Rough estimate
+        )
+    else:
+        # MOCK RESPONSE for headings
+        await asyncio.sleep(0.1) # Simulate network delay
+        raw_headings_text = "\n".join([f"{i+1}. Heading for '{main_topic}' - Part {i+1}" for i in range(num_slides)])
     
     # Parse headings (assuming LLM returns a numbered list)
     headings = []
@@ -50,21 +57,30 @@ async def generate_content_for_slide(
     main_topic: str,
     style_tone: str,
     content_format: str,
-    max_tokens_per_slide: int
+    max_tokens_per_slide: int,
+    use_cache: bool = True
 ) -> str:
     """
-    Generates content for a single slide.
+    Generates content for a single slide. The prompt is trimmed and the output
+    limit reduced so that prompt + output fit in MAX_TOTAL_TOKENS_GEMINI, and
+    the response is cut to the output limit.
     """
+    prompt_heading = token_counter.truncate_to_tokens(heading, settings.MAX_HEADING_TOKENS)
     prompt = prompt_optimizer.optimize_slide_content_prompt(
-        heading, main_topic, style_tone, content_format, max_tokens_per_slide
+        prompt_heading, main_topic, style_tone, content_format, max_tokens_per_slide
     )
     print(f"DEBUG: Slide content prompt for '{heading}': {prompt}") # For debugging
+    max_output_tokens = max(
+        settings.MIN_TOKENS_PER_SLIDE,
+        min(max_tokens_per_slide, settings.MAX_TOTAL_TOKENS_GEMINI - token_counter.count_tokens(prompt))
+    )
+
+    if llm_integrations.any_llm_configured():
+        slide_content = await llm_selector.get_llm_response(
+            prompt, max_tokens=max_output_tokens, task_type="content_generation", use_cache=use_cache
+        )
+        return token_counter.truncate_to_tokens(slide_content, max_output_tokens)
 
-    # Conceptual: Select and call LLM
-    # For now, using a mock response
-    # llm_api = llm_selector.select_llm_for_task("content_generation")
-    # slide_content = await llm_api.generate_text(prompt, max_tokens=max_tokens_per_slide)
-    
     # MOCK RESPONSE for slide content
     await asyncio.sleep(0.1) # Simulate network delay
     if content_format == "bullet_points":
@@ -73,108 +89,500 @@ async def generate_content_for_slide(
         slide_content = f"This is a brief summary regarding {heading}. It covers the essential aspects derived from the main topic of {main_topic}."
     else: # paragraph
         slide_content = f"This is a detailed paragraph explaining {heading}. It elaborates on the significance of this sub-topic within the broader context of {main_topic}. More information would be filled in here to reach the desired token count, discussing various facets and implications related to '{heading}'."
-    
-    # Simple token truncation for mock (real LLMs handle this)
-    # actual_tokens = prompt_optimizer.count_tokens_simple(slide_content)
-    # if actual_tokens > max_tokens_per_slide:
-    #     words = slide_content.split()
-    #     # This is a very rough way to truncate, real tokenizers are needed
-    #     slide_content = " ".join(words[:max_tokens_per_slide // 2]) + "..." # Approximation
-        
-    return slide_content
+
+    return token_counter.truncate_to_tokens(slide_content, max_output_tokens)
+
+
+# Extra output tokens per slide for the JSON wrapper in deck-batch responses
+DECK_BATCH_JSON_OVERHEAD_TOKENS = 20
+
+def _split_deck_batches(headings: List[str], main_topic: str, style_tone: str, content_format: str, max_tokens_per_slide: int) -> List[List[int]]:
+    """
+    Groups slide indices into batches whose prompt plus expected output stays
+    within MAX_TOTAL_TOKENS_GEMINI.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for i in range(len(headings)):
+        candidate = current + [i]
+        prompt = prompt_optimizer.optimize_deck_content_prompt(
+            [headings[j] for j in candidate], main_topic, style_tone, content_format, max_tokens_per_slide
+        )
+        total_tokens = token_counter.count_tokens(prompt) + len(candidate) * (max_tokens_per_slide + DECK_BATCH_JSON_OVERHEAD_TOKENS)
+        if current and total_tokens > settings.MAX_TOTAL_TOKENS_GEMINI:
+            batches.append(current)
+            current = [i]
+        else:
+            current = candidate
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_deck_batch_response(raw_response: str, num_slides: int) -> List[Optional[str]]:
+    """
+    Extracts per-slide content from a deck-batch JSON response. Slides that are
+    missing, duplicated or malformed come back as None.
+    """
+    contents: List[Optional[str]] = [None] * num_slides
+    text = raw_response.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return contents
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return contents
+
+    slides = data.get("slides") if isinstance(data, dict) else None
+    if not isinstance(slides, list):
+        return contents
+    seen = set()
+    for entry in slides:
+        if not isinstance(entry, dict):
+            continue
+        index, content = entry.get("index"), entry.get("content")
+        if not isinstance(index, int) or not 1 <= index <= num_slides or index in seen:
+            continue
+        if isinstance(content, list): # Some models return bullet points as a list
+            content = "\n".join(f"- {item}" for item in content if isinstance(item, str))
+        if not isinstance(content, str) or not content.strip():
+            continue
+        seen.add(index)
+        contents[index - 1] = content.strip()
+    return contents
+
+
+async def generate_deck_contents_batch(
+    headings: List[str],
+    main_topic: str,
+    style_tone: str,
+    content_format: str,
+    max_tokens_per_slide: int,
+    use_cache: bool = True
+) -> List[Optional[str]]:
+    """
+    Deck-batch mode: asks for many slides' content in one structured LLM call per
+    batch. Returns None for every slide that could not be recovered from the response.
+    """
+    contents: List[Optional[str]] = [None] * len(headings)
+    batches = _split_deck_batches(headings, main_topic, style_tone, content_format, max_tokens_per_slide)
+
+    async def _run_batch(indices: List[int]):
+        batch_headings = [headings[i] for i in indices]
+        prompt = prompt_optimizer.optimize_deck_content_prompt(
+            batch_headings, main_topic, style_tone, content_format, max_tokens_per_slide
+        )
+        try:
+            async with _GLOBAL_SLIDE_SEMAPHORE:
+                raw_response = await llm_selector.get_llm_response(
+                    prompt,
+                    max_tokens=len(indices) * (max_tokens_per_slide + DECK_BATCH_JSON_OVERHEAD_TOKENS),
+                    task_type="content_generation",
+                    use_cache=use_cache
+                )
+        except Exception as e:
+            print(f"Deck-batch generation failed for {len(indices)} slides, falling back to per-slide calls: {e}")
+            return
+        for i, content in zip(indices, parse_deck_batch_response(raw_response, len(indices))):
+            contents[i] = content
+
+    await asyncio.gather(*(_run_batch(indices) for indices in batches))
+    return contents
+
+
+async def generate_contents_for_slides(
+    job_id: str,
+    headings: List[str],
+    main_topic: str,
+    style_tone: str,
+    content_format: str,
+    max_tokens_per_slide: int,
+    job_store: Dict,
+    use_cache: bool = True,
+    deck_batch_mode: bool = False,
+    on_slide_ready: Optional[Callable[[int, str], None]] = None,
+    pregenerated_contents: Optional[Dict[int, str]] = None
+) -> List[str]:
+    """
+    Generates content for all slides concurrently, bounded by a per-job and a
+    global semaphore. Results are returned in heading order, and `on_slide_ready`
+    is called with (index, content) as soon as each slide's content is known.
+    Slides in `pregenerated_contents` (e.g. from speculative generation) are
+    reused as-is. In deck-batch mode the remaining slides are first requested in
+    as few structured calls as possible; only slides missing from those
+    responses get their own call.
+    """
+    total_slides = len(headings)
+    job_semaphore = asyncio.Semaphore(max(1, settings.SLIDE_CONCURRENCY_PER_JOB))
+    completed = 0
+    # Per-slide output limits: the deck's total budget, shifted toward the slides that need more
+    slide_budgets = token_counter.deck_slide_budgets(headings, content_format, max_tokens_per_slide)
+
+    known_contents: List[Optional[str]] = [None] * total_slides
+    for i, content in (pregenerated_contents or {}).items():
+        if 0 <= i < total_slides:
+            known_contents[i] = content
+    missing = [i for i in range(total_slides) if known_contents[i] is None]
+    if deck_batch_mode and missing and llm_integrations.any_llm_configured():
+        job_store[job_id]["message"] = f"Generating content for {len(missing)} slides in deck-batch mode..."
+        batch_contents = await generate_deck_contents_batch(
+            [headings[i] for i in missing], main_topic, style_tone, content_format,
+            max(slide_budgets[i] for i in missing), use_cache
+        )
+        for i, content in zip(missing, batch_contents):
+            if content is not None:
+                known_contents[i] = token_counter.truncate_to_tokens(content, slide_budgets[i])
+    completed = sum(1 for content in known_contents if content is not None)
+    job_store[job_id]["slides_generated"] = completed
+
+    async def _generate(i: int) -> str:
+        nonlocal completed
+        slide_state = _slide_state(job_store, job_id, i)
+        def _on_chunk(chunk: str):
+            # Token streaming progress for this slide (providers with SSE only)
+            if slide_state is not None:
+                slide_state["state"] = "streaming"
+                slide_state["chars_received"] = slide_state.get("chars_received", 0) + len(chunk)
+        def _on_provider(llm_name: str):
+            if slide_state is not None:
+                slide_state["provider"] = llm_name
+        llm_integrations.STREAM_LISTENER.set(_on_chunk) # Scoped to this gather() task
+        llm_integrations.PROVIDER_LISTENER.set(_on_provider)
+
+        async with job_semaphore, _GLOBAL_SLIDE_SEMAPHORE:
+            content = await generate_content_for_slide(
+                headings[i], main_topic, style_tone, content_format, slide_budgets[i], use_cache
+            )
+        completed += 1
+        job_store[job_id]["message"] = f"Generated content for slide {completed}/{total_slides}: {headings[i]}"
+        job_store[job_id]["slides_generated"] = completed
+        return content
+
+    async def _resolve(i: int) -> str:
+        is_new = (pregenerated_contents or {}).get(i) is None
+        content = known_contents[i] if known_contents[i] is not None else await _generate(i)
+        slide_state = _slide_state(job_store, job_id, i)
+        if slide_state is not None:
+            slide_state["state"] = "generated"
+        if on_slide_ready:
+            on_slide_ready(i, content)
+        if is_new:
+            # Durable per-slide checkpoint, so a retried job doesn't pay for this slide again
+            await deck_manifest.deck_manifest_store.checkpoint_slide(
+                job_id, i,
+                deck_manifest.slide_prompt_hash(headings[i], main_topic, style_tone, content_format, max_tokens_per_slide),
+                slide_state.get("provider") if slide_state is not None else None,
+                content
+            )
+        return content
+
+    # gather keeps the input order, so contents line up with headings
+    return list(await asyncio.gather(*(_resolve(i) for i in range(total_slides))))
+
+
+def _slide_state(job_store: Dict, job_id: str, index: int) -> Optional[Dict[str, Any]]:
+    slides = job_store.get(job_id, {}).get("slides")
+    return slides[index] if slides and index < len(slides) else None
+
+
+async def _generate_and_render_streaming(
+    job_id: str,
+    details: schemas.FinalPresentationRequest,
+    template_path: Optional[Path],
+    output_path: Union[Path, BinaryIO],
+    main_topic: str,
+    job_store: Dict
+) -> List[str]:
+    """
+    Producer/consumer pipeline: slide contents are generated concurrently while a
+    renderer adds each slide (in the pptx executor) as soon as its content and
+    all earlier slides are ready, so render time hides behind network time.
+    """
+    total_slides = len(details.final_headings)
+    started_at = time.monotonic()
+    ready_contents: Dict[int, str] = {}
+    content_ready = asyncio.Event()
+
+    def _on_slide_ready(index: int, content: str):
+        ready_contents[index] = content
+        content_ready.set()
+
+    async def _render():
+        layout_idx, default_placeholder_map = await pptx_utils.run_in_pptx_executor(template_index.slide_mapping, template_path)
+        writer = None
+        if pptx_utils.use_streaming_writer(total_slides):
+            # Large deck: each slide goes straight into the output zip
+            themed_template = await pptx_utils.run_in_pptx_executor(pptx_utils.themed_template_path, template_path, details.theme_color)
+            writer = await pptx_utils.run_in_pptx_executor(
+                pptx_stream_writer.StreamingDeckWriter, themed_template, output_path, layout_idx
+            )
+            add_slide = writer.add_slide
+            finish = writer.close
+        else:
+            # Template parsing overlaps with the first LLM calls
+            prs = await pptx_utils.run_in_pptx_executor(pptx_utils.load_presentation, template_path, details.theme_color)
+            add_slide = lambda heading, content, placeholder_map: pptx_utils.add_slide_with_content(prs, heading, content, layout_idx, placeholder_map)
+            finish = functools.partial(prs.save, output_path)
+
+        try:
+            for i, heading in enumerate(details.final_headings):
+                while i not in ready_contents:
+                    content_ready.clear()
+                    await content_ready.wait()
+                # User-defined mapping for this slide, else the template analysis' title/body placeholders
+                current_placeholder_map = (details.placeholder_map.get(i) if details.placeholder_map else None) or default_placeholder_map
+                await pptx_utils.run_in_pptx_executor(add_slide, heading, ready_contents.pop(i), current_placeholder_map)
+                if i == 0:
+                    job_store[job_id]["time_to_first_slide"] = round(time.monotonic() - started_at, 3)
+                job_store[job_id]["slides_rendered"] = i + 1
+                slide_state = _slide_state(job_store, job_id, i)
+                if slide_state is not None:
+                    slide_state["state"] = "rendered"
+                job_store[job_id]["message"] = f"Built slide {i+1}/{total_slides}: {heading}"
+            job_store[job_id]["message"] = "Saving presentation..."
+            await pptx_utils.run_in_pptx_executor(finish)
+        except BaseException:
+            if writer is not None:
+                await pptx_utils.run_in_pptx_executor(writer.abort)
+            raise
+
+    producer = asyncio.create_task(generate_contents_for_slides(
+        job_id,
+        details.final_headings,
+        main_topic,
+        details.style_tone,
+        details.content_format,
+        details.max_tokens_per_slide,
+        job_store,
+        use_cache=details.use_cache,
+        deck_batch_mode=details.deck_batch_mode or settings.DECK_BATCH_MODE,
+        on_slide_ready=_on_slide_ready,
+        pregenerated_contents=details.pregenerated_contents
+    ))
+    renderer = asyncio.create_task(_render())
+    try:
+        slide_contents, _ = await asyncio.gather(producer, renderer)
+        return slide_contents
+    except BaseException:
+        producer.cancel()
+        renderer.cancel()
+        raise
+
+
+async def _store_deck_output(output_path: Path, buffer) -> bool:
+    """
+    Hands a finished in-memory deck to the result store (True), or writes it to
+    `output_path` if it is too big for it (False).
+    """
+    if deck_output.deck_results.put(output_path.name, buffer):
+        return True
+    try:
+        def _spill():
+            buffer.seek(0)
+            with open(output_path, "wb") as f:
+                shutil.copyfileobj(buffer, f)
+        await asyncio.to_thread(_spill)
+    finally:
+        buffer.close()
+    return False
+
+
+def _schedule_upload_cleanup(details: schemas.FinalPresentationRequest):
+    # Schedule cleanup for uploaded template if it was used and is temporary
+    if details.template_choice == "upload" and details.uploaded_template_path:
+        upload_path = Path(details.uploaded_template_path)
+        if upload_store.upload_store.hash_of(upload_path):
+            # Drop this job's reference; the template goes with the last one
+            asyncio.create_task(upload_store.upload_store.release(upload_path, settings.GENERATED_PPT_TTL_SECONDS + 10))
+            return
+        # Ensure it's within a designated temporary upload area before deleting its parent
+        if settings.GENERATED_PPTS_DIR / "uploads" in upload_path.parents:
+             asyncio.create_task(pptx_utils.cleanup_file(upload_path.parent, settings.GENERATED_PPT_TTL_SECONDS + 10)) # Delete the session upload folder
+
+
+async def _check_template(template_path: Optional[Path]):
+    """Raises PermanentJobError if the template can't be built from, before any LLM call is paid for."""
+    try:
+        index = await pptx_utils.run_in_pptx_executor(template_index.get_template_index, template_path)
+    except OSError:
+        raise # Possibly transient (e.g. network storage): worth a retry
+    except Exception as e: # Corrupt package: every attempt would fail the same way
+        raise job_queue.PermanentJobError(f"Template could not be loaded: {e}") from e
+    if not index["layouts"]:
+        raise job_queue.PermanentJobError("Template has no slide layouts.")
+
+
+def _schedule_deck_cleanup(output_path: Path):
+    # Once per job, not per download, so later and resumed downloads still find the deck
+    asyncio.create_task(pptx_utils.cleanup_file(output_path, settings.DECK_OUTPUT_MAX_AGE_SECONDS))
 
 
 async def generate_presentation_slides_async(
     job_id: str,
     details: schemas.FinalPresentationRequest,
     output_path: Path,
-    job_store: Dict
+    job_store: Dict,
+    in_memory: bool = False
 ):
+    """
+    Generates and builds the deck into `output_path`, or with `in_memory` (thread
+    pptx executor only) into a spooled buffer kept in deck_output.deck_results
+    under the same filename. In-memory jobs bypass the (on-disk) deck cache.
+    """
+    output_buffer = None
     try:
         job_store[job_id] = {"status": "processing", "message": "Initializing presentation..."}
         
+        if not details.final_headings:
+            raise job_queue.PermanentJobError("No slide headings given.")
         template_path = pptx_utils.get_template_path(details.template_choice, details.uploaded_template_path)
-
-        if template_path and template_path.exists():
-            prs = Presentation(template_path)
-            job_store[job_id]["message"] = f"Using template: {template_path.name}"
-        else:
-            prs = Presentation() # Create new if no valid template
-            job_store[job_id]["message"] = "No valid template found, creating a new presentation."
+        if not (template_path and template_path.exists()):
+            template_path = None # Builder creates a new presentation
             # (You might want to apply a default slide master or style here for new presentations)
-
-        theme_rgb_color = pptx_utils.parse_theme_color(details.theme_color)
-        if theme_rgb_color:
-            pptx_utils.apply_theme_color_to_master(prs, theme_rgb_color)
-            job_store[job_id]["message"] = "Applied theme color."
-        
-        # Identify a suitable slide layout for content (e.g., Title and Content)
-        # This could be made more sophisticated, allowing user to choose or detecting based on template
-        content_slide_layout_idx = 1 # Common index for "Title and Content"
-        if not prs.slide_layouts or len(prs.slide_layouts) <= content_slide_layout_idx:
-            content_slide_layout_idx = 0 # Fallback to first layout
+        await _check_template(template_path)
 
         total_slides = len(details.final_headings)
-        for i, slide_heading_text in enumerate(details.final_headings):
-            job_store[job_id]["message"] = f"Generating content for slide {i+1}/{total_slides}: {slide_heading_text}"
-            
-            # Simulate fetching main_topic if needed, or pass it through session
-            # For this example, assuming details.main_topic is available via session_id if needed
-            # but FinalPresentationRequest doesn't have it. We'll assume it was implicitly passed
-            # or we use a placeholder. For now, let's assume main_topic came from original session.
-            # This implies SESSION_DATA must still be accessible or relevant parts passed to FinalPresentationRequest
-            
-            # To get main_topic, we'd need to adjust how session_id data is handled or passed.
-            # For now, using a placeholder if not available.
-            main_topic_for_slide = "the overall presentation topic" # Placeholder
-            # A better way: Ensure main_topic is part of FinalPresentationRequest or retrieved from session
-
-            slide_content_text = await generate_content_for_slide(
-                slide_heading_text,
-                main_topic_for_slide, # This needs to be correctly sourced
+        job_store[job_id]["message"] = f"Generating content for {total_slides} slides..."
+        job_store[job_id]["slides_total"] = total_slides
+        job_store[job_id]["slides"] = [{"heading": heading, "state": "pending"} for heading in details.final_headings]
+
+        base_manifest = await deck_manifest.deck_manifest_store.load(details.base_job_id) if details.base_job_id else None
+        main_topic_for_slide = (
+            details.main_topic
+            or (base_manifest["deck"].get("main_topic") if base_manifest else None)
+            or "the overall presentation topic"
+        )
+
+        cache_key = None
+        # In-memory decks must not leave copies on disk; decks of mock contents must not outlive the mocks
+        real_contents = llm_integrations.any_llm_configured() and not settings.LLM_MOCK_RESPONSES
+        if settings.DECK_CACHE_ENABLED and not in_memory and real_contents:
+            cache_key = await asyncio.to_thread(deck_cache.deck_cache_key, details, main_topic_for_slide, template_path)
+            cached = await deck_cache.lookup(cache_key, output_path) if details.use_cache else None
+            if cached:
+                # Identical earlier request: its deck (and manifest, for regeneration) serve this job too
+                source_manifest = await deck_manifest.deck_manifest_store.load(cached["job_id"])
+                if source_manifest:
+                    await deck_manifest.deck_manifest_store.save(job_id, source_manifest["deck"], source_manifest["slides"])
+                job_store[job_id] = {
+                    "status": "completed",
+                    "message": "Presentation reused from an identical earlier request.",
+                    "filename": output_path.name,
+                    "download_url": f"/download/{output_path.name}",
+                    "slides_total": total_slides,
+                    "slides_rendered": total_slides,
+                    "deck_cache_hit": True
+                }
+                _schedule_deck_cleanup(output_path)
+                _schedule_upload_cleanup(details)
+                return
+        prompt_hashes = [
+            deck_manifest.slide_prompt_hash(heading, main_topic_for_slide, details.style_tone, details.content_format, details.max_tokens_per_slide)
+            for heading in details.final_headings
+        ]
+        # Slides finished by an earlier, interrupted attempt of this job
+        checkpoints = await deck_manifest.deck_manifest_store.load_checkpoints(job_id)
+        resumed = {
+            i: checkpoint for i, checkpoint in checkpoints.items()
+            if i < total_slides and checkpoint["prompt_hash"] == prompt_hashes[i]
+        }
+        if resumed:
+            details.pregenerated_contents = {**(details.pregenerated_contents or {}), **{i: checkpoint["content"] for i, checkpoint in resumed.items()}}
+            for i, checkpoint in resumed.items():
+                job_store[job_id]["slides"][i].update({"resumed": True, "provider": checkpoint["provider"]})
+            job_store[job_id]["message"] = f"Resuming from checkpoint: {len(resumed)}/{total_slides} slides already generated..."
+
+        if base_manifest and details.use_cache:
+            # Incremental regeneration: only slides whose prompt changed go to the LLM
+            reused = deck_manifest.reusable_slides(base_manifest, prompt_hashes)
+            details.pregenerated_contents = {**(details.pregenerated_contents or {}), **{i: slide["content"] for i, slide in reused.items()}}
+            for i, slide in reused.items():
+                job_store[job_id]["slides"][i].update({"reused": True, "provider": slide["provider"]})
+            job_store[job_id]["message"] = f"Reusing {len(reused)} unchanged slides, generating {total_slides - len(reused)}..."
+
+        if in_memory and not pptx_utils.pptx_executor_is_process_pool():
+            output_buffer = deck_output.spooled_output_buffer()
+
+        if pptx_utils.pptx_executor_is_process_pool():
+            # A Presentation can't be shared with a worker process, so build it there in one go
+            slide_contents = await generate_contents_for_slides(
+                job_id,
+                details.final_headings,
+                main_topic_for_slide,
                 details.style_tone,
                 details.content_format,
-                details.max_tokens_per_slide
+                details.max_tokens_per_slide,
+                job_store,
+                use_cache=details.use_cache,
+                deck_batch_mode=details.deck_batch_mode or settings.DECK_BATCH_MODE,
+                pregenerated_contents=details.pregenerated_contents
             )
-            
-            # Placeholder mapping - can be made more sophisticated
-            # For example, user could define this per template.
-            # Default: title is shape.title or ph[0], content is ph[1]
-            current_placeholder_map = details.placeholder_map.get(i) if details.placeholder_map else None
-
-
-            pptx_utils.add_slide_with_content(
-                prs,
-                title_text=slide_heading_text,
-                content_text=slide_content_text,
-                slide_layout_idx=content_slide_layout_idx,
-                placeholder_map=current_placeholder_map
+            job_store[job_id]["message"] = f"Building {total_slides} slides..."
+            await pptx_utils.run_in_pptx_executor(
+                pptx_utils.build_and_save_presentation,
+                template_path,
+                details.theme_color,
+                list(zip(details.final_headings, slide_contents)),
+                output_path,
+                details.placeholder_map
             )
-            await asyncio.sleep(0.05) # Small delay to allow other tasks
+        else:
+            slide_contents = await _generate_and_render_streaming(
+                job_id, details, template_path, output_buffer or output_path, main_topic_for_slide, job_store
+            )
+        if cache_key:
+            await deck_cache.store(cache_key, output_buffer or output_path, job_id, total_slides)
+        on_disk = True
+        if output_buffer is not None:
+            buffer, output_buffer = output_buffer, None
+            on_disk = not await _store_deck_output(output_path, buffer)
+
+        await deck_manifest.deck_manifest_store.save(
+            job_id,
+            {"main_topic": main_topic_for_slide, "style_tone": details.style_tone, "content_format": details.content_format,
+             "max_tokens_per_slide": details.max_tokens_per_slide},
+            [
+                {"heading": heading, "prompt_hash": prompt_hash, "provider": slide.get("provider"), "content": content}
+                for heading, prompt_hash, slide, content in zip(details.final_headings, prompt_hashes, job_store[job_id]["slides"], slide_contents)
+            ]
+        )
 
-        prs.save(output_path)
         job_store[job_id] = {
             "status": "completed",
             "message": "Presentation generated successfully.",
             "filename": output_path.name,
-            "download_url": f"/download/{output_path.name}" # Construct based on your routing
+            "download_url": f"/download/{output_path.name}", # Construct based on your routing
+            "slides_total": total_slides,
+            "slides_rendered": total_slides,
+            **({"time_to_first_slide": job_store[job_id]["time_to_first_slide"]} if "time_to_first_slide" in job_store[job_id] else {})
         }
-        
-        # Schedule cleanup for uploaded template if it was used and is temporary
-        if details.template_choice == "upload" and details.uploaded_template_path:
-            upload_path = Path(details.uploaded_template_path)
-            # Ensure it's within a designated temporary upload area before deleting its parent
-            if settings.GENERATED_PPTS_DIR / "uploads" in upload_path.parents:
-                 asyncio.create_task(pptx_utils.cleanup_file(upload_path.parent, settings.GENERATED_PPT_TTL_SECONDS + 10)) # Delete the session upload folder
+        if on_disk:
+            _schedule_deck_cleanup(output_path)
+        _schedule_upload_cleanup(details)
 
     except Exception as e:
         print(f"Error in generate_presentation_slides_async for job {job_id}: {e}")
+        retryable = not isinstance(e, job_queue.PermanentJobError)
         job_store[job_id] = {
             "status": "failed",
             "message": "An error occurred during presentation generation.",
-            "error_detail": str(e)
+            "error_detail": str(e),
+            "retryable": retryable
         }
+        if not retryable:
+            _schedule_upload_cleanup(details) # No later attempt will use the template
     finally:
-        # Clean up main session data after job completion/failure
-        if details.session_id in config.SESSION_DATA: # Assuming SESSION_DATA is accessible via config import
-            del config.SESSION_DATA[details.session_id]
\ No newline at end of file
+        if output_buffer is not None:
+            output_buffer.close()
+
+
+async def run_presentation_job(job_id: str, payload: Dict[str, Any], job_store: Dict):
+    """job_queue handler for "presentation" jobs enqueued by /create-presentation."""
+    details = schemas.FinalPresentationRequest(**payload["details"])
+    # In memory only in the process that accepted the request (see DECK_OUTPUT_MODE); elsewhere /download couldn't find it
+    in_memory = payload.get("in_memory_process") == job_queue.process_id()
+    await generate_presentation_slides_async(job_id, details, Path(payload["output_path"]), job_store, in_memory=in_memory)
\ No newline at end of file
@@ -0,0 +1,133 @@
+# app/speculation.py
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .config import settings
+from . import services, token_counter
+
+
+class SpeculativeSession:
+    def __init__(self, session_id: str, tasks: Dict[Tuple[str, int], "asyncio.Task[str]"], content_format: str, max_tokens_per_slide: int):
+        self.session_id = session_id
+        self.tasks = tasks # (heading, token budget) -> content generation task
+        self.content_format = content_format
+        self.max_tokens_per_slide = max_tokens_per_slide
+        self.created_at = time.monotonic()
+        self.expiry_handle: Optional[asyncio.TimerHandle] = None
+        self.collected: Optional[Tuple[int, int]] = None # (slides reused, slides requested) by the last collect
+
+
+# session_id -> speculative work started when its headings were shown to the user
+_SESSIONS: Dict[str, SpeculativeSession] = {}
+_SPECULATION_SEMAPHORE: Optional[asyncio.Semaphore] = None
+SPECULATION_STATS = {"sessions_started": 0, "sessions_skipped": 0, "slides_reused": 0, "slides_regenerated": 0, "slides_cancelled": 0}
+
+
+def _semaphore() -> asyncio.Semaphore:
+    global _SPECULATION_SEMAPHORE
+    if _SPECULATION_SEMAPHORE is None:
+        _SPECULATION_SEMAPHORE = asyncio.Semaphore(settings.SPECULATIVE_MAX_CONCURRENT_SLIDES)
+    return _SPECULATION_SEMAPHORE
+
+
+async def _speculate_slide(heading: str, main_topic: str, style_tone: str, content_format: str, max_tokens: int) -> str:
+    # Shares a small pool so speculation never crowds out real jobs;
+    # slides still waiting here when cancelled cost nothing.
+    async with _semaphore():
+        return await services.generate_content_for_slide(heading, main_topic, style_tone, content_format, max_tokens)
+
+
+def start_speculation(
+    session_id: str,
+    main_topic: str,
+    headings: List[str],
+    style_tone: str,
+    content_format: str,
+    max_tokens_per_slide: int
+):
+    """
+    Starts generating content for the proposed headings in the background while
+    the user reviews them. No-op unless SPECULATIVE_GENERATION_ENABLED.
+    """
+    if not settings.SPECULATIVE_GENERATION_ENABLED:
+        return
+    if len(_SESSIONS) >= settings.SPECULATIVE_MAX_SESSIONS:
+        SPECULATION_STATS["sessions_skipped"] += 1
+        return
+
+    # Same budgets the job would compute for an unedited deck
+    budgets = token_counter.deck_slide_budgets(headings, content_format, max_tokens_per_slide)
+    tasks: Dict[Tuple[str, int], "asyncio.Task[str]"] = {}
+    for key in zip(headings, budgets):
+        if key not in tasks:
+            tasks[key] = asyncio.create_task(_speculate_slide(key[0], main_topic, style_tone, content_format, key[1]))
+            tasks[key].add_done_callback(_consume_exception)
+    session = SpeculativeSession(session_id, tasks, content_format, max_tokens_per_slide)
+    session.expiry_handle = asyncio.get_running_loop().call_later(
+        settings.SPECULATIVE_TTL_SECONDS, discard_speculation, session_id
+    )
+    _SESSIONS[session_id] = session
+    SPECULATION_STATS["sessions_started"] += 1
+
+
+def _consume_exception(task: "asyncio.Task[str]"):
+    if not task.cancelled():
+        task.exception()
+
+
+def discard_speculation(session_id: str):
+    session = _SESSIONS.pop(session_id, None)
+    if not session:
+        return
+    if session.expiry_handle:
+        session.expiry_handle.cancel()
+    for task in session.tasks.values():
+        if not task.done():
+            task.cancel()
+            SPECULATION_STATS["slides_cancelled"] += 1
+
+
+async def collect_speculation(session_id: str, final_headings: List[str]) -> Dict[int, str]:
+    """
+    Returns {slide_index: content} for final headings the user left unchanged
+    and whose token budget in the final deck is the one speculated with,
+    waiting up to SPECULATIVE_GRACE_SECONDS for ones still in progress. The
+    session is kept: call consume_speculation() once the job is enqueued, so a
+    rejected (429) submission can collect the same work again on retry.
+    """
+    session = _SESSIONS.get(session_id)
+    if not session:
+        return {}
+
+    budgets = token_counter.deck_slide_budgets(final_headings, session.content_format, session.max_tokens_per_slide)
+    wanted = {i: session.tasks.get(key) for i, key in enumerate(zip(final_headings, budgets))}
+    pending = [task for task in wanted.values() if task and not task.done()]
+    if pending:
+        await asyncio.wait(pending, timeout=settings.SPECULATIVE_GRACE_SECONDS)
+
+    reused: Dict[int, str] = {}
+    for i, task in wanted.items():
+        if task and task.done() and not task.cancelled() and task.exception() is None:
+            reused[i] = task.result()
+    session.collected = (len(reused), len(final_headings))
+    return reused
+
+
+def consume_speculation(session_id: str):
+    """The job using the collected contents is enqueued: counts the reuse and cancels everything else."""
+    session = _SESSIONS.get(session_id)
+    if session and session.collected:
+        reused, requested = session.collected
+        SPECULATION_STATS["slides_reused"] += reused
+        SPECULATION_STATS["slides_regenerated"] += requested - reused
+    discard_speculation(session_id)
+
+
+def shutdown_speculation():
+    for session_id in list(_SESSIONS):
+        discard_speculation(session_id)
+
+
+def speculation_stats() -> Dict[str, int]:
+    return {**SPECULATION_STATS, "active_sessions": len(_SESSIONS)}
@@ -0,0 +1,93 @@
+# app/template_cache.py
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Tuple
+
+from pptx import Presentation
+
+from .config import settings
+
+
+class TemplateCache:
+    """
+    In-process LRU of template files keyed by content hash, bounded by entry
+    count and total bytes. Jobs open their own Presentation from the cached
+    bytes, so a template is read from disk (and hashed) only when the file
+    changes. python-pptx objects can't be cloned cheaply or shared between
+    jobs, so each job still parses its own copy - from memory.
+    Thread-safe: used from the pptx executor threads. With a process executor
+    each worker process has its own cache.
+    """
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict() # content hash -> file bytes
+        self._file_hashes: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict() # path -> (mtime_ns, size, hash)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _read(self, path: Path) -> Tuple[str, bytes]:
+        data = path.read_bytes()
+        return hashlib.sha256(data).hexdigest(), data
+
+    def get(self, path: Path) -> Tuple[str, bytes]:
+        """(content hash, bytes) for the template at `path`. Blocking."""
+        key = str(path.resolve())
+        stat = os.stat(key)
+        with self._lock:
+            known = self._file_hashes.get(key)
+            if known and known[:2] == (stat.st_mtime_ns, stat.st_size) and known[2] in self._entries:
+                self._file_hashes.move_to_end(key)
+                self._entries.move_to_end(known[2])
+                self.counters["hits"] += 1
+                return known[2], self._entries[known[2]]
+
+        content_hash, data = self._read(path)
+        with self._lock:
+            self.counters["misses"] += 1
+            self._file_hashes[key] = (stat.st_mtime_ns, stat.st_size, content_hash)
+            self._file_hashes.move_to_end(key)
+            while len(self._file_hashes) > self.max_entries * 4:
+                self._file_hashes.popitem(last=False)
+            if content_hash not in self._entries and len(data) <= self.max_bytes:
+                self._entries[content_hash] = data
+                self._bytes += len(data)
+            if content_hash in self._entries:
+                self._entries.move_to_end(content_hash)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.counters["evictions"] += 1
+        return content_hash, data
+
+    def content_hash(self, path: Path) -> str:
+        return self.get(path)[0]
+
+    def open_presentation(self, path: Path) -> Presentation:
+        """An independent Presentation of the template, parsed from cached bytes."""
+        return Presentation(io.BytesIO(self.get(path)[1]))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._file_hashes.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+template_cache = TemplateCache(settings.TEMPLATE_CACHE_MAX_ENTRIES, settings.TEMPLATE_CACHE_MAX_BYTES)
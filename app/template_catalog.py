@@ -0,0 +1,125 @@
+# app/template_catalog.py
+"""
+In-memory catalog of the server templates in SERVER_TEMPLATES_DIR, with each
+template's size, content hash and template_index analysis.
+
+The directory may live on network storage where listing is slow (and inotify
+doesn't see remote changes), so the catalog polls: at most every
+TEMPLATE_CATALOG_REFRESH_SECONDS it stats the directory, and lists it again
+only if the directory's mtime changed (a template was added, removed or
+renamed); otherwise it re-stats the known templates to catch in-place
+rewrites. A full listing still runs every TEMPLATE_CATALOG_FULL_SCAN_SECONDS,
+as coarse mtime granularity on some file systems can hide a change. Only new
+or changed templates are re-analyzed. `version` changes whenever the catalog
+does, for caches built from it (e.g. the index page).
+"""
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+from .config import settings
+from . import pptx_utils, template_index
+
+
+class TemplateCatalog:
+    def __init__(self, templates_dir: Path, refresh_seconds: float, full_scan_seconds: float):
+        self.templates_dir = templates_dir
+        self.refresh_seconds = refresh_seconds
+        self.full_scan_seconds = full_scan_seconds
+        self.version = 0
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dir_mtime_ns: Optional[int] = None
+        self._checked_at = 0.0
+        self._listed_at = 0.0
+        self._lock = asyncio.Lock()
+        self.counters = {"refreshes": 0, "listings": 0, "analyses": 0}
+
+    # --- Blocking filesystem scans (run in a thread) ---
+    def _scan(self) -> Tuple[int, Dict[str, Tuple[int, int]]]:
+        """(directory mtime, {name: (mtime_ns, size)}), listing the directory only when needed."""
+        try:
+            dir_mtime_ns = self.templates_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0, {}
+        if dir_mtime_ns != self._dir_mtime_ns or time.monotonic() - self._listed_at > self.full_scan_seconds:
+            self.counters["listings"] += 1
+            self._listed_at = time.monotonic()
+            with os.scandir(self.templates_dir) as entries:
+                return dir_mtime_ns, {
+                    entry.name: (stat.st_mtime_ns, stat.st_size)
+                    for entry in entries if entry.name.endswith(".pptx") and entry.is_file()
+                    for stat in (entry.stat(),)
+                }
+        stats = {}
+        for name in self._entries:
+            try:
+                stat = (self.templates_dir / name).stat()
+            except FileNotFoundError:
+                continue
+            stats[name] = (stat.st_mtime_ns, stat.st_size)
+        return dir_mtime_ns, stats
+
+    async def _analyze(self, name: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+        entry = {"name": name, "size": size, "mtime_ns": mtime_ns}
+        try:
+            index = await pptx_utils.run_in_pptx_executor(template_index.get_template_index, self.templates_dir / name)
+        except Exception as e: # Listed, but not offered for selection
+            print(f"Could not analyze template {name}: {e}")
+            return {**entry, "error": str(e)}
+        self.counters["analyses"] += 1
+        return {
+            **entry,
+            "content_hash": index.get("content_hash"),
+            "layout_count": len(index["layouts"]),
+            "content_layout_index": index["content_layout_index"],
+            "title_placeholder_idx": index["title_placeholder_idx"],
+            "body_placeholder_idx": index["body_placeholder_idx"],
+            "layouts": [{"index": layout["index"], "name": layout["name"], "kind": layout["kind"]} for layout in index["layouts"]],
+        }
+
+    async def refresh(self, force: bool = False):
+        """Brings the catalog up to date if the refresh interval passed (or `force`)."""
+        if not force and time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self._checked_at < self.refresh_seconds:
+                return # Refreshed while we waited
+            self.counters["refreshes"] += 1
+            dir_mtime_ns, stats = await asyncio.to_thread(self._scan)
+            entries = {}
+            for name, (mtime_ns, size) in sorted(stats.items()):
+                known = self._entries.get(name)
+                if known and (known["mtime_ns"], known["size"]) == (mtime_ns, size):
+                    entries[name] = known
+                else:
+                    entries[name] = await self._analyze(name, mtime_ns, size)
+            if entries != self._entries:
+                self._entries = entries
+                self.version += 1
+            self._dir_mtime_ns = dir_mtime_ns
+            self._checked_at = time.monotonic()
+
+    # --- Lookups (call refresh() first for fresh results) ---
+    def names(self) -> List[str]:
+        """Selectable templates (analyzed without error), sorted."""
+        return [name for name, entry in self._entries.items() if "error" not in entry]
+
+    def contains(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and "error" not in entry
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(name)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        return list(self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "version": self.version, "templates": len(self._entries)}
+
+
+template_catalog = TemplateCatalog(
+    settings.SERVER_TEMPLATES_DIR, settings.TEMPLATE_CATALOG_REFRESH_SECONDS, settings.TEMPLATE_CATALOG_FULL_SCAN_SECONDS
+)
@@ -0,0 +1,143 @@
+# app/template_index.py
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple
+
+from pptx import Presentation
+from pptx.enum.shapes import PP_PLACEHOLDER
+
+from .template_cache import template_cache
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index.json"
+
+TITLE_TYPES = {PP_PLACEHOLDER.TITLE, PP_PLACEHOLDER.CENTER_TITLE, PP_PLACEHOLDER.VERTICAL_TITLE}
+BODY_TYPES = {PP_PLACEHOLDER.BODY, PP_PLACEHOLDER.OBJECT, PP_PLACEHOLDER.VERTICAL_BODY, PP_PLACEHOLDER.VERTICAL_OBJECT}
+
+# content hash -> index; small and bounded by the number of distinct templates seen
+_INDEXES: Dict[str, Dict[str, Any]] = {}
+_INDEXES_LOCK = threading.Lock()
+_DEFAULT_KEY = "default" # python-pptx's built-in blank template
+
+
+def _classify_placeholder(placeholder) -> str:
+    ph_type = placeholder.placeholder_format.type
+    if ph_type in TITLE_TYPES:
+        return "title"
+    if ph_type == PP_PLACEHOLDER.SUBTITLE:
+        return "subtitle"
+    if ph_type in BODY_TYPES:
+        return "body"
+    return "other" # Date, footer, slide number, picture, chart...
+
+
+def _analyze_layout(index: int, layout) -> Dict[str, Any]:
+    title_idx, body_idx, body_area, has_subtitle = None, None, 0, False
+    for placeholder in layout.placeholders:
+        kind = _classify_placeholder(placeholder)
+        if kind == "title" and title_idx is None:
+            title_idx = placeholder.placeholder_format.idx
+        elif kind == "subtitle":
+            has_subtitle = True
+        elif kind == "body":
+            area = (placeholder.width or 0) * (placeholder.height or 0)
+            if body_idx is None or area > body_area: # Largest body wins (e.g. two-content layouts)
+                body_idx, body_area = placeholder.placeholder_format.idx, area
+
+    if title_idx is not None and body_idx is not None:
+        kind = "title_and_content"
+    elif title_idx is not None and has_subtitle:
+        kind = "title_slide"
+    elif title_idx is not None:
+        kind = "title_only"
+    elif not len(layout.placeholders):
+        kind = "blank"
+    else:
+        kind = "other"
+    return {"index": index, "name": layout.name, "kind": kind, "title_idx": title_idx, "body_idx": body_idx, "body_area": body_area}
+
+
+def analyze_presentation(prs: Presentation) -> Dict[str, Any]:
+    """
+    Classifies every layout's placeholders and picks the content layout: a
+    title + body layout with the largest body, preferring one named like
+    "Title and Content". Placeholder entries are placeholder idx values, as
+    used by slide.placeholders[idx].
+    """
+    layouts = [_analyze_layout(i, layout) for i, layout in enumerate(prs.slide_layouts)]
+    candidates = [layout for layout in layouts if layout["kind"] == "title_and_content"]
+    if candidates:
+        best = max(candidates, key=lambda layout: ("content" in layout["name"].lower(), layout["body_area"], -layout["index"]))
+    else: # No title + body layout; same fallback as before the index existed
+        best = layouts[1] if len(layouts) > 1 else (layouts[0] if layouts else None)
+    return {
+        "version": INDEX_VERSION,
+        "layouts": layouts,
+        "content_layout_index": best["index"] if best else 0,
+        "title_placeholder_idx": best["title_idx"] if best else None,
+        "body_placeholder_idx": best["body_idx"] if best else None,
+    }
+
+
+def index_path_for(template_path: Path) -> Path:
+    return template_path.with_name(template_path.name + INDEX_SUFFIX)
+
+
+def _read_index_file(path: Path, content_hash: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION or index.get("content_hash") != content_hash:
+        return None # Template replaced or analysis changed since the file was written
+    return index
+
+
+def _write_index_file(path: Path, index: Dict[str, Any]):
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e: # Read-only template dir: the in-memory index still works
+        print(f"Could not write template index {path}: {e}")
+
+
+def get_template_index(template_path: Optional[Path]) -> Dict[str, Any]:
+    """
+    The analysis of `template_path` (or of the blank default template), from
+    memory, else from the index file next to the template, else by analyzing
+    the template once and persisting the result. Blocking.
+    """
+    if template_path is None:
+        key = _DEFAULT_KEY
+    else:
+        key = template_cache.content_hash(template_path)
+    with _INDEXES_LOCK:
+        if key in _INDEXES:
+            return _INDEXES[key]
+
+    if template_path is None:
+        index = analyze_presentation(Presentation())
+    else:
+        index = _read_index_file(index_path_for(template_path), key)
+        if index is None:
+            index = {**analyze_presentation(template_cache.open_presentation(template_path)), "content_hash": key}
+            _write_index_file(index_path_for(template_path), index)
+    with _INDEXES_LOCK:
+        _INDEXES[key] = index
+    return index
+
+
+def slide_mapping(template_path: Optional[Path]) -> Tuple[int, Dict[str, int]]:
+    """(content layout index, {"title": idx, "content": idx}) for building slides."""
+    index = get_template_index(template_path)
+    placeholder_map = {}
+    if index["title_placeholder_idx"] is not None:
+        placeholder_map["title"] = index["title_placeholder_idx"]
+    if index["body_placeholder_idx"] is not None:
+        placeholder_map["content"] = index["body_placeholder_idx"]
+    return index["content_layout_index"], placeholder_map
@@ -0,0 +1,134 @@
+# app/theme_variants.py
+import colorsys
+import os
+import re
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+from .config import settings
+from .template_cache import template_cache
+from .pptx_stream_writer import default_template_path
+
+_THEME_PART = re.compile(r"^ppt/theme/theme\d+\.xml$")
+_CLR_SCHEME = re.compile(r"<a:clrScheme\b.*?</a:clrScheme>", re.DOTALL)
+
+_VARIANTS: Dict[Tuple[str, str], Path] = {} # (template hash, RRGGBB) -> variant file
+_VARIANTS_LOCK = threading.Lock()
+VARIANT_STATS = {"hits": 0, "disk_hits": 0, "created": 0, "evicted_files": 0}
+
+
+def _blend(rgb: Tuple[float, float, float], target: float, amount: float) -> Tuple[float, float, float]:
+    return tuple(channel + (target - channel) * amount for channel in rgb)
+
+
+def _hex(rgb: Tuple[float, float, float]) -> str:
+    return "".join(f"{round(max(0.0, min(1.0, channel)) * 255):02X}" for channel in rgb)
+
+
+def color_scheme_slots(color_hex: str) -> Dict[str, str]:
+    """
+    Theme slots derived from one color: accent1 is the color itself, the other
+    accents are shades, tints and a hue-shifted companion, dk2/lt2 are a deep
+    shade and a pale tint. dk1/lt1 (main text/background) are left alone so
+    text stays readable.
+    """
+    rgb = tuple(int(color_hex[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    hue, lightness, saturation = colorsys.rgb_to_hls(*rgb)
+    companion = colorsys.hls_to_rgb((hue + 1 / 12) % 1.0, lightness, saturation)
+    return {
+        "accent1": color_hex.upper(),
+        "accent2": _hex(_blend(rgb, 0.0, 0.25)),
+        "accent3": _hex(_blend(rgb, 1.0, 0.4)),
+        "accent4": _hex(_blend(rgb, 0.0, 0.5)),
+        "accent5": _hex(companion),
+        "accent6": _hex(_blend(rgb, 1.0, 0.6)),
+        "dk2": _hex(_blend(rgb, 0.0, 0.65)),
+        "lt2": _hex(_blend(rgb, 1.0, 0.88)),
+    }
+
+
+def rewrite_color_scheme(theme_xml: str, slots: Dict[str, str]) -> str:
+    """Replaces the given slots of the theme's <a:clrScheme> with sRGB colors."""
+    def _rewrite_scheme(match: "re.Match") -> str:
+        scheme = match.group(0)
+        for slot, color_hex in slots.items():
+            scheme = re.sub(
+                rf"<a:{slot}>.*?</a:{slot}>", f'<a:{slot}><a:srgbClr val="{color_hex}"/></a:{slot}>', scheme, count=1, flags=re.DOTALL
+            )
+        return scheme
+    return _CLR_SCHEME.sub(_rewrite_scheme, theme_xml, count=1)
+
+
+def _write_variant(source: Path, target: Path, slots: Dict[str, str]):
+    tmp_path = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with zipfile.ZipFile(source) as zin, zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            data = zin.read(info)
+            if _THEME_PART.match(info.filename):
+                data = rewrite_color_scheme(data.decode("utf-8"), slots).encode("utf-8")
+            target_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+            target_info.compress_type = info.compress_type
+            zout.writestr(target_info, data)
+    os.replace(tmp_path, target) # Atomic: concurrent builders of the same variant are harmless
+
+
+def _evict_old_variants():
+    """
+    Trims THEME_VARIANTS_DIR to THEME_VARIANTS_MAX_FILES by last use (mtime),
+    but never deletes a variant used within THEME_VARIANTS_MIN_IDLE_SECONDS:
+    a job may have been handed its path and not opened it yet.
+    """
+    variants = sorted(settings.THEME_VARIANTS_DIR.glob("*.pptx"), key=lambda path: path.stat().st_mtime)
+    idle_before = time.time() - settings.THEME_VARIANTS_MIN_IDLE_SECONDS
+    for path in variants[:max(0, len(variants) - settings.THEME_VARIANTS_MAX_FILES)]:
+        try:
+            if path.stat().st_mtime > idle_before:
+                break # Sorted by mtime: every remaining variant is in recent use
+            path.unlink()
+            VARIANT_STATS["evicted_files"] += 1
+        except OSError:
+            pass # In use on Windows or already gone
+    with _VARIANTS_LOCK:
+        for key, path in list(_VARIANTS.items()):
+            if not path.exists():
+                del _VARIANTS[key]
+
+
+def get_theme_variant(template_path: Optional[Path], color_hex: str) -> Path:
+    """
+    The template (or python-pptx's blank one) with its theme color scheme
+    recolored from `color_hex` ("RRGGBB"). Built once per (template content
+    hash, color) and kept under THEME_VARIANTS_DIR for every later job and
+    process. Blocking.
+    """
+    source = template_path or default_template_path()
+    key = (template_cache.content_hash(source), color_hex.upper())
+    with _VARIANTS_LOCK:
+        path = _VARIANTS.get(key)
+    if path is not None and path.exists():
+        VARIANT_STATS["hits"] += 1
+        try:
+            os.utime(path) # Recently used, for eviction
+        except OSError:
+            pass
+        return path
+
+    path = settings.THEME_VARIANTS_DIR / f"{key[0][:16]}_{key[1]}.pptx"
+    if path.exists():
+        VARIANT_STATS["disk_hits"] += 1
+        os.utime(path) # Recently used, for eviction
+    else:
+        settings.THEME_VARIANTS_DIR.mkdir(parents=True, exist_ok=True)
+        _write_variant(source, path, color_scheme_slots(key[1]))
+        VARIANT_STATS["created"] += 1
+        _evict_old_variants()
+    with _VARIANTS_LOCK:
+        _VARIANTS[key] = path
+    return path
+
+
+def variant_stats() -> Dict[str, Any]:
+    return {**VARIANT_STATS, "known_variants": len(_VARIANTS)}
@@ -0,0 +1,177 @@
+# app/token_counter.py
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Callable
+
+from .config import settings
+
+
+# --- Tokenizers ---
+class BaseTokenizer:
+    name = "base"
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError("Subclasses must implement this method.")
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        raise NotImplementedError("Subclasses must implement this method.")
+
+
+class HeuristicTokenizer(BaseTokenizer):
+    """
+    Fallback when no real tokenizer is available. BPE tokenizers average roughly
+    4 characters or 0.75 words per English token; taking the larger of the two
+    estimates errs on the side of over-counting.
+    """
+    name = "heuristic"
+    _word_pattern = re.compile(r"\S+")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        words = len(self._word_pattern.findall(text))
+        return max(math.ceil(len(text) / 4), math.ceil(words * 4 / 3))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if self.count(text) <= max_tokens:
+            return text
+        words = text.split(" ")
+        low, high = 0, len(words)
+        while low < high: # Longest word prefix that fits
+            mid = (low + high + 1) // 2
+            if self.count(" ".join(words[:mid])) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return " ".join(words[:low])
+
+
+class TiktokenTokenizer(BaseTokenizer):
+    def __init__(self, encoding_name: str):
+        import tiktoken # Optional dependency, see get_tokenizer()
+        self.name = f"tiktoken:{encoding_name}"
+        self._encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self._encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self._encoding.decode(tokens[:max_tokens])
+
+
+# Provider -> factory. Providers without an entry (or whose factory fails,
+# e.g. tiktoken not installed) use HeuristicTokenizer.
+TOKENIZER_FACTORIES: Dict[str, Callable[[], BaseTokenizer]] = {
+    "gpt": lambda: TiktokenTokenizer("cl100k_base"),
+    "deepseek": lambda: TiktokenTokenizer("cl100k_base"), # Close approximation of DeepSeek's BPE
+}
+
+_TOKENIZERS: Dict[str, BaseTokenizer] = {}
+
+def register_tokenizer(provider: str, factory: Callable[[], BaseTokenizer]):
+    TOKENIZER_FACTORIES[provider] = factory
+    _TOKENIZERS.pop(provider, None)
+    _count_cached.cache_clear()
+
+def get_tokenizer(provider: Optional[str] = None) -> BaseTokenizer:
+    key = provider or "default"
+    if key not in _TOKENIZERS:
+        factory = TOKENIZER_FACTORIES.get(key)
+        try:
+            tokenizer = factory() if factory else HeuristicTokenizer()
+        except Exception as e: # ImportError for missing tiktoken, network errors fetching encodings
+            print(f"Tokenizer for '{key}' unavailable ({e}). Using heuristic token counts.")
+            tokenizer = HeuristicTokenizer()
+        # setdefault: a fallback installed by use_heuristic_for_unloaded() meanwhile stays, so counts don't change mid-run
+        _TOKENIZERS.setdefault(key, tokenizer)
+    return _TOKENIZERS[key]
+
+
+def warm_tokenizers():
+    """
+    Loads every provider's tokenizer. tiktoken downloads its encoding on first
+    use (blocking, no timeout), so call this at startup in a thread rather than
+    on the first request.
+    """
+    for provider in TOKENIZER_FACTORIES:
+        get_tokenizer(provider)
+
+
+def use_heuristic_for_unloaded():
+    """Heuristic counts for providers whose tokenizer isn't loaded yet (warm-up timed out)."""
+    for provider in TOKENIZER_FACTORIES:
+        if provider not in _TOKENIZERS:
+            print(f"Tokenizer for '{provider}' still loading. Using heuristic token counts.")
+            _TOKENIZERS[provider] = HeuristicTokenizer()
+
+
+@lru_cache(maxsize=settings.TOKEN_COUNT_CACHE_SIZE)
+def _count_cached(provider_key: str, text: str) -> int:
+    return get_tokenizer(provider_key).count(text)
+
+def count_tokens(text: str, provider: Optional[str] = None) -> int:
+    """Token count for `text` with the provider's tokenizer (memoized)."""
+    return _count_cached(provider or "default", text)
+
+def truncate_to_tokens(text: str, max_tokens: int, provider: Optional[str] = None) -> str:
+    if count_tokens(text, provider) <= max_tokens:
+        return text
+    return get_tokenizer(provider).truncate(text, max_tokens)
+
+
+# --- Deck-level budget allocation ---
+# Relative output size per content format
+FORMAT_WEIGHTS = {"bullet_points": 1.0, "summary": 0.7, "paragraph": 1.3}
+
+def allocate_deck_budget(
+    headings: List[str],
+    content_format: str,
+    total_budget: int,
+    max_tokens_per_slide: int,
+    min_tokens_per_slide: int
+) -> List[int]:
+    """
+    Splits `total_budget` output tokens across slides. Each slide's share is
+    weighted by its content format and by how much its heading asks for (longer,
+    more specific headings get a bit more), capped at `max_tokens_per_slide`.
+    Budget left over by capped slides is handed to the others.
+    """
+    if not headings:
+        return []
+    format_weight = FORMAT_WEIGHTS.get(content_format, 1.0)
+    weights = [format_weight * (1 + min(count_tokens(heading), 30) / 30) for heading in headings]
+
+    allocations = [0] * len(headings)
+    remaining_budget = max(total_budget, min_tokens_per_slide * len(headings))
+    open_slides = set(range(len(headings)))
+    while open_slides and remaining_budget > 0:
+        weight_sum = sum(weights[i] for i in open_slides)
+        capped = set()
+        for i in open_slides:
+            share = int(remaining_budget * weights[i] / weight_sum)
+            if allocations[i] + share >= max_tokens_per_slide:
+                share = max_tokens_per_slide - allocations[i]
+                capped.add(i)
+            allocations[i] += share
+        remaining_budget = max(total_budget, min_tokens_per_slide * len(headings)) - sum(allocations)
+        if not capped:
+            break
+        open_slides -= capped
+    return [max(min_tokens_per_slide, min(max_tokens_per_slide, allocation)) for allocation in allocations]
+
+
+def deck_slide_budgets(headings: List[str], content_format: str, max_tokens_per_slide: int) -> List[int]:
+    """
+    Per-slide output limits for a deck. The user's `max_tokens_per_slide` is the
+    average: the deck total (DECK_TOKEN_BUDGET if set, else slides x
+    max_tokens_per_slide) is redistributed between slides, none above
+    MAX_TOKENS_PER_SLIDE.
+    """
+    total_budget = settings.DECK_TOKEN_BUDGET or len(headings) * max_tokens_per_slide
+    return allocate_deck_budget(
+        headings, content_format, total_budget, max(max_tokens_per_slide, settings.MAX_TOKENS_PER_SLIDE), settings.MIN_TOKENS_PER_SLIDE
+    )
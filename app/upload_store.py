@@ -0,0 +1,226 @@
+# app/upload_store.py
+"""
+Content-addressed store for uploaded templates. Uploads are copied to disk in
+chunks off the event loop, hashed while they are written and capped at
+UPLOAD_MAX_BYTES; identical templates are kept once, as <sha256>.pptx under
+UPLOAD_STORE_DIR (so their template_index analysis is shared too).
+
+Each session/job using a template holds a reference (SQLite, shared by every
+worker process); a template is deleted once its last reference is released,
+or UPLOAD_STORE_MAX_AGE_SECONDS after it was last used if a reference leaked
+(abandoned sessions, failed jobs).
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator
+
+from fastapi import HTTPException, UploadFile
+
+from .config import settings
+from .template_index import INDEX_SUFFIX
+
+_CHUNK_SIZE = 1024 * 1024
+_ZIP_MAGIC = b"PK\x03\x04"
+REQUIRED_PARTS = ("[Content_Types].xml", "_rels/.rels", "ppt/presentation.xml")
+_PRESENTATION_CONTENT_TYPE = b"application/vnd.openxmlformats-officedocument.presentationml.presentation.main+xml"
+_TEMPLATE_CONTENT_TYPE = b"application/vnd.openxmlformats-officedocument.presentationml.template.main+xml"
+
+
+def validate_pptx_package(path: Path):
+    """
+    Structural check from the zip central directory alone (plus the small
+    [Content_Types].xml): required parts present, a presentation main part,
+    and entry count / uncompressed size within limits (zip bombs). Raises
+    ValueError. Blocking.
+    """
+    try:
+        with zipfile.ZipFile(path) as package:
+            infos = package.infolist()
+            if len(infos) > settings.UPLOAD_MAX_ZIP_ENTRIES:
+                raise ValueError(f"too many parts ({len(infos)})")
+            if sum(info.file_size for info in infos) > settings.UPLOAD_MAX_UNCOMPRESSED_BYTES:
+                raise ValueError("uncompressed size exceeds the limit")
+            names = {info.filename for info in infos}
+            missing = [part for part in REQUIRED_PARTS if part not in names]
+            if missing:
+                raise ValueError(f"missing {', '.join(missing)}")
+            content_types_info = package.getinfo("[Content_Types].xml")
+            if content_types_info.file_size > 1024 * 1024:
+                raise ValueError("[Content_Types].xml is implausibly large")
+            content_types = package.read(content_types_info)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"not a valid zip archive ({e})")
+    if _PRESENTATION_CONTENT_TYPE not in content_types and _TEMPLATE_CONTENT_TYPE not in content_types:
+        raise ValueError("not a PowerPoint presentation")
+
+
+class UploadStore:
+    def __init__(self, store_dir: Path, db_path: Path, max_age_seconds: float):
+        self.store_dir = store_dir
+        self.db_path = db_path
+        self.max_age_seconds = max_age_seconds
+        self._local = threading.local() # One connection per thread
+        self.counters = {"uploads": 0, "deduplicated": 0, "rejected": 0, "deleted": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None) # Explicit transactions below
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS upload_refs ("
+                "content_hash TEXT PRIMARY KEY, refcount INTEGER NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _write_transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write lock across processes, so blob moves and deletions stay in step with the refcounts."""
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def path_for(self, content_hash: str) -> Path:
+        return self.store_dir / f"{content_hash}.pptx"
+
+    def hash_of(self, path: Path) -> Optional[str]:
+        """Content hash of a stored template path, None for paths outside the store."""
+        path = Path(path)
+        return path.stem if path.parent == self.store_dir and path.suffix == ".pptx" else None
+
+    # --- Blocking operations (call through the async wrappers) ---
+    def _delete_blob(self, content_hash: str):
+        path = self.path_for(content_hash)
+        path.unlink(missing_ok=True)
+        path.with_name(path.name + INDEX_SUFFIX).unlink(missing_ok=True)
+        self.counters["deleted"] += 1
+
+    def _commit_upload(self, tmp_path: Path, content_hash: str, size: int) -> Path:
+        """Moves a validated upload into place (or drops it as a duplicate) and takes a reference."""
+        path = self.path_for(content_hash)
+        with self._write_transaction() as db: # Serializes against _release deleting the same blob
+            if path.exists():
+                tmp_path.unlink(missing_ok=True)
+                self.counters["deduplicated"] += 1
+            else:
+                os.replace(tmp_path, path)
+            db.execute(
+                "INSERT INTO upload_refs (content_hash, refcount, size, last_used) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(content_hash) DO UPDATE SET refcount = refcount + 1, last_used = excluded.last_used",
+                (content_hash, size, time.time())
+            )
+        self._prune()
+        return path
+
+    def _acquire(self, content_hash: str) -> bool:
+        with self._write_transaction() as db:
+            if not self.path_for(content_hash).exists():
+                return False
+            db.execute(
+                "INSERT INTO upload_refs (content_hash, refcount, size, last_used) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(content_hash) DO UPDATE SET refcount = refcount + 1, last_used = excluded.last_used",
+                (content_hash, self.path_for(content_hash).stat().st_size, time.time())
+            )
+        return True
+
+    def _release(self, content_hash: str):
+        with self._write_transaction() as db:
+            db.execute(
+                "UPDATE upload_refs SET refcount = refcount - 1, last_used = ? WHERE content_hash = ?", (time.time(), content_hash)
+            )
+            row = db.execute("SELECT refcount FROM upload_refs WHERE content_hash = ?", (content_hash,)).fetchone()
+            if row is not None and row["refcount"] <= 0:
+                db.execute("DELETE FROM upload_refs WHERE content_hash = ?", (content_hash,))
+                self._delete_blob(content_hash)
+
+    def _prune(self):
+        with self._write_transaction() as db:
+            expired = [
+                row["content_hash"] for row in
+                db.execute("SELECT content_hash FROM upload_refs WHERE last_used < ?", (time.time() - self.max_age_seconds,))
+            ]
+            db.executemany("DELETE FROM upload_refs WHERE content_hash = ?", [(content_hash,) for content_hash in expired])
+            for content_hash in expired:
+                self._delete_blob(content_hash)
+
+    def _stats(self) -> Dict[str, Any]:
+        row = self._connection().execute(
+            "SELECT COUNT(*) AS templates, COALESCE(SUM(size), 0) AS bytes, COALESCE(SUM(refcount), 0) AS refs FROM upload_refs"
+        ).fetchone()
+        return {**self.counters, **dict(row)}
+
+    # --- Async API ---
+    async def save(self, upload: UploadFile) -> Path:
+        """
+        Streams `upload` into the store and returns the stored template's path,
+        holding one reference on it. Raises HTTPException 413 (too large) or
+        400 (not a .pptx package).
+        """
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.store_dir / f".upload-{uuid.uuid4().hex}.tmp"
+        digest = hashlib.sha256()
+        size = 0
+        handle = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            try:
+                if upload.size is not None and upload.size > settings.UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Template exceeds the {settings.UPLOAD_MAX_BYTES} byte limit.")
+                while chunk := await upload.read(_CHUNK_SIZE):
+                    if size == 0 and not chunk.startswith(_ZIP_MAGIC):
+                        raise HTTPException(status_code=400, detail="Uploaded file is not a .pptx package.")
+                    size += len(chunk)
+                    if size > settings.UPLOAD_MAX_BYTES:
+                        raise HTTPException(status_code=413, detail=f"Template exceeds the {settings.UPLOAD_MAX_BYTES} byte limit.")
+                    digest.update(chunk)
+                    await asyncio.to_thread(handle.write, chunk)
+            finally:
+                handle.close()
+            try:
+                await asyncio.to_thread(validate_pptx_package, tmp_path)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Uploaded file is not a valid .pptx package: {e}")
+            path = await asyncio.to_thread(self._commit_upload, tmp_path, digest.hexdigest(), size)
+        except BaseException:
+            self.counters["rejected"] += 1
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self.counters["uploads"] += 1
+        return path
+
+    async def acquire(self, path: Path) -> bool:
+        """Takes another reference on a stored template; False if it is not (any longer) in the store."""
+        content_hash = self.hash_of(path)
+        return bool(content_hash) and await asyncio.to_thread(self._acquire, content_hash)
+
+    async def release(self, path: Path, delay: float = 0):
+        """Drops a reference after `delay` seconds; the template is deleted with its last reference."""
+        content_hash = self.hash_of(path)
+        if not content_hash:
+            return
+        await asyncio.sleep(delay)
+        try:
+            await asyncio.to_thread(self._release, content_hash)
+        except sqlite3.Error as e: # Reclaimed by age instead
+            print(f"Failed to release uploaded template {content_hash}: {e}")
+
+    async def stats(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._stats)
+
+
+upload_store = UploadStore(settings.UPLOAD_STORE_DIR, settings.UPLOAD_STORE_DB_PATH, settings.UPLOAD_STORE_MAX_AGE_SECONDS)
@@ -0,0 +1,82 @@
+# benchmarks/pptx_writer_memory.py
+"""
+Peak RSS against slide count for the python-pptx and the streaming deck writer.
+
+    python -m benchmarks.pptx_writer_memory [--slides 10 50 100 200 400] [--template app/server_templates/x.pptx]
+
+Each (writer, slide count) pair runs in a fresh subprocess so the peak RSS
+(ru_maxrss) belongs to that build alone. Linux/macOS only (resource module).
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+WRITERS = ("python-pptx", "streaming")
+CONTENT = "\n".join(f"- Bullet point {i} with a realistic amount of text for a training slide." for i in range(5))
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KiB on Linux
+
+
+def run_one(writer: str, num_slides: int, template: str) -> dict:
+    """Builds one deck in this process and reports its peak RSS."""
+    from app import pptx_utils, template_index
+    from app.pptx_stream_writer import build_and_save_presentation_streaming
+
+    template_path = Path(template) if template else None
+    slides = [(f"Slide {i + 1}", CONTENT) for i in range(num_slides)]
+    baseline_mb = _peak_rss_mb()
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = Path(tmp) / "deck.pptx"
+        if writer == "streaming":
+            layout_idx, placeholder_map = template_index.slide_mapping(template_path)
+            build_and_save_presentation_streaming(template_path, layout_idx, slides, output_path, {i: placeholder_map for i in range(num_slides)})
+        else:
+            pptx_utils.settings.PPTX_WRITER = "python-pptx"
+            pptx_utils.build_and_save_presentation(template_path, None, slides, output_path)
+        size_kb = output_path.stat().st_size / 1024
+    return {
+        "writer": writer,
+        "slides": num_slides,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "baseline_rss_mb": round(baseline_mb, 1),
+        "seconds": round(time.perf_counter() - started, 3),
+        "output_kb": round(size_kb, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slides", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+    parser.add_argument("--template", default="", help="Template .pptx (default: python-pptx's blank template)")
+    parser.add_argument("--one", nargs=2, metavar=("WRITER", "SLIDES"), help=argparse.SUPPRESS) # Subprocess mode
+    args = parser.parse_args()
+
+    if args.one:
+        print(json.dumps(run_one(args.one[0], int(args.one[1]), args.template)))
+        return
+
+    print(f"{'writer':<12} {'slides':>6} {'peak RSS MB':>12} {'over baseline':>14} {'seconds':>8} {'output KB':>10}")
+    for num_slides in args.slides:
+        for writer in WRITERS:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.pptx_writer_memory", "--one", writer, str(num_slides), "--template", args.template],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{result['writer']:<12} {result['slides']:>6} {result['peak_rss_mb']:>12} "
+                f"{round(result['peak_rss_mb'] - result['baseline_rss_mb'], 1):>14} {result['seconds']:>8} {result['output_kb']:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
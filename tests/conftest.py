@@ -0,0 +1,12 @@
+# tests/conftest.py
+import pytest
+
+from app import job_queue
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    """A fresh job queue in a temporary database, installed as the app's queue."""
+    test_queue = job_queue.JobQueue(tmp_path / "jobs.db")
+    monkeypatch.setattr(job_queue, "job_queue", test_queue)
+    return test_queue
@@ -0,0 +1,164 @@
+# tests/test_circuit_breaker.py
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app import circuit_breaker, llm_integrations
+from app.circuit_breaker import CircuitBreaker
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = _Clock()
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=fake_clock)) # The breaker's clock only
+    return fake_clock
+
+
+def _open_breaker(clock) -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=30)
+    for _ in range(3):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == circuit_breaker.CLOSED
+
+    breaker.record_failure()
+
+    assert breaker.state == circuit_breaker.OPEN
+    assert breaker.is_open()
+    assert not breaker.allow_request()
+    assert breaker.snapshot()["times_opened"] == 1
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+def test_half_open_after_recovery_timeout_allows_one_trial(clock):
+    breaker = _open_breaker(clock)
+    clock.now += 31
+
+    assert not breaker.is_open()
+    assert breaker.allow_request()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    assert not breaker.allow_request() # Only one trial in flight
+    assert breaker.is_open()
+
+
+def test_half_open_trial_success_closes(clock):
+    breaker = _open_breaker(clock)
+    clock.now += 31
+    breaker.allow_request()
+
+    breaker.record_success()
+
+    assert breaker.state == circuit_breaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_half_open_trial_failure_reopens(clock):
+    breaker = _open_breaker(clock)
+    clock.now += 31
+    breaker.allow_request()
+
+    breaker.record_failure()
+
+    assert breaker.state == circuit_breaker.OPEN
+    assert not breaker.allow_request()
+    assert breaker.snapshot()["retry_in_seconds"] == 30
+
+
+def test_cancelled_trial_frees_the_slot_without_an_outcome(clock):
+    breaker = _open_breaker(clock)
+    clock.now += 31
+    breaker.allow_request()
+
+    breaker.record_cancelled()
+
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    assert breaker.allow_request() # Another trial may go
+
+
+def _status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://provider.test")
+    return httpx.HTTPStatusError(str(status_code), request=request, response=httpx.Response(status_code, request=request))
+
+
+@pytest.mark.parametrize("error, fails_over", [
+    (_status_error(400), False),
+    (_status_error(401), False),
+    (_status_error(403), False),
+    (_status_error(408), True),
+    (_status_error(429), True),
+    (_status_error(503), True),
+    (httpx.ConnectTimeout("timeout"), True),
+    (circuit_breaker.CircuitOpenError("open"), True),
+    (ValueError("malformed SSE chunk"), True),
+    (llm_integrations.UnknownProviderError("nope"), False),
+])
+def test_failover_only_on_provider_side_errors(monkeypatch, error, fails_over):
+    calls = []
+
+    async def _generate_on_provider(llm_name, *args):
+        calls.append(llm_name)
+        if llm_name == "primary":
+            raise error
+        return "fallback content"
+
+    monkeypatch.setattr(llm_integrations, "_generate_on_provider", _generate_on_provider)
+    monkeypatch.setattr(llm_integrations, "_failover_candidates", lambda failed_llm, task_type: ["backup"])
+
+    if fails_over:
+        assert asyncio.run(llm_integrations.generate_with_llm("primary", "prompt", 10)) == "fallback content"
+        assert calls == ["primary", "backup"]
+    else:
+        with pytest.raises(type(error)):
+            asyncio.run(llm_integrations.generate_with_llm("primary", "prompt", 10))
+        assert calls == ["primary"]
+
+
+class _FailingProvider(llm_integrations.BaseLLMAPI):
+    def __init__(self, status_code: int, breaker: CircuitBreaker):
+        super().__init__("key", "http://provider.test", "test-model")
+        self.status_code = status_code
+        self.rate_limiter = llm_integrations.ProviderRateLimiter(600, 60000, 8)
+        self.circuit_breaker = breaker
+
+    async def generate_text(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> str:
+        raise _status_error(self.status_code)
+
+
+@pytest.mark.parametrize("status_code, state", [(400, circuit_breaker.HALF_OPEN), (503, circuit_breaker.OPEN)])
+def test_bad_requests_are_not_held_against_the_provider(monkeypatch, clock, status_code, state):
+    monkeypatch.setattr(llm_integrations.settings, "LLM_MOCK_RESPONSES", True) # generate_text, not SSE
+    breaker = _open_breaker(clock)
+    clock.now += 31
+    provider = _FailingProvider(status_code, breaker)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(llm_integrations._generate_with_retries(
+            provider, "test", "prompt", max_tokens=10, temperature=0.7, retry_attempts=0, backoff_factor=0
+        ))
+
+    assert breaker.state == state
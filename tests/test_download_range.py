@@ -0,0 +1,110 @@
+# tests/test_download_range.py
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import deck_output, main
+
+DECK_BYTES = bytes(range(256)) * 4 # 1024 bytes
+FILENAME = "deck_ppt_job_test.pptx"
+
+
+@pytest.fixture(params=["disk", "memory"])
+def client(request, tmp_path, monkeypatch):
+    """Client whose /download serves DECK_BYTES as FILENAME, from disk or from the in-memory result store."""
+    monkeypatch.setattr(main.settings, "GENERATED_PPTS_DIR", tmp_path)
+    results = deck_output.DeckResultStore(max_total_bytes=1024 * 1024, download_ttl=60, max_age=3600)
+    monkeypatch.setattr(deck_output, "deck_results", results)
+    if request.param == "disk":
+        (tmp_path / FILENAME).write_bytes(DECK_BYTES)
+    else:
+        assert results.put(FILENAME, io.BytesIO(DECK_BYTES))
+    return TestClient(main.app)
+
+
+def _download(client, **headers):
+    return client.get(f"/download/{FILENAME}", headers=headers)
+
+
+def test_full_download(client):
+    response = _download(client)
+
+    assert response.status_code == 200
+    assert response.content == DECK_BYTES
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(DECK_BYTES))
+    assert response.headers["etag"]
+
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=10-19", 10, 19),
+    ("bytes=1000-", 1000, 1023),
+    ("bytes=-24", 1000, 1023),
+    ("bytes=1000-5000", 1000, 1023), # End past the deck is clamped
+])
+def test_range_returns_partial_content(client, range_header, start, end):
+    response = _download(client, range=range_header)
+
+    assert response.status_code == 206
+    assert response.content == DECK_BYTES[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(DECK_BYTES)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+
+
+@pytest.mark.parametrize("range_header", ["bytes=1024-", "bytes=2000-3000", "bytes=-0"])
+def test_unsatisfiable_range_returns_416(client, range_header):
+    response = _download(client, range=range_header)
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(DECK_BYTES)}"
+
+
+@pytest.mark.parametrize("range_header", ["bytes=0-9,20-29", "items=0-9", "bytes=-"])
+def test_unsupported_range_sends_the_whole_deck(client, range_header):
+    response = _download(client, range=range_header)
+
+    assert response.status_code == 200
+    assert response.content == DECK_BYTES
+
+
+def test_whole_deck_range_is_a_plain_200(client):
+    response = _download(client, range="bytes=0-")
+
+    assert response.status_code == 200
+    assert "content-range" not in response.headers
+
+
+def test_if_none_match_returns_304(client):
+    etag = _download(client).headers["etag"]
+
+    response = _download(client, **{"if-none-match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_resume_with_matching_if_range(client):
+    etag = _download(client, range="bytes=0-99").headers["etag"]
+
+    response = _download(client, range="bytes=100-", **{"if-range": etag})
+
+    assert response.status_code == 206
+    assert response.content == DECK_BYTES[100:]
+
+
+def test_stale_if_range_sends_the_whole_deck(client):
+    response = _download(client, range="bytes=100-", **{"if-range": '"stale"'})
+
+    assert response.status_code == 200
+    assert response.content == DECK_BYTES
+
+
+def test_repeated_downloads_keep_the_deck(client):
+    for _ in range(3):
+        assert _download(client, range="bytes=0-9").status_code == 206
+    assert _download(client).content == DECK_BYTES
+
+
+def test_unknown_deck_is_404(client):
+    assert client.get("/download/missing.pptx").status_code == 404
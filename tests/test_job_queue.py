@@ -0,0 +1,206 @@
+# tests/test_job_queue.py
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import job_queue, main
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app) # No startup: the worker pool stays off, jobs stay where the test puts them
+
+
+@pytest.mark.parametrize("status", [job_queue.QUEUED, job_queue.PROCESSING, job_queue.FAILED])
+def test_status_of_unfinished_job(queue, client, status):
+    asyncio.run(queue.enqueue("job_1", "presentation", {}, progress={"message": "Queued for generation..."}))
+    if status != job_queue.QUEUED:
+        asyncio.run(queue.claim("worker"))
+    if status == job_queue.FAILED:
+        asyncio.run(queue.fail("job_1", "worker", "Template could not be loaded.", retry=False))
+
+    response = client.get("/status/job_1")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == status
+    assert body["download_url"] is None
+    if status == job_queue.FAILED:
+        assert body["error_detail"] == "Template could not be loaded."
+
+
+def test_status_of_completed_job(queue, client):
+    asyncio.run(queue.enqueue("job_1", "presentation", {}))
+    asyncio.run(queue.claim("worker"))
+    asyncio.run(queue.complete("job_1", "worker", {"status": job_queue.COMPLETED, "filename": "deck.pptx"}))
+
+    response = client.get("/status/job_1")
+
+    assert response.status_code == 200
+    assert response.json()["download_url"] == "/download/deck.pptx"
+
+
+def test_status_of_unknown_job(queue, client):
+    assert client.get("/status/missing").status_code == 404
+
+
+def test_pinned_job_waits_for_its_process(queue, monkeypatch):
+    monkeypatch.setattr(job_queue.settings, "JOB_AFFINITY_WAIT_SECONDS", 0.2)
+    asyncio.run(queue.enqueue("job_1", "presentation", {}, affinity="app-1"))
+
+    assert asyncio.run(queue.claim("other:0", affinity="app-2")) is None
+    assert asyncio.run(queue.claim("app-1:0", affinity="app-1"))["job_id"] == "job_1"
+
+
+def test_pinned_job_opens_up_after_the_affinity_wait(queue, monkeypatch):
+    monkeypatch.setattr(job_queue.settings, "JOB_AFFINITY_WAIT_SECONDS", 0.2)
+    asyncio.run(queue.enqueue("job_1", "presentation", {}, affinity="app-1"))
+    time.sleep(0.3)
+
+    assert asyncio.run(queue.claim("other:0", affinity="app-2"))["job_id"] == "job_1"
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_claim_leases_the_job_to_one_worker(queue):
+    _run(queue.enqueue("job_1", "presentation", {"n": 1}))
+
+    job = _run(queue.claim("worker_a"))
+
+    assert job["job_id"] == "job_1"
+    assert job["payload"] == {"n": 1}
+    assert job["attempts"] == 1
+    assert _run(queue.claim("worker_b")) is None
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue, monkeypatch):
+    monkeypatch.setattr(job_queue.settings, "JOB_VISIBILITY_TIMEOUT_SECONDS", 0.1)
+    _run(queue.enqueue("job_1", "presentation", {}))
+    _run(queue.claim("worker_a"))
+    time.sleep(0.2) # worker_a died: no heartbeat
+
+    job = _run(queue.claim("worker_b"))
+
+    assert job["job_id"] == "job_1"
+    assert job["attempts"] == 2
+    # The old owner can no longer touch the job
+    assert not _run(queue.heartbeat("job_1", "worker_a"))
+    _run(queue.complete("job_1", "worker_a", {"status": job_queue.COMPLETED}))
+    row = _run(queue.get("job_1"))
+    assert row["status"] == job_queue.PROCESSING
+    assert row["lease_owner"] == "worker_b"
+
+
+def test_heartbeat_extends_the_lease(queue, monkeypatch):
+    monkeypatch.setattr(job_queue.settings, "JOB_VISIBILITY_TIMEOUT_SECONDS", 0.2)
+    _run(queue.enqueue("job_1", "presentation", {}))
+    _run(queue.claim("worker_a"))
+
+    for _ in range(3):
+        time.sleep(0.1)
+        assert _run(queue.heartbeat("job_1", "worker_a", {"message": "working"}))
+
+    assert _run(queue.claim("worker_b")) is None
+    assert _run(queue.get("job_1"))["progress"] == {"message": "working"}
+
+
+def test_lease_expiring_after_the_last_attempt_fails_the_job(queue, monkeypatch):
+    monkeypatch.setattr(job_queue.settings, "JOB_VISIBILITY_TIMEOUT_SECONDS", 0.1)
+    _run(queue.enqueue("job_1", "presentation", {}, max_attempts=1))
+    _run(queue.claim("worker_a"))
+    time.sleep(0.2)
+
+    assert _run(queue.claim("worker_b")) is None
+
+    row = _run(queue.get("job_1"))
+    assert row["status"] == job_queue.FAILED
+    assert row["error"] == "Lease expired too many times."
+
+
+def test_failed_job_is_retried_after_the_delay(queue):
+    _run(queue.enqueue("job_1", "presentation", {}, max_attempts=2))
+    _run(queue.claim("worker_a"))
+
+    assert _run(queue.fail("job_1", "worker_a", "Provider timed out.", retry_delay=0.2))
+    assert _run(queue.claim("worker_a")) is None
+    time.sleep(0.3)
+    job = _run(queue.claim("worker_a"))
+    assert job["attempts"] == 2
+
+    assert not _run(queue.fail("job_1", "worker_a", "Provider timed out."))
+    assert _run(queue.get("job_1"))["status"] == job_queue.FAILED
+
+
+def test_released_job_keeps_its_attempt(queue):
+    _run(queue.enqueue("job_1", "presentation", {}))
+    _run(queue.claim("worker_a"))
+
+    _run(queue.release("job_1", "worker_a", {"message": "Interrupted"}))
+
+    job = _run(queue.claim("worker_b"))
+    assert job["attempts"] == 1
+    assert job["progress"] == {"message": "Interrupted"}
+
+
+def test_enqueue_enforces_the_per_client_limit(queue):
+    _run(queue.enqueue("job_1", "presentation", {}, client_id="client", max_per_client=1))
+
+    with pytest.raises(job_queue.QueueLimitReached) as excinfo:
+        _run(queue.enqueue("job_2", "presentation", {}, client_id="client", max_per_client=1))
+
+    assert excinfo.value.per_client
+    assert _run(queue.get("job_2")) is None
+
+
+async def _execute_once(queue, handler, max_attempts: int = 3):
+    await queue.enqueue("job_1", "presentation", {}, max_attempts=max_attempts)
+    pool = job_queue.JobWorkerPool(queue, {"presentation": handler}, concurrency=1)
+    await pool._execute("worker_a", await queue.claim("worker_a"))
+    return await queue.get("job_1")
+
+
+def test_worker_retries_transient_failures(queue, monkeypatch):
+    monkeypatch.setattr(job_queue.settings, "JOB_RETRY_BACKOFF_SECONDS", 0)
+
+    async def _handler(job_id, payload, job_store):
+        raise ConnectionError("Provider unreachable.")
+
+    row = _run(_execute_once(queue, _handler))
+    assert row["status"] == job_queue.QUEUED
+    assert row["error"] == "Provider unreachable."
+
+
+@pytest.mark.parametrize("failure", ["raise", "state"])
+def test_worker_fails_permanent_errors_without_retrying(queue, failure):
+    async def _handler(job_id, payload, job_store):
+        if failure == "raise":
+            raise job_queue.PermanentJobError("Template could not be loaded.")
+        job_store[job_id] = {"status": job_queue.FAILED, "error_detail": "Template could not be loaded.", "retryable": False}
+
+    row = _run(_execute_once(queue, _handler))
+    assert row["status"] == job_queue.FAILED
+    assert row["attempts"] == 1
+
+
+def test_worker_cancels_the_handler_when_the_lease_is_lost(queue, monkeypatch):
+    monkeypatch.setattr(job_queue.settings, "JOB_HEARTBEAT_INTERVAL_SECONDS", 0.05)
+    cancelled = []
+
+    async def _handler(job_id, payload, job_store):
+        # Another worker took the job over meanwhile
+        await asyncio.to_thread(lambda: queue._connection().execute("UPDATE jobs SET lease_owner = 'worker_b' WHERE job_id = ?", (job_id,)))
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(job_id)
+            raise
+        job_store[job_id] = {"status": job_queue.COMPLETED}
+
+    row = _run(_execute_once(queue, _handler))
+    assert cancelled == ["job_1"]
+    assert row["status"] == job_queue.PROCESSING # Left to its new owner
+    assert row["lease_owner"] == "worker_b"
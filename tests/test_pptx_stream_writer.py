@@ -0,0 +1,139 @@
+# tests/test_pptx_stream_writer.py
+import io
+
+import pytest
+from pptx import Presentation
+
+from app.pptx_stream_writer import StreamingDeckWriter, build_and_save_presentation_streaming
+
+SLIDES = [
+    ("Introduction", "First point\nSecond point"),
+    ("Details", "Line one\n\nLine three"),
+    ("Summary & Next Steps", "Use <tags> & \"quotes\""),
+]
+TITLE_AND_CONTENT = 1 # Layouts of python-pptx's default template
+TITLE_ONLY = 5
+
+
+def _body_lines(slide):
+    return [p.text for p in slide.placeholders[1].text_frame.paragraphs]
+
+
+def test_stream_written_deck_round_trips(tmp_path):
+    output_path = tmp_path / "deck.pptx"
+
+    build_and_save_presentation_streaming(None, TITLE_AND_CONTENT, SLIDES, output_path)
+
+    presentation = Presentation(output_path)
+    assert len(presentation.slides) == len(SLIDES)
+    for slide, (title, content) in zip(presentation.slides, SLIDES):
+        assert slide.slide_layout.name == "Title and Content"
+        assert slide.shapes.title.text == title
+        assert _body_lines(slide) == content.split("\n")
+
+
+def test_round_tripped_deck_can_be_edited_and_saved_again(tmp_path):
+    output_path = tmp_path / "deck.pptx"
+    build_and_save_presentation_streaming(None, TITLE_AND_CONTENT, SLIDES[:1], output_path)
+
+    presentation = Presentation(output_path)
+    presentation.slides.add_slide(presentation.slide_layouts[TITLE_AND_CONTENT]).shapes.title.text = "Added later"
+    presentation.save(output_path)
+
+    titles = [slide.shapes.title.text for slide in Presentation(output_path).slides]
+    assert titles == ["Introduction", "Added later"]
+
+
+def test_writes_to_a_binary_buffer():
+    buffer = io.BytesIO()
+
+    with StreamingDeckWriter(None, buffer, TITLE_AND_CONTENT) as writer:
+        for title, content in SLIDES:
+            writer.add_slide(title, content)
+
+    assert not buffer.closed
+    buffer.seek(0)
+    assert [slide.shapes.title.text for slide in Presentation(buffer).slides] == [title for title, _ in SLIDES]
+
+
+def test_keeps_slides_already_in_the_template(tmp_path):
+    template_path = tmp_path / "template.pptx"
+    template = Presentation()
+    template.slides.add_slide(template.slide_layouts[0]).shapes.title.text = "Cover"
+    template.save(template_path)
+    output_path = tmp_path / "deck.pptx"
+
+    build_and_save_presentation_streaming(template_path, TITLE_AND_CONTENT, SLIDES, output_path)
+
+    titles = [slide.shapes.title.text for slide in Presentation(output_path).slides]
+    assert titles == ["Cover"] + [title for title, _ in SLIDES]
+
+
+def test_layout_without_body_gets_a_text_box(tmp_path):
+    output_path = tmp_path / "deck.pptx"
+
+    build_and_save_presentation_streaming(None, TITLE_ONLY, SLIDES[:1], output_path)
+
+    slide = Presentation(output_path).slides[0]
+    assert slide.shapes.title.text == "Introduction"
+    text_boxes = [shape for shape in slide.shapes if not shape.is_placeholder]
+    assert [box.text_frame.text for box in text_boxes] == ["First point\nSecond point"]
+
+
+def test_placeholder_map_and_out_of_range_layout(tmp_path):
+    output_path = tmp_path / "deck.pptx"
+
+    build_and_save_presentation_streaming(
+        None, 99, [("Cover title", "Cover subtitle")], output_path, placeholder_maps={0: {"title": 0, "content": 1}}
+    )
+
+    slide = Presentation(output_path).slides[0]
+    assert slide.slide_layout.name == "Title Slide" # Falls back to layout 0, like the in-memory builder
+    assert slide.shapes.title.text == "Cover title"
+    assert _body_lines(slide) == ["Cover subtitle"]
+
+
+def test_strips_characters_xml_does_not_allow(tmp_path):
+    output_path = tmp_path / "deck.pptx"
+
+    build_and_save_presentation_streaming(None, TITLE_AND_CONTENT, [("Bell\x07 title", "Form\x0cfeed")], output_path)
+
+    slide = Presentation(output_path).slides[0]
+    assert slide.shapes.title.text == "Bell title"
+    assert _body_lines(slide) == ["Formfeed"]
+
+
+def test_progress_callback_reports_each_slide(tmp_path):
+    calls = []
+
+    build_and_save_presentation_streaming(
+        None, TITLE_AND_CONTENT, SLIDES, tmp_path / "deck.pptx", progress_callback=lambda *args: calls.append(args)
+    )
+
+    assert calls == [(i + 1, len(SLIDES), title) for i, (title, _) in enumerate(SLIDES)]
+
+
+def test_error_while_writing_removes_the_partial_file(tmp_path):
+    output_path = tmp_path / "deck.pptx"
+
+    with pytest.raises(RuntimeError):
+        with StreamingDeckWriter(None, output_path, TITLE_AND_CONTENT) as writer:
+            writer.add_slide(*SLIDES[0])
+            raise RuntimeError("generation failed")
+
+    assert not output_path.exists()
+
+
+def test_template_without_layouts_is_rejected(tmp_path):
+    template_path = tmp_path / "template.pptx"
+    template = Presentation()
+    layouts = template.slide_master.slide_layouts
+    for layout in list(layouts):
+        layouts.remove(layout)
+    template.save(template_path)
+    output_path = tmp_path / "deck.pptx"
+
+    with pytest.raises(ValueError, match="no slide layouts"):
+        StreamingDeckWriter(template_path, output_path, 0)
+
+    assert not output_path.exists()
@@ -0,0 +1,148 @@
+# tests/test_rate_limiter.py
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from app import llm_integrations
+from app.circuit_breaker import CircuitBreaker
+from app.rate_limiter import ProviderRateLimiter, TokenBucket, parse_retry_after
+
+
+def _limiter(**overrides) -> ProviderRateLimiter:
+    options = {"requests_per_minute": 600, "tokens_per_minute": 60000, "max_concurrency": 8, "min_fraction": 0.1, "recovery_step": 0.25}
+    return ProviderRateLimiter(**{**options, **overrides})
+
+
+def test_rate_limited_halves_limits_and_drains_buckets():
+    limiter = _limiter()
+
+    limiter.on_rate_limited()
+
+    stats = limiter.stats()
+    assert stats["multiplier"] == 0.5
+    assert stats["requests_per_minute"] == 300
+    assert stats["tokens_per_minute"] == 30000
+    assert stats["max_concurrency"] == 4
+    assert limiter._request_bucket.delay_for(1) > 0 # Next request waits for a refill
+
+
+def test_limits_never_shrink_below_min_fraction():
+    limiter = _limiter()
+    for _ in range(10):
+        limiter.on_rate_limited()
+    assert limiter.multiplier == 0.1
+    assert limiter.max_concurrency == 1
+
+
+def test_successes_recover_limits_additively():
+    limiter = _limiter()
+    limiter.on_rate_limited()
+    limiter.on_rate_limited() # 0.25
+
+    limiter.on_success()
+    assert limiter.multiplier == 0.5
+    for _ in range(5):
+        limiter.on_success()
+    assert limiter.multiplier == 1.0
+    assert limiter.stats()["requests_per_minute"] == 600
+
+
+def test_retry_after_pauses_every_caller():
+    limiter = _limiter()
+    limiter.on_rate_limited(retry_after=0.3)
+
+    async def _acquire() -> float:
+        started_at = time.monotonic()
+        async with limiter.slot(10):
+            return time.monotonic() - started_at
+
+    assert asyncio.run(_acquire()) >= 0.3
+
+
+def test_token_bucket_caps_oversized_requests_at_capacity():
+    bucket = TokenBucket(60)
+    bucket.consume(60)
+    # A request larger than a minute's worth waits for a full bucket, not forever
+    assert bucket.delay_for(1000) == pytest.approx(60.0, rel=0.01)
+
+
+@pytest.mark.parametrize("value, expected", [("7", 7.0), ("-3", 0.0), (None, None), ("soon", None)])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert parse_retry_after(format_datetime(retry_at, usegmt=True)) == pytest.approx(30, abs=2)
+
+
+class _RateLimitedProvider(llm_integrations.BaseLLMAPI):
+    """Answers 429 (with the given Retry-After) `failures` times, then succeeds."""
+    def __init__(self, failures: int, retry_after=None):
+        super().__init__("key", "http://provider.test", "test-model")
+        self.failures = failures
+        self.retry_after = retry_after
+        self.calls = 0
+        self.rate_limiter = _limiter()
+        self.circuit_breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=60)
+
+    async def generate_text(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> str:
+        self.calls += 1
+        if self.calls <= self.failures:
+            request = httpx.Request("POST", self.base_url)
+            headers = {"Retry-After": self.retry_after} if self.retry_after else {}
+            response = httpx.Response(429, headers=headers, request=request)
+            raise httpx.HTTPStatusError("429 Too Many Requests", request=request, response=response)
+        return "content"
+
+
+def _generate(provider: _RateLimitedProvider, backoff_factor: float = 0.1) -> str:
+    return asyncio.run(llm_integrations._generate_with_retries(
+        provider, "test", "prompt", max_tokens=10, temperature=0.7, retry_attempts=0, backoff_factor=backoff_factor
+    ))
+
+
+def test_429_without_retry_after_backs_off_exponentially(monkeypatch):
+    monkeypatch.setattr(llm_integrations.settings, "LLM_MOCK_RESPONSES", True) # generate_text, not SSE
+    provider = _RateLimitedProvider(failures=2)
+
+    started_at = time.monotonic()
+    assert _generate(provider) == "content"
+
+    assert provider.calls == 3
+    assert time.monotonic() - started_at >= 0.1 + 0.2 # backoff_factor * 1, then * 2
+    assert provider.rate_limiter.rate_limited_count == 2
+    assert provider.circuit_breaker.state == "closed" # A 429 means the provider is up
+
+
+def test_429_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(llm_integrations.settings, "LLM_MOCK_RESPONSES", True)
+    provider = _RateLimitedProvider(failures=1, retry_after="0.4")
+
+    started_at = time.monotonic()
+    assert _generate(provider, backoff_factor=0.01) == "content"
+    assert time.monotonic() - started_at >= 0.4
+
+
+def test_429_retries_are_bounded(monkeypatch):
+    monkeypatch.setattr(llm_integrations.settings, "LLM_MOCK_RESPONSES", True)
+    monkeypatch.setattr(llm_integrations.settings, "LLM_RATE_LIMIT_MAX_RETRIES", 1)
+    provider = _RateLimitedProvider(failures=5)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _generate(provider, backoff_factor=0.01)
+    assert provider.calls == 2
+
+
+def test_limits_recover_after_429s(monkeypatch):
+    monkeypatch.setattr(llm_integrations.settings, "LLM_MOCK_RESPONSES", True)
+    provider = _RateLimitedProvider(failures=1)
+
+    _generate(provider, backoff_factor=0.01)
+
+    # Halved by the 429, then one recovery step from the success
+    assert provider.rate_limiter.multiplier == 0.75